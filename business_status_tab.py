@@ -3,13 +3,12 @@
 import sys
 import os
 import re
-import shutil
 import json
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel,
                                QLineEdit, QPushButton, QMessageBox, QFileDialog, QGroupBox, QScrollArea,
                                QTableWidget, QTableWidgetItem, QHeaderView, QComboBox, QInputDialog,
-                               QDialog, QDialogButtonBox, QApplication, QCheckBox)
-from PySide6.QtCore import QThread, Signal, Qt, QRect
+                               QDialog, QDialogButtonBox, QApplication, QCheckBox, QTextEdit)
+from PySide6.QtCore import Qt, QRect, QTimer
 from PySide6.QtGui import QPixmap, QImage, QColor
 from PIL import Image
 from PySide6.QtGui import QFont
@@ -19,8 +18,13 @@ import fitz  # PyMuPDF
 import ocr_logic
 import config
 import ocr_utils
+import trace_log
+import save_queue
+import change_journal
+import roi_templates
 from ui_widgets import ImageLabel, ZoomableScrollArea
-from workers import RoiOcrWorker, ColorUpdateWorker
+from workers import (LOOKUP_CANCELLED, RoiOcrWorker, RecolorPlanWorker, RecolorApplyWorker, CompanyLookupWorker, YearEndMaintenanceWorker,
+                     CrossDbReportWorker, SaveQueueWorker, ChangeRollbackWorker, TemplateAlignWorker)
 from PySide6.QtGui import QTransform
 
 
@@ -71,14 +75,6 @@ class ManualInputDialog(QDialog):
     def get_data(self): return self.name_edit.text().strip(), self.region_combo.currentText()
 
 
-class CreditColorUpdateWorker(QThread):
-    finished = Signal(str)
-
-    def __init__(self, excel_path): super().__init__(); self.excel_path = excel_path
-
-    def run(self): self.finished.emit(ocr_logic.batch_update_credit_rating_colors(self.excel_path))
-
-
 # --- 헬퍼 함수 ---
 
 def parse_page_ranges(range_string, max_page):
@@ -102,7 +98,7 @@ def parse_page_ranges(range_string, max_page):
 # --- BusinessStatusTab 클래스 ---
 
 class BusinessStatusTab(QWidget):
-    def __init__(self, reader):
+    def __init__(self, reader=None):
         super().__init__()
         self.reader = reader
         self.original_pixmap = None
@@ -112,12 +108,21 @@ class BusinessStatusTab(QWidget):
         self.current_company_name = None
         self.current_before_data = None
         self.excel_paths = {"전기": "", "통신": "", "소방": ""}
+        self.pending_documents = []  # '대기열에 추가'로 모아 둔 문서 목록 (일괄 저장 때 write_behind로 넘김)
+        self.write_behind = save_queue.WriteBehindQueue()  # 백그라운드 저장 대기열 (저널로 비정상 종료 후에도 유지)
+        self.save_worker = None
+        self.compare_worker = None  # '2. 원본 데이터 비교' 조회 작업
+        self.compare_request = None  # (DB 경로, 사업자번호) - 결과가 아직 유효한지 확인용
+        self.compared_request = None  # current_before_data를 조회한 (DB 경로, 사업자번호)
+        self.template_worker = None  # 영역 템플릿 자동 정렬 작업
+        self.pending_template_ocr = False  # 템플릿을 적용했지만 OCR 모델이 아직 준비되지 않은 경우
         self.pdf_pages = []
         self.current_page_index = 0
         self.setup_ui()
         self.connect_signals()
         self.load_excel_paths()
-        print("BusinessStatusTab 객체 생성 완료")
+        self.resume_write_behind()
+        trace_log.debug("BusinessStatusTab 객체 생성 완료")
 
     def setup_ui(self):
         main_layout = QHBoxLayout(self)
@@ -235,6 +240,10 @@ class BusinessStatusTab(QWidget):
         self.excel_path_config_button = QPushButton("🔧 DB 경로 설정");
         self.color_update_button = QPushButton("🎨 연말 색상 업데이트");
         self.credit_color_update_button = QPushButton("✨ 신용평가 유효기간 갱신")
+        self.year_end_button = QPushButton("🗓️ 연말 통합 정리 (전체 DB)")
+        self.cross_db_button = QPushButton("🔗 DB 간 중복 업체 비교 (전체 DB)")
+        self.undo_button = QPushButton("↩️ 마지막 저장 되돌리기");
+        self.rollback_button = QPushButton("⏪ 일괄 작업 되돌리기")
         excel_layout.addWidget(QLabel("자료 종류:"), 0, 0);
         excel_layout.addWidget(self.file_type_combo, 0, 1, 1, 2)
         excel_layout.addWidget(QLabel("DB 경로:"), 1, 0);
@@ -242,6 +251,12 @@ class BusinessStatusTab(QWidget):
         excel_layout.addWidget(self.excel_path_config_button, 1, 2)
         excel_layout.addWidget(self.color_update_button, 2, 0, 1, 3);
         excel_layout.addWidget(self.credit_color_update_button, 3, 0, 1, 3)
+        excel_layout.addWidget(self.year_end_button, 4, 0, 1, 3)
+        excel_layout.addWidget(self.cross_db_button, 5, 0, 1, 3)
+        undo_layout = QHBoxLayout();
+        undo_layout.addWidget(self.undo_button);
+        undo_layout.addWidget(self.rollback_button)
+        excel_layout.addLayout(undo_layout, 6, 0, 1, 3)
 
         # 3. 데이터 영역 지정
         roi_box = QGroupBox("3. 데이터 영역 지정");
@@ -253,6 +268,15 @@ class BusinessStatusTab(QWidget):
             roi_layout.addWidget(btn, row, 1);
             roi_layout.addWidget(entry, row, 2)
             self.fields_to_extract[field].update({"roi": None, "entry": entry, "button": btn})
+        # 자료 종류별 영역 템플릿 (같은 양식의 새 문서를 열면 자동으로 정렬해 적용)
+        template_layout = QHBoxLayout()
+        self.template_label = QLabel("템플릿: -")
+        self.template_save_button = QPushButton("💾 템플릿 저장");
+        self.template_apply_button = QPushButton("📐 템플릿 적용")
+        template_layout.addWidget(self.template_label, 1);
+        template_layout.addWidget(self.template_save_button);
+        template_layout.addWidget(self.template_apply_button)
+        roi_layout.addLayout(template_layout, len(self.fields_to_extract), 0, 1, 3)
 
         # 4. 처리 완료 파일 보관 경로 (self.archive_box로 변경)
         self.archive_box = QGroupBox("4. 처리 완료 파일 보관 경로");
@@ -276,10 +300,33 @@ class BusinessStatusTab(QWidget):
         self.save_button = QPushButton("3. 확정 및 엑셀 저장");
         self.save_button.setEnabled(False);
         self.save_button.setStyleSheet("font-weight: bold; background-color: #C0392B; color: white;")
+
+        # 여러 문서를 확정해 두었다가 DB 파일별로 한 번에 저장하는 대기열
+        queue_layout = QHBoxLayout()
+        self.queue_add_button = QPushButton("➕ 대기열에 추가");
+        self.queue_flush_button = QPushButton("💾 대기열 일괄 저장 (0건)");
+        self.queue_flush_button.setEnabled(False)
+        queue_layout.addWidget(self.queue_add_button);
+        queue_layout.addWidget(self.queue_flush_button)
+
         action_layout.addWidget(self.run_ocr_button);
         action_layout.addWidget(self.compare_button)
         action_layout.addWidget(self.data_only_checkbox)  # 체크박스 추가
         action_layout.addWidget(self.save_button)
+        action_layout.addLayout(queue_layout)
+
+        # 백그라운드 저장 상태 (저장 대기/실패 건수와 결과 로그)
+        status_layout = QHBoxLayout()
+        self.save_status_label = QLabel("저장 대기 0건")
+        self.retry_failed_button = QPushButton("🔁 실패 항목 다시 저장");
+        self.retry_failed_button.setEnabled(False)
+        status_layout.addWidget(self.save_status_label, 1);
+        status_layout.addWidget(self.retry_failed_button)
+        self.save_status_log = QTextEdit();
+        self.save_status_log.setReadOnly(True);
+        self.save_status_log.setMaximumHeight(90)
+        action_layout.addLayout(status_layout)
+        action_layout.addWidget(self.save_status_log)
 
         layout.addWidget(self.file_box);
         layout.addWidget(excel_box);
@@ -315,14 +362,30 @@ class BusinessStatusTab(QWidget):
         self.zoom_out_button.clicked.connect(lambda: self.zoom_image(0.8))
         self.zoom_fit_button.clicked.connect(self.fit_to_window)
         self.run_ocr_button.clicked.connect(self.run_roi_ocr)
+        self.set_reader(self.reader)
         self.compare_button.clicked.connect(self.compare_data)
         self.save_button.clicked.connect(self.save_data_to_excel)
+        # 비교 버튼을 연달아 눌러도 마지막 클릭 한 번만 조회하도록 디바운스
+        self.compare_timer = QTimer(self)
+        self.compare_timer.setSingleShot(True)
+        self.compare_timer.setInterval(300)
+        self.compare_timer.timeout.connect(self.start_compare_lookup)
+        self.fields_to_extract['사업자등록번호']['entry'].textChanged.connect(self.on_biz_no_changed)
+        self.queue_add_button.clicked.connect(self.queue_current_document)
+        self.queue_flush_button.clicked.connect(self.flush_pending_documents)
+        self.retry_failed_button.clicked.connect(self.retry_failed_saves)
         self.file_type_combo.currentTextChanged.connect(self.on_file_type_changed)
         self.color_update_button.clicked.connect(self.start_color_update)
         self.credit_color_update_button.clicked.connect(self.start_credit_color_update)
+        self.year_end_button.clicked.connect(self.start_year_end_maintenance)
+        self.cross_db_button.clicked.connect(self.start_cross_db_report)
+        self.undo_button.clicked.connect(self.undo_last_save)
+        self.rollback_button.clicked.connect(self.rollback_batch_run)
+        self.template_save_button.clicked.connect(self.save_roi_template)
+        self.template_apply_button.clicked.connect(lambda: self.start_template_align(manual=True))
 
     def open_file(self, file_path=None):
-        print("'PDF/이미지 열기' 버튼 클릭됨! 파일 선택창을 엽니다...")
+        trace_log.debug("'PDF/이미지 열기' 버튼 클릭됨! 파일 선택창을 엽니다...")
         if file_path is None:
             file_path, _ = QFileDialog.getOpenFileName(self, "파일 선택", "", "PDF 및 이미지 파일 (*.pdf *.png *.jpg *.jpeg)")
         if not file_path: return
@@ -369,6 +432,7 @@ class BusinessStatusTab(QWidget):
                 return
             self.display_page(0);
             self.fit_to_window()
+            self.start_template_align()
         except Exception as e:
             QMessageBox.critical(self, "파일 열기 오류", f"파일을 여는 중 오류가 발생했습니다:\n{e}")
 
@@ -464,14 +528,51 @@ class BusinessStatusTab(QWidget):
                         source_doc.close()
 
     def compare_data(self):
-        print(">>> 새 버전의 compare_data 함수 실행됨 <<<")  # <-- 진단용 메시지 추가
         excel_path = self.excel_file_path_entry.text()
         biz_no = self.fields_to_extract['사업자등록번호']['entry'].text().strip()
         if not (excel_path and biz_no):
             QMessageBox.warning(self, "오류", "업데이트할 DB(자료 종류)와 사업자등록번호가 모두 필요합니다.");
             return
+        self.compare_button.setText("조회 중...")
+        self.compare_timer.start()
+
+    def start_compare_lookup(self):
+        """DB 조회를 백그라운드 작업으로 시작합니다. 진행 중인 이전 조회는 취소합니다."""
+        excel_path = self.excel_file_path_entry.text()
+        biz_no = self.fields_to_extract['사업자등록번호']['entry'].text().strip()
+        if not (excel_path and biz_no):
+            self.compare_button.setText("2. 원본 데이터 비교")
+            return
+        if self.compare_worker:
+            self.compare_worker.cancel()
+
+        self.compare_request = (excel_path, biz_no.replace('-', ''))
+        # 저장 단계에서 같은 Workbook을 재사용하도록 캐시를 쓰는 일반 조회 사용
+        worker = CompanyLookupWorker({"DB": excel_path}, biz_no, streaming=False)
+        worker.finished.connect(
+            lambda data, message, elapsed, w=worker: self.on_compare_lookup_finished(w, data, message))
+        self.compare_worker = worker
+        worker.start()
+
+    def on_biz_no_changed(self, text):
+        """조회 중에 사업자번호가 바뀌면 진행 중인 조회는 더 이상 의미가 없으므로 취소합니다."""
+        if self.compare_worker and self.compare_request and text.strip().replace('-', '') != self.compare_request[1]:
+            self.compare_worker.cancel()
+
+    def on_compare_lookup_finished(self, worker, before_data, message):
+        if worker is not self.compare_worker:
+            return  # 이미 새 조회가 시작된 이전 요청의 결과
+        self.compare_worker = None
+        self.compare_button.setText("2. 원본 데이터 비교")
+        if message == LOOKUP_CANCELLED:
+            return  # 취소된 조회는 찾지 못한 것이 아니므로 신규 업체로 보지 않음
 
-        before_data, error = ocr_logic.find_company_data(excel_path, biz_no)
+        excel_path = self.excel_file_path_entry.text()
+        biz_no = self.fields_to_extract['사업자등록번호']['entry'].text().strip()
+        if self.compare_request != (excel_path, biz_no.replace('-', '')):
+            return  # 조회하는 동안 DB나 사업자번호가 바뀐 경우 결과를 버림
+        self.compared_request = self.compare_request
+        error = None if before_data else message  # 찾지 못했을 때 메시지가 있으면 조회 오류 (빈 문자열이면 신규 업체)
 
         # 1. 엑셀 파일 자체에 오류가 있는지 먼저 확인
         if error:
@@ -539,9 +640,7 @@ class BusinessStatusTab(QWidget):
                                          f"<b>[엑셀 업데이트]</b>\n- 대상 파일: {os.path.basename(excel_path)}\n\n데이터만 업데이트하시겠습니까?",
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
-                updated_log, error = ocr_logic.update_company_data(excel_path, biz_no, update_data, excel_key)
-                if error: QMessageBox.critical(self, "엑셀 업데이트 오류", error); return
-                QMessageBox.information(self, "작업 완료", "엑셀 업데이트를 완료했습니다.")
+                if not self.enqueue_save(self.current_company_name or biz_no, biz_no, update_data, excel_key): return
                 self.reset_ui_for_next_file()
                 self.save_button.setEnabled(False)
 
@@ -556,22 +655,17 @@ class BusinessStatusTab(QWidget):
             if file_type == "-- 자료 종류 선택 --":
                 QMessageBox.warning(self, "종류 선택 필요", "'자료 종류'를 먼저 선택해주세요.");
                 return
-            if not self.current_company_name or not self.current_before_data:
+            # 기존/신규 업체 여부는 '2. 원본 데이터 비교'(백그라운드 조회) 결과로 판단
+            # (화면 스레드에서 다시 조회하면 백그라운드 저장이 끝날 때까지 경로 잠금에 막혀 화면이 멈춤)
+            is_existing_company = self.compared_company_state(excel_path, biz_no)
+            if not self.current_company_name or is_existing_company is None:
                 QMessageBox.warning(self, "정보 오류", "'2. 원본 데이터 비교'를 먼저 실행하여 업체 정보를 확인해주세요.");
                 return
 
             # (이하 기존 최종 확인창 및 파일 보관 로직과 동일)
-            is_existing_company, _ = ocr_logic.find_company_data(excel_path, biz_no) if excel_path and os.path.exists(
-                excel_path) else (False, None)
             try:
-                region_info_dict = self.current_before_data.get('지역', {});
-                region_full_name = region_info_dict.get('value', '기타');
-                region_name = region_full_name.split(' ')[0] if region_full_name else '기타';
-                destination_folder = os.path.join(base_archive_path, region_name)
-                company_name_normalized = self.current_company_name.replace('㈜', '(주)');
-                sanitized_company_name = re.sub(r'[<>:"/\\|?*]', '', company_name_normalized).strip();
-                _, file_extension = os.path.splitext(source_file_path);
-                new_filename = f"{sanitized_company_name}_{file_type}{file_extension}"
+                destination_folder, new_filename = self.build_archive_target(file_type, source_file_path,
+                                                                             base_archive_path)
             except Exception as e:
                 QMessageBox.critical(self, "경로 생성 오류", f"파일 저장 경로를 만드는 중 오류가 발생했습니다:\n{e}"); return
             confirm_message = (
@@ -581,26 +675,141 @@ class BusinessStatusTab(QWidget):
                                          QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.No: return
 
-            if is_existing_company:
-                updated_log, error = ocr_logic.update_company_data(excel_path, biz_no, update_data, excel_key)
-                if error: QMessageBox.critical(self, "엑셀 업데이트 오류", error); return
-                self.archive_file(destination_folder, new_filename)
-            else:
-                QMessageBox.information(self, "파일 보관 실행", "신규 업체로 인식되어 파일 보관만 실행합니다.");
-                self.archive_file(destination_folder, new_filename)
+            # 저장과 파일 보관은 백그라운드 대기열에서 처리하고, 바로 다음 문서를 받을 수 있게 화면을 비움
+            if not self.enqueue_save(self.current_company_name, biz_no, update_data,
+                                     excel_key if is_existing_company else None,
+                                     (source_file_path, destination_folder, new_filename)): return
+            self.reset_ui_for_next_file()
+            self.save_button.setEnabled(False)
 
-    def archive_file(self, destination_folder, new_filename):
+    def compared_company_state(self, excel_path, biz_no):
+        """
+        '2. 원본 데이터 비교' 결과로 DB에 있는 업체인지 판단합니다.
+        반환값: True(기존 업체) / False(신규 업체) / None(지금의 DB와 사업자번호로 비교하지 않음)
+        """
+        if not self.current_before_data or self.compared_request != (excel_path, biz_no.replace('-', '')): return None
+        # 신규 업체는 비교 단계에서 '지역'만 입력되므로, 사업자번호 정보가 있으면 DB에 있는 업체
+        return '사업자등록번호' in self.current_before_data
+
+    def build_archive_target(self, file_type, source_file_path, base_archive_path):
+        """현재 업체 정보로 보관 폴더와 새 파일 이름을 만듭니다."""
+        region_info_dict = self.current_before_data.get('지역', {});
+        region_full_name = region_info_dict.get('value', '기타');
+        region_name = region_full_name.split(' ')[0] if region_full_name else '기타';
+        destination_folder = os.path.join(base_archive_path, region_name)
+        company_name_normalized = self.current_company_name.replace('㈜', '(주)');
+        sanitized_company_name = re.sub(r'[<>:"/\\|?*]', '', company_name_normalized).strip();
+        _, file_extension = os.path.splitext(source_file_path);
+        new_filename = f"{sanitized_company_name}_{file_type}{file_extension}"
+        return destination_folder, new_filename
+
+    def enqueue_save(self, label, biz_no, update_data, db_type, archive=None):
+        """확정한 문서를 백그라운드 저장 대기열에 넣고 저장 작업을 시작합니다. 반환값: 성공 여부"""
         try:
-            source_file_path = self.file_path_entry.text();
-            destination_path = os.path.join(destination_folder, new_filename)
-            os.makedirs(destination_folder, exist_ok=True);
-            shutil.move(source_file_path, destination_path)
-            QMessageBox.information(self, "작업 완료",
-                                    f"<b>[파일 보관 완료]</b>\n'{os.path.basename(source_file_path)}' 파일을\n'{os.path.basename(destination_path)}'(으)로 변경하여 저장했습니다.")
-            self.reset_ui_for_next_file()
-        except Exception as e:
-            QMessageBox.critical(self, "파일 보관 오류", f"파일을 보관하는 중 오류가 발생했습니다:\n{e}")
-        self.save_button.setEnabled(False)
+            self.write_behind.enqueue(label, biz_no, update_data, db_type,
+                                      self.excel_paths.get(db_type) if db_type else None, archive)
+        except OSError as e:
+            QMessageBox.critical(self, "저장 대기열 오류", f"저장 대기열 기록 중 오류가 발생했습니다:\n{e}"); return False
+        self.start_save_worker()
+        return True
+
+    def resume_write_behind(self):
+        """지난 실행에서 저장하지 못하고 저널에 남은 작업을 다시 저장합니다."""
+        pending, failed = self.write_behind.counts()
+        if pending: self.save_status_log.append(f"지난 실행에서 남은 {pending}건을 다시 저장합니다.")
+        for job in self.write_behind.failed_jobs():
+            self.save_status_log.append(f"❌ {job['label']}: {job['error']}")
+        self.start_save_worker()
+
+    def start_save_worker(self):
+        self.update_save_status()
+        if self.save_worker and self.save_worker.isRunning(): return  # 실행 중인 작업이 새 작업도 이어서 처리
+        if not self.write_behind.counts()[0]: return
+        self.save_worker = SaveQueueWorker(self.write_behind)
+        self.save_worker.progress.connect(self.on_save_job_finished)
+        self.save_worker.finished.connect(self.on_save_worker_finished)
+        self.save_worker.start()
+        self.update_save_status()
+
+    def on_save_job_finished(self, job, error):
+        self.save_status_log.append(f"❌ {job['label']}: {error}" if error else f"✅ {job['label']} 저장 완료")
+        self.update_save_status()
+
+    def on_save_worker_finished(self):
+        self.save_worker.wait()
+        # 마지막 확인 이후 들어온 작업이 있으면 이어서 저장
+        if self.write_behind.counts()[0]: self.start_save_worker()
+        self.update_save_status()
+
+    def update_save_status(self):
+        pending, failed = self.write_behind.counts()
+        running = self.save_worker is not None and self.save_worker.isRunning()
+        self.save_status_label.setText(f"{'저장 중 - ' if running else ''}저장 대기 {pending}건 / 실패 {failed}건")
+        self.retry_failed_button.setEnabled(failed > 0)
+
+    def retry_failed_saves(self):
+        if self.write_behind.retry_failed(): self.start_save_worker()
+
+    def queue_current_document(self):
+        """현재 문서를 바로 저장하지 않고 일괄 저장 대기열에 추가한 뒤, 다음 문서를 받을 수 있게 화면을 비웁니다."""
+        update_data = {k: v['entry'].text() for k, v in self.fields_to_extract.items()}
+        biz_no = update_data.get('사업자등록번호', '').strip()
+        file_type = self.file_type_combo.currentText()
+        excel_key = "전기" if "전기" in file_type else "통신" if "통신" in file_type else "소방" if "소방" in file_type else None
+        data_only_mode = self.data_only_checkbox.isChecked()
+
+        if not (biz_no and excel_key and self.excel_paths.get(excel_key)):
+            QMessageBox.warning(self, "정보 부족", "DB(자료 종류)와 사업자등록번호가 모두 필요합니다.");
+            return
+        is_existing_company = self.compared_company_state(self.excel_paths[excel_key], biz_no)
+        if not self.current_company_name or is_existing_company is None:
+            QMessageBox.warning(self, "정보 오류", "'2. 원본 데이터 비교'를 먼저 실행하여 업체 정보를 확인해주세요.");
+            return
+        if data_only_mode and not is_existing_company:
+            QMessageBox.warning(self, "오류", "'데이터만 저장' 모드는 DB에 있는 업체만 대기열에 추가할 수 있습니다.");
+            return
+
+        archive = None
+        if not data_only_mode:
+            source_file_path = self.file_path_entry.text()
+            base_archive_path = self.archive_path_entry.text()
+            if not (source_file_path and base_archive_path):
+                QMessageBox.warning(self, "정보 부족", "자료 파일과 보관 경로가 모두 필요합니다.");
+                return
+            try:
+                destination_folder, new_filename = self.build_archive_target(file_type, source_file_path,
+                                                                             base_archive_path)
+            except Exception as e:
+                QMessageBox.critical(self, "경로 생성 오류", f"파일 저장 경로를 만드는 중 오류가 발생했습니다:\n{e}"); return
+            archive = (source_file_path, destination_folder, new_filename)
+
+        self.pending_documents.append({
+            'label': self.current_company_name,
+            'biz_no': biz_no,
+            'update_data': update_data,
+            'db_type': excel_key if is_existing_company else None,
+            'archive': archive,
+        })
+        self.update_queue_button()
+        self.reset_ui_for_next_file()
+
+    def update_queue_button(self):
+        self.queue_flush_button.setText(f"💾 대기열 일괄 저장 ({len(self.pending_documents)}건)")
+        self.queue_flush_button.setEnabled(bool(self.pending_documents))
+
+    def flush_pending_documents(self):
+        """대기열의 문서들을 백그라운드 저장 대기열로 넘깁니다. (DB 파일별로 묶어 한 번씩 저장)"""
+        if not self.pending_documents: return
+        reply = QMessageBox.question(self, "일괄 저장 확인",
+                                     f"대기 중인 {len(self.pending_documents)}건을 저장하시겠습니까?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes: return
+
+        while self.pending_documents:
+            job = self.pending_documents[0]
+            if not self.enqueue_save(job['label'], job['biz_no'], job['update_data'], job['db_type'], job['archive']): break
+            self.pending_documents.pop(0)
+        self.update_queue_button()
 
     def format_number_input(self, text):
         sender = self.sender()
@@ -664,6 +873,9 @@ class BusinessStatusTab(QWidget):
             if field.get('button'): field['button'].setText("지정"); field['button'].setStyleSheet("")
             if field.get('entry'): field['entry'].clear()
             field['roi'] = None
+        self.template_worker = None;
+        self.pending_template_ocr = False;
+        self.template_label.setText("템플릿: -")
         self.before_table.clearContents();
         self.after_table.clearContents()
         self.file_type_combo.setCurrentIndex(0);
@@ -706,6 +918,64 @@ class BusinessStatusTab(QWidget):
         self.setCursor(Qt.ArrowCursor);
         self.image_label.setCursor(Qt.ArrowCursor)
 
+    def set_reader(self, reader, error=None):
+        """OCR 리더를 지정합니다. 모델을 불러오는 중(None)이거나 실패하면 분석 버튼만 막아 둡니다."""
+        self.reader = reader
+        self.run_ocr_button.setEnabled(reader is not None)
+        self.run_ocr_button.setText("1. 지정 영역 분석" if reader else "OCR 모델 불러오기 실패" if error else "OCR 모델 불러오는 중...")
+        if reader and self.pending_template_ocr: self.pending_template_ocr = False; self.run_roi_ocr()
+
+    def template_doc_types(self):
+        """템플릿을 찾을 자료 종류: 선택한 종류가 있으면 그 종류만, 없으면 이 탭의 모든 종류"""
+        if self.file_type_combo.currentIndex() > 0: return [self.file_type_combo.currentText()]
+        return [self.file_type_combo.itemText(i) for i in range(1, self.file_type_combo.count())]
+
+    def save_roi_template(self):
+        if not self.original_pixmap: QMessageBox.warning(self, "오류", "먼저 분석할 이미지를 열어주세요."); return
+        if self.file_type_combo.currentIndex() == 0: QMessageBox.warning(self, "오류", "템플릿을 저장할 자료 종류를 선택해주세요."); return
+        rois = {k: (v['roi'].x(), v['roi'].y(), v['roi'].width(), v['roi'].height()) for k, v in self.fields_to_extract.items() if v.get('roi')}
+        if not rois: QMessageBox.warning(self, "오류", "하나 이상의 영역을 먼저 지정해주세요."); return
+        doc_type = self.file_type_combo.currentText()
+        name, ok = QInputDialog.getText(self, "영역 템플릿 저장", f"'{doc_type}' 템플릿 이름 (같은 이름이면 덮어씀):", text=f"{doc_type} 기본 양식")
+        if not ok or not name.strip(): return
+        template, error = roi_templates.save_template(doc_type, name.strip(), Image.fromqpixmap(self.original_pixmap), rois)
+        if error: QMessageBox.critical(self, "템플릿 저장 오류", error); return
+        self.template_label.setText(f"템플릿: {template['name']}");
+        QMessageBox.information(self, "템플릿 저장 완료", f"'{doc_type}' 템플릿 '{template['name']}'을(를) 저장했습니다. (영역 {len(rois)}개)")
+
+    def start_template_align(self, manual=False):
+        """현재 페이지에 맞는 영역 템플릿을 백그라운드에서 찾습니다. 파일을 열 때는 자동으로 실행됩니다."""
+        if not self.original_pixmap:
+            if manual: QMessageBox.warning(self, "오류", "먼저 분석할 이미지를 열어주세요.")
+            return
+        doc_types = self.template_doc_types()
+        if not any(template['doc_type'] in doc_types for template in roi_templates.list_templates()):
+            if manual: QMessageBox.information(self, "알림", "저장된 영역 템플릿이 없습니다.")
+            return
+        self.template_label.setText("템플릿: 정렬 중...")
+        worker = TemplateAlignWorker(self.original_pixmap.toImage(), doc_types)
+        worker.finished.connect(lambda template, rois, error, w=worker: self.on_template_aligned(w, template, rois, error, manual))
+        self.template_worker = worker
+        worker.start()
+
+    def on_template_aligned(self, worker, template, rois, error, manual):
+        if worker is not self.template_worker:
+            return  # 정렬하는 동안 다른 파일을 연 경우
+        self.template_worker = None
+        if error or not rois:
+            self.template_label.setText("템플릿: 맞는 양식 없음")
+            if error: trace_log.warning(error)
+            if manual: QMessageBox.information(self, "알림", error or "이 문서에 맞는 영역 템플릿을 찾지 못했습니다.")
+            return
+        for field, (x, y, w, h) in rois.items():
+            if field not in self.fields_to_extract: continue
+            self.fields_to_extract[field]['roi'] = QRect(x, y, w, h); button = self.fields_to_extract[field]['button']
+            button.setText(f"템플릿({x},{y})"); button.setStyleSheet("background-color: #2ECC71;")
+        self.template_label.setText(f"템플릿: {template['name']}")
+        if self.file_type_combo.currentIndex() == 0: self.file_type_combo.setCurrentText(template['doc_type'])
+        if self.reader: self.run_roi_ocr()
+        else: self.pending_template_ocr = True
+
     def run_roi_ocr(self):
         if not self.original_pixmap: QMessageBox.warning(self, "오류", "먼저 분석할 이미지를 열어주세요."); return
         fields_to_process = {k: v for k, v in self.fields_to_extract.items() if v.get('roi')};
@@ -791,48 +1061,138 @@ class BusinessStatusTab(QWidget):
     def start_color_update(self):
         excel_path = self.excel_file_path_entry.text()
         if not excel_path: QMessageBox.warning(self, "파일 선택 오류", "먼저 색상을 업데이트할 엑셀 파일을 선택해주세요."); return
-        reply = QMessageBox.question(self, "연말 색상 업데이트 확인",
-                                     f"'{os.path.basename(excel_path)}' 파일의 모든 데이터 상태 색상을 갱신하시겠습니까?",
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
-                                     QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes: self.color_update_button.setText(
-            "업데이트 중..."); self.color_update_button.setEnabled(False); self.color_worker = ColorUpdateWorker(
-            excel_path); self.color_worker.finished.connect(self.on_color_update_finished); self.color_worker.start()
-
-    def on_color_update_finished(self, message):
-        self.color_update_button.setText("🎨 연말 색상 업데이트");
-        self.color_update_button.setEnabled(True)
-        if "오류" in message:
-            QMessageBox.critical(self, "업데이트 오류", message)
-        else:
-            QMessageBox.information(self, "업데이트 완료", message)
+        self.start_recolor_preview(self.color_update_button, "연말 색상 업데이트", excel_path, rollover=True)
 
     def start_credit_color_update(self):
         excel_path = self.excel_file_path_entry.text()
         if not excel_path: QMessageBox.warning(self, "파일 선택 오류", "먼저 색상을 업데이트할 엑셀 파일을 선택해주세요."); return
-        reply = QMessageBox.question(self, "신용평가 유효기간 갱신 확인",
-                                     f"'{os.path.basename(excel_path)}' 파일의 모든 '신용평가' 셀의 색상을 유효기간에 따라 갱신하시겠습니까?",
+        self.start_recolor_preview(self.credit_color_update_button, "신용평가 유효기간 갱신", excel_path, credit=True)
+
+    def start_recolor_preview(self, button, title, excel_path, **rules):
+        """읽기 전용으로 바뀔 셀만 먼저 분석하고(미리보기), 확인을 받은 뒤 그 목록을 그대로 적용합니다."""
+        label = button.text(); button.setText("미리보기 중..."); button.setEnabled(False)
+        self.recolor_worker = RecolorPlanWorker(excel_path, **rules)
+        self.recolor_worker.finished.connect(
+            lambda plan, error: self.on_recolor_plan_ready(button, label, title, plan, error))
+        self.recolor_worker.start()
+
+    def on_recolor_plan_ready(self, button, label, title, plan, error):
+        if error or not plan['changes']:
+            button.setText(label); button.setEnabled(True)
+            if error: QMessageBox.critical(self, f"{title} 오류", error)
+            else: QMessageBox.information(self, title, "색상이 바뀔 셀이 없습니다. 파일은 수정하지 않았습니다.")
+            return
+        rule_names = {'rollover': "상태 색상", 'credit': "신용평가 색상"}
+        lines = [f"'{os.path.basename(plan['path'])}' 파일에서 {len(plan['changes'])}개 셀의 색상이 바뀝니다.", ""]
+        lines += [f"  {rule_names[rule]}: {count}개" for rule, count in plan['by_rule'].items() if count]
+        lines += [f"  [{sheet}] {count}개" for sheet, count in plan['by_sheet'].items()]
+        lines += ["", "적용하시겠습니까?"]
+        reply = QMessageBox.question(self, f"{title} 확인", "\n".join(lines),
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                      QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes: self.credit_color_update_button.setText(
-            "갱신 중..."); self.credit_color_update_button.setEnabled(False); self.credit_worker = CreditColorUpdateWorker(
-            excel_path); self.credit_worker.finished.connect(
-            self.on_credit_color_update_finished); self.credit_worker.start()
-
-    def on_credit_color_update_finished(self, message):
-        self.credit_color_update_button.setText("✨ 신용평가 유효기간 갱신");
-        self.credit_color_update_button.setEnabled(True)
+        if reply != QMessageBox.StandardButton.Yes:
+            button.setText(label); button.setEnabled(True); return
+        button.setText("적용 중...")
+        self.recolor_apply_worker = RecolorApplyWorker(plan)
+        self.recolor_apply_worker.finished.connect(
+            lambda message: self.on_recolor_applied(button, label, title, message))
+        self.recolor_apply_worker.start()
+
+    def on_recolor_applied(self, button, label, title, message):
+        button.setText(label); button.setEnabled(True)
         if "오류" in message:
-            QMessageBox.critical(self, "갱신 오류", message)
+            QMessageBox.critical(self, f"{title} 오류", message)
+        else:
+            QMessageBox.information(self, f"{title} 완료", message)
+
+    def start_year_end_maintenance(self):
+        db_names = [db_type for db_type, path in self.excel_paths.items() if path]
+        if not db_names: QMessageBox.warning(self, "경로 설정 오류", "먼저 'DB 경로 설정'에서 DB 파일을 지정해주세요."); return
+        reply = QMessageBox.question(self, "연말 통합 정리 확인",
+                                     f"{', '.join(db_names)} DB 파일의 상태 색상과 '신용평가' 유효기간 색상을 한 번에 갱신하시겠습니까?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes: return
+        self.year_end_button.setText("정리 중..."); self.year_end_button.setEnabled(False)
+        self.year_end_worker = YearEndMaintenanceWorker(dict(self.excel_paths))
+        self.year_end_worker.finished.connect(self.on_year_end_maintenance_finished); self.year_end_worker.start()
+
+    def on_year_end_maintenance_finished(self, results):
+        self.year_end_button.setText("🗓️ 연말 통합 정리 (전체 DB)"); self.year_end_button.setEnabled(True)
+        lines, has_error = [], False
+        for db_type in self.excel_paths:
+            if db_type not in results: continue
+            counts, error = results[db_type]
+            if error:
+                has_error = True; lines.append(f"[{db_type}] 오류: {error}")
+            else:
+                lines.append(f"[{db_type}] 상태 색상 {counts['rollover']}개, 신용평가 색상 {counts['credit']}개 갱신")
+        if not lines: QMessageBox.warning(self, "연말 통합 정리", "처리할 수 있는 DB 파일이 없습니다."); return
+        if has_error:
+            QMessageBox.critical(self, "연말 통합 정리 결과", "\n".join(lines))
+        else:
+            QMessageBox.information(self, "연말 통합 정리 완료", "\n".join(lines))
+
+    def start_cross_db_report(self):
+        if len([path for path in self.excel_paths.values() if path]) < 2:
+            QMessageBox.warning(self, "경로 설정 오류", "비교하려면 'DB 경로 설정'에서 DB 파일을 2개 이상 지정해주세요."); return
+        self.cross_db_button.setText("비교 중..."); self.cross_db_button.setEnabled(False)
+        self.cross_db_worker = CrossDbReportWorker(dict(self.excel_paths))
+        self.cross_db_worker.finished.connect(self.on_cross_db_report_finished); self.cross_db_worker.start()
+
+    def on_cross_db_report_finished(self, report, errors):
+        self.cross_db_button.setText("🔗 DB 간 중복 업체 비교 (전체 DB)"); self.cross_db_button.setEnabled(True)
+        mismatched = [item for item in report if item['mismatches']]
+        summary = f"여러 DB에 있는 업체: {len(report)}개\n그중 값이 다른 업체: {len(mismatched)}개"
+        for db_type, error in errors.items(): summary += f"\n[{db_type}] {error}"
+        details = []
+        for item in mismatched:
+            details.append(f"--- {item['biz_no']} ({', '.join(item['mismatches'])} 다름) ---")
+            for db_type, entry in item['entries'].items():
+                values = " / ".join(f"{label}: {entry[label]}" for label in ocr_logic.CROSS_DB_FIELDS)
+                details.append(f"[{db_type}] {values} ({entry['cell'][0]} 시트 {entry['cell'][1]}행 {entry['cell'][2]}열)")
+        box = QMessageBox(QMessageBox.Icon.Warning if errors else QMessageBox.Icon.Information, "DB 간 중복 업체 비교", summary, parent=self)
+        if details: box.setDetailedText("\n".join(details))
+        box.exec()
+
+    def undo_last_save(self):
+        records = change_journal.undoable_records()
+        if not records: QMessageBox.information(self, "되돌리기", "되돌릴 변경 내역이 없습니다."); return
+        record = records[0]
+        reply = QMessageBox.question(self, "되돌리기 확인",
+                                     f"{os.path.basename(record['path'])}에 {record['ts']}에 저장한 셀 {len(record['cells'])}개를 이전 상태로 되돌리시겠습니까?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                                     QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes: return
+        self.start_rollback(None)
+
+    def rollback_batch_run(self):
+        batches = change_journal.undoable_batches()
+        if not batches: QMessageBox.information(self, "일괄 작업 되돌리기", "되돌릴 일괄 작업이 없습니다."); return
+        labels = [f"{batch['ts']}  {batch['task']} - {', '.join(os.path.basename(path) for path in batch['paths'])} (셀 {batch['cells']}개)"
+                  for batch in batches]
+        label, ok = QInputDialog.getItem(self, "일괄 작업 되돌리기", "되돌릴 작업을 선택하세요:", labels, 0, False)
+        if not ok: return
+        self.start_rollback(batches[labels.index(label)]['batch'])
+
+    def start_rollback(self, batch_id):
+        self.undo_button.setEnabled(False); self.rollback_button.setEnabled(False)
+        self.rollback_worker = ChangeRollbackWorker(batch_id)
+        self.rollback_worker.finished.connect(self.on_rollback_finished); self.rollback_worker.start()
+
+    def on_rollback_finished(self, message, has_error):
+        self.undo_button.setEnabled(True); self.rollback_button.setEnabled(True)
+        if has_error:
+            QMessageBox.warning(self, "되돌리기 결과", message)
         else:
-            QMessageBox.information(self, "갱신 완료", message)
+            QMessageBox.information(self, "되돌리기 완료", message)
 
     def load_excel_paths(self):
         try:
             if os.path.exists("ocr_config.json"):
                 with open("ocr_config.json", 'r', encoding='utf-8') as f: self.excel_paths.update(json.load(f))
         except Exception as e:
-            print(f"설정 파일 로드 오류: {e}")
+            trace_log.warning(f"설정 파일 로드 오류: {e}")
 
     def save_excel_paths(self):
         try:
@@ -863,6 +1223,9 @@ class BusinessStatusTab(QWidget):
             self.excel_file_path_entry.setText(self.excel_paths[key])
         else:
             self.excel_file_path_entry.clear()
+        # 문서를 연 뒤 자료 종류를 고른 경우, 아직 지정한 영역이 없으면 그 종류의 템플릿을 적용
+        if key and self.original_pixmap and not self.template_worker and not any(v.get('roi') for v in self.fields_to_extract.values()):
+            self.start_template_align()
 
     def rotate_image(self, angle):
         """현재 이미지를 주어진 각도만큼 회전시킵니다."""
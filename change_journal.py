@@ -0,0 +1,156 @@
+# [change_journal.py] 엑셀 셀 변경 내역을 덧붙이기 전용(append-only)으로 기록하는 저널
+#
+# 저장 한 번 = 기록 한 줄(JSON Lines, CHANGE_JOURNAL_PATH)이며, 바뀐 셀마다 수정 전/후의 값과 서식을 담습니다.
+#   {'id', 'ts', 'path', 'batch', 'task', 'undoes', 'styles': [서식 XML, ...], 'cells': [[시트명, 행, 열, 수정 전, 수정 후], ...]}
+# 같은 서식이 여러 셀에 반복되므로, 셀 상태의 배경/글꼴은 기록마다 'styles' 목록의 번호로 저장합니다.
+# 되돌리기(ocr_logic.undo_last_change / rollback_batch)는 이 기록만으로 셀을 이전 상태로 돌려놓으므로,
+# 큰 작업 전에 DB 파일 전체를 복사해 둘 필요가 없습니다. 되돌린 작업도 'undoes'가 있는 기록으로 덧붙입니다.
+# batch(): 한 번의 일괄 작업(연말 정리 등)에서 저장한 기록들을 같은 batch id로 묶어, 한 번에 되돌릴 수 있게 합니다.
+
+import json
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, date, time
+
+from openpyxl.styles import Font
+from openpyxl.styles.fills import Fill
+from openpyxl.xml.functions import tostring, fromstring
+
+import trace_log
+
+CHANGE_JOURNAL_PATH = "ocr_changes.jsonl"
+
+_write_lock = threading.Lock()
+_batch_context = threading.local()
+
+
+# --- 셀 상태 직렬화 (xlsx_patch.cell_change 형식 <-> JSON) ---
+def _encode_value(value):
+    if isinstance(value, datetime): return {'$datetime': value.isoformat()}
+    if isinstance(value, date): return {'$date': value.isoformat()}
+    if isinstance(value, time): return {'$time': value.isoformat()}
+    if value is None or isinstance(value, (bool, int, float, str)): return value
+    return str(value)
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if '$datetime' in value: return datetime.fromisoformat(value['$datetime'])
+        if '$date' in value: return date.fromisoformat(value['$date'])
+        if '$time' in value: return time.fromisoformat(value['$time'])
+    return value
+
+
+def encode_state(state):
+    """셀 상태(값/배경/글꼴/표시 형식)를 JSON으로 저장할 수 있는 형태로 바꿉니다. (서식은 XML 문자열)"""
+    return {'value': _encode_value(state['value']),
+            'fill': tostring(state['fill'].to_tree()).decode('utf-8'),
+            'font': tostring(state['font'].to_tree()).decode('utf-8'),
+            'number_format': state['number_format']}
+
+
+def decode_state(data):
+    return {'value': _decode_value(data['value']),
+            'fill': Fill.from_tree(fromstring(data['fill'])),
+            'font': Font.from_tree(fromstring(data['font'])),
+            'number_format': data['number_format']}
+
+
+# --- 일괄 작업 묶음 ---
+def new_batch_id():
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def batch(task, batch_id=None):
+    """
+    with 블록 안(같은 스레드)에서 저장한 변경 기록을 하나의 일괄 작업으로 묶습니다.
+    이미 바깥 일괄 작업 안이면 바깥 작업에 포함됩니다.
+    여러 스레드에서 같은 일괄 작업을 처리하면 batch_id를 만들어 각 스레드에 넘기세요.
+    """
+    previous = getattr(_batch_context, 'current', None)
+    _batch_context.current = (batch_id, task) if batch_id else previous or (new_batch_id(), task)
+    try:
+        yield _batch_context.current[0]
+    finally:
+        _batch_context.current = previous
+
+
+# --- 기록 / 읽기 ---
+def append(excel_path, cells, undoes=None):
+    """
+    저장 한 번의 변경 내역을 저널에 덧붙입니다.
+    cells: [(시트명, 행, 열, 수정 전 상태, 수정 후 상태)] (상태는 xlsx_patch.cell_change 형식)
+    저널 기록은 되돌리기용 보조 기능이므로, 쓰기에 실패해도 저장 작업은 계속합니다.
+    """
+    if not cells: return None
+    batch_id, task = getattr(_batch_context, 'current', None) or (None, None)
+    style_ids = {}
+
+    def compact(state):
+        data = encode_state(state)
+        data['fill'] = style_ids.setdefault(data['fill'], len(style_ids))
+        data['font'] = style_ids.setdefault(data['font'], len(style_ids))
+        return data
+
+    compact_cells = [[sheet_name, row, col, compact(before), compact(after)] for sheet_name, row, col, before, after in cells]
+    record = {'id': uuid.uuid4().hex, 'ts': datetime.now().isoformat(timespec='seconds'), 'path': excel_path,
+              'batch': batch_id, 'task': task, 'undoes': undoes, 'styles': list(style_ids), 'cells': compact_cells}
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        try:
+            with open(CHANGE_JOURNAL_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            trace_log.warning(f"셀 변경 저널 기록 오류: {e}", path=excel_path)
+            return None
+    return record['id']
+
+
+def read_records():
+    """저널의 모든 기록을 오래된 순서로 반환합니다. (쓰다 만 마지막 줄은 건너뜀)"""
+    records = []
+    with _write_lock:
+        try:
+            with open(CHANGE_JOURNAL_PATH, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def iter_cells(record):
+    """기록의 셀들을 (시트명, 행, 열, 수정 전, 수정 후)로 돌려줍니다. (상태는 encode_state 형식)"""
+    styles = record['styles']
+    for sheet_name, row, col, before, after in record['cells']:
+        yield (sheet_name, row, col, dict(before, fill=styles[before['fill']], font=styles[before['font']]),
+               dict(after, fill=styles[after['fill']], font=styles[after['font']]))
+
+
+def undoable_records(records=None):
+    """아직 되돌리지 않은 기록(되돌리기 기록 자체는 제외)을 최신 순서로 반환합니다."""
+    records = read_records() if records is None else records
+    undone = {record['undoes'] for record in records if record.get('undoes')}
+    return [record for record in reversed(records) if not record.get('undoes') and record['id'] not in undone]
+
+
+def undoable_batches(limit=20):
+    """
+    되돌릴 수 있는 일괄 작업 목록을 최신 순서로 반환합니다.
+    각 항목: {'batch', 'task', 'ts'(마지막 저장 시각), 'paths', 'records', 'cells'}
+    """
+    batches = {}
+    for record in undoable_records():
+        if not record['batch']: continue
+        entry = batches.setdefault(record['batch'], {'batch': record['batch'], 'task': record['task'], 'ts': record['ts'],
+                                                     'paths': [], 'records': 0, 'cells': 0})
+        if record['path'] not in entry['paths']: entry['paths'].append(record['path'])
+        entry['records'] += 1
+        entry['cells'] += len(record['cells'])
+    return list(batches.values())[:limit]
@@ -3,22 +3,24 @@
 import sys
 import os
 import re
-import shutil
 import json
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel,
                                QLineEdit, QPushButton, QMessageBox, QFileDialog, QGroupBox, QScrollArea,
-                               QTextEdit, QApplication, QDateEdit, QDialog, QComboBox,
-                               QDialogButtonBox, QCheckBox)
+                               QTextEdit, QDateEdit, QDialog, QComboBox,
+                               QDialogButtonBox, QCheckBox, QSpinBox, QTableWidget, QTableWidgetItem,
+                               QHeaderView, QInputDialog)
 from PySide6.QtCore import Qt, QRect, QDate, QThread, Signal
-from PySide6.QtGui import QPixmap
+from PySide6.QtGui import QPixmap, QColor
 from PIL import Image
 import fitz  # PyMuPDF
 
 # 우리 프로젝트의 다른 파일들
 import ocr_logic
 import ocr_utils
+import trace_log
+import roi_templates
 from ui_widgets import ImageLabel, ZoomableScrollArea
-from workers import RoiOcrWorker
+from workers import LOOKUP_CANCELLED, RoiOcrWorker, CompanyLookupWorker, CreditUpdateWorker, CreditExpiryReportWorker, BulkLookupWorker, TemplateAlignWorker
 from PySide6.QtGui import QTransform
 from business_status_tab import BusinessStatusTab
 
@@ -69,9 +71,62 @@ class ManualInputDialog(QDialog):
         layout.addWidget(self.info_label); layout.addLayout(form_layout); layout.addWidget(self.button_box)
     def get_data(self): return self.name_edit.text().strip(), self.region_combo.currentText()
 
+# 사업자번호 여러 개 일괄 조회 팝업창 클래스
+class BulkLookupDialog(QDialog):
+    def __init__(self, excel_paths, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("사업자번호 일괄 조회"); self.resize(1200, 700); layout = QVBoxLayout(self)
+        self.excel_paths, self.worker = excel_paths, None
+        self.info_label = QLabel("사업자번호를 붙여 넣거나 CSV 파일을 불러오세요. (줄바꿈/쉼표/공백 구분, '-' 유무 상관없음)")
+        self.input_edit = QTextEdit(); self.input_edit.setMaximumHeight(120)
+        button_layout = QHBoxLayout(); self.csv_button = QPushButton("CSV 불러오기"); self.run_button = QPushButton("🔎 일괄 조회")
+        self.status_label = QLabel("")
+        button_layout.addWidget(self.csv_button); button_layout.addWidget(self.run_button); button_layout.addWidget(self.status_label, 1)
+        self.columns = ["DB"] + list(ocr_logic.COLUMN_MAP.keys())
+        self.result_table = QTableWidget(0, len(self.columns)); self.result_table.setHorizontalHeaderLabels(self.columns)
+        self.result_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers); self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.not_found_edit = QTextEdit(); self.not_found_edit.setReadOnly(True); self.not_found_edit.setMaximumHeight(100)
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Close); self.button_box.rejected.connect(self.reject)
+        layout.addWidget(self.info_label); layout.addWidget(self.input_edit); layout.addLayout(button_layout)
+        layout.addWidget(self.result_table, 1); layout.addWidget(QLabel("찾지 못한 사업자번호:")); layout.addWidget(self.not_found_edit); layout.addWidget(self.button_box)
+        self.csv_button.clicked.connect(self.load_csv); self.run_button.clicked.connect(self.run_lookup)
+    def load_csv(self):
+        csv_path, _ = QFileDialog.getOpenFileName(self, "사업자번호 CSV 선택", "", "CSV 파일 (*.csv *.txt)")
+        if not csv_path: return
+        biz_nos, error = ocr_logic.read_biz_no_csv(csv_path)
+        if error: QMessageBox.warning(self, "CSV 오류", error); return
+        self.input_edit.setPlainText("\n".join(biz_nos)); self.status_label.setText(f"CSV에서 {len(biz_nos)}개를 불러왔습니다.")
+    def run_lookup(self):
+        biz_nos = ocr_logic.parse_biz_no_list(self.input_edit.toPlainText())
+        if not biz_nos: QMessageBox.warning(self, "정보 부족", "조회할 사업자번호(10자리)가 없습니다."); return
+        if self.worker and self.worker.isRunning(): return
+        self.run_button.setEnabled(False); self.status_label.setText(f"{len(biz_nos)}개 조회 중...")
+        self.worker = BulkLookupWorker(dict(self.excel_paths), biz_nos)
+        self.worker.finished.connect(self.on_lookup_finished); self.worker.start()
+    def on_lookup_finished(self, results, not_found, errors):
+        self.run_button.setEnabled(True)
+        self.result_table.setRowCount(len(results))
+        for row, result in enumerate(results):
+            self.result_table.setItem(row, 0, QTableWidgetItem(result['db_type']))
+            for col, key in enumerate(self.columns[1:], start=1):
+                cell_info = result['data'].get(key, {})
+                value = cell_info.get('value')
+                item = QTableWidgetItem("" if value is None else str(value))
+                item.setBackground(QColor(cell_info.get('color', '#FFFFFF')))
+                self.result_table.setItem(row, col, item)
+        self.not_found_edit.setPlainText("\n".join(not_found))
+        status = f"찾은 업체: {len(results)}건 / 찾지 못함: {len(not_found)}개"
+        for db_type, error in errors.items(): status += f" / [{db_type}] {error}"
+        self.status_label.setText(status)
+    def reject(self):
+        if self.worker and self.worker.isRunning(): self.worker.cancel(); self.worker.wait()
+        super().reject()
+
 # --- CreditRatingTab 클래스 ---
+TEMPLATE_DOC_TYPE = "신용평가"  # 영역 템플릿의 자료 종류
+
 class CreditRatingTab(QWidget):
-    def __init__(self, reader):
+    def __init__(self, reader=None):
         super().__init__()
         self.reader = reader
         self.original_pixmap = None
@@ -82,6 +137,9 @@ class CreditRatingTab(QWidget):
         self.pdf_pages = []
         self.current_page_index = 0
         self.found_company_data = None
+        self.lookup_worker = None
+        self.template_worker = None  # 영역 템플릿 자동 정렬 작업
+        self.pending_template_ocr = False  # 템플릿을 적용했지만 OCR 모델이 아직 준비되지 않은 경우
         self.setup_ui()
         self.connect_signals()
         self.load_excel_paths()
@@ -184,6 +242,14 @@ class CreditRatingTab(QWidget):
         self.combined_preview.setFixedHeight(60)
         roi_layout.addWidget(self.combined_preview_label, 3, 0, 1, 5);
         roi_layout.addWidget(self.combined_preview, 4, 0, 1, 5)
+        template_layout = QHBoxLayout()
+        self.template_label = QLabel("템플릿: -")
+        self.template_save_button = QPushButton("💾 템플릿 저장");
+        self.template_apply_button = QPushButton("📐 템플릿 적용")
+        template_layout.addWidget(self.template_label, 1);
+        template_layout.addWidget(self.template_save_button);
+        template_layout.addWidget(self.template_apply_button)
+        roi_layout.addLayout(template_layout, 5, 0, 1, 5)
 
         # [핵심 수정] self.archive_box로 변경
         self.archive_box = QGroupBox("처리 완료 파일 보관 경로")
@@ -203,10 +269,18 @@ class CreditRatingTab(QWidget):
         self.update_button.setStyleSheet("font-weight: bold; background-color: #1E8449; color: white;")
         self.log_display = QTextEdit();
         self.log_display.setReadOnly(True)
+        expiry_layout = QHBoxLayout()
+        self.expiry_days_spin = QSpinBox(); self.expiry_days_spin.setRange(1, 365); self.expiry_days_spin.setValue(30)
+        self.expiry_days_spin.setSuffix("일 이내")
+        self.expiry_report_button = QPushButton("📅 신용평가 만료 현황 (전체 DB)")
+        self.bulk_lookup_button = QPushButton("📋 사업자번호 일괄 조회 (전체 DB)")
+        expiry_layout.addWidget(self.expiry_report_button, 1); expiry_layout.addWidget(self.expiry_days_spin)
         action_layout.addWidget(self.run_ocr_button);
         action_layout.addWidget(self.lookup_button)
         action_layout.addWidget(self.data_only_checkbox)
         action_layout.addWidget(self.update_button);
+        action_layout.addLayout(expiry_layout)
+        action_layout.addWidget(self.bulk_lookup_button)
         action_layout.addWidget(QLabel("진행 로그:"));
         action_layout.addWidget(self.log_display)
 
@@ -230,8 +304,13 @@ class CreditRatingTab(QWidget):
         self.zoom_in_button.clicked.connect(lambda: self.zoom_image(1.2))
         self.zoom_out_button.clicked.connect(lambda: self.zoom_image(0.8))
         self.run_ocr_button.clicked.connect(self.run_roi_ocr)
+        self.set_reader(self.reader)
         self.lookup_button.clicked.connect(self.run_company_lookup)
         self.update_button.clicked.connect(self.run_final_update)
+        self.expiry_report_button.clicked.connect(self.run_expiry_report)
+        self.bulk_lookup_button.clicked.connect(self.open_bulk_lookup)
+        self.template_save_button.clicked.connect(self.save_roi_template)
+        self.template_apply_button.clicked.connect(lambda: self.start_template_align(manual=True))
         for field, data in self.fields_to_extract.items():
             data['button'].clicked.connect(self.prepare_to_set_roi)
             if field == '신용평가등급':
@@ -281,6 +360,7 @@ class CreditRatingTab(QWidget):
             if self.original_pixmap is None or self.original_pixmap.isNull():
                 self.image_label.clear(); self.set_page_controls_visibility(False); return
             self.display_page(0); self.fit_to_window()
+            self.start_template_align()
         except Exception as e:
             QMessageBox.critical(self, "파일 열기 오류", f"파일을 여는 중 오류가 발생했습니다:\n{e}")
 
@@ -375,6 +455,7 @@ class CreditRatingTab(QWidget):
             if field.get('button'): field['button'].setText("지정"); field['button'].setStyleSheet("")
             if field.get('entry'): field['entry'].clear()
             field['roi'] = None
+        self.template_worker = None; self.pending_template_ocr = False; self.template_label.setText("템플릿: -")
 
         self.start_date_edit.setDate(QDate.currentDate())
         self.combined_preview.clear();
@@ -387,6 +468,54 @@ class CreditRatingTab(QWidget):
         self.set_data_input_enabled(False)
         self.update_button.setEnabled(False)
 
+    def set_reader(self, reader, error=None):
+        """OCR 리더를 지정합니다. 모델을 불러오는 중(None)이거나 실패하면 분석 버튼만 막아 둡니다."""
+        self.reader = reader
+        self.run_ocr_button.setEnabled(reader is not None)
+        self.run_ocr_button.setText("1. 이미지에서 글자 분석" if reader else "OCR 모델 불러오기 실패" if error else "OCR 모델 불러오는 중...")
+        if reader and self.pending_template_ocr: self.pending_template_ocr = False; self.run_roi_ocr()
+
+    def save_roi_template(self):
+        if not self.original_pixmap: QMessageBox.warning(self, "오류", "먼저 분석할 이미지를 열어주세요."); return
+        rois = {k: (v['roi'].x(), v['roi'].y(), v['roi'].width(), v['roi'].height()) for k, v in self.fields_to_extract.items() if v.get('roi')}
+        if not rois: QMessageBox.warning(self, "오류", "하나 이상의 영역을 먼저 지정해주세요."); return
+        name, ok = QInputDialog.getText(self, "영역 템플릿 저장", "신용평가 템플릿 이름 (발급처 등, 같은 이름이면 덮어씀):", text="신용평가 기본 양식")
+        if not ok or not name.strip(): return
+        template, error = roi_templates.save_template(TEMPLATE_DOC_TYPE, name.strip(), Image.fromqpixmap(self.original_pixmap), rois)
+        if error: QMessageBox.critical(self, "템플릿 저장 오류", error); return
+        self.template_label.setText(f"템플릿: {template['name']}")
+        QMessageBox.information(self, "템플릿 저장 완료", f"신용평가 템플릿 '{template['name']}'을(를) 저장했습니다. (영역 {len(rois)}개)")
+
+    def start_template_align(self, manual=False):
+        """현재 페이지에 맞는 신용평가 영역 템플릿을 백그라운드에서 찾습니다. 파일을 열 때는 자동으로 실행됩니다."""
+        if not self.original_pixmap:
+            if manual: QMessageBox.warning(self, "오류", "먼저 분석할 이미지를 열어주세요.")
+            return
+        if not roi_templates.list_templates(TEMPLATE_DOC_TYPE):
+            if manual: QMessageBox.information(self, "알림", "저장된 신용평가 영역 템플릿이 없습니다.")
+            return
+        self.template_label.setText("템플릿: 정렬 중...")
+        worker = TemplateAlignWorker(self.original_pixmap.toImage(), [TEMPLATE_DOC_TYPE])
+        worker.finished.connect(lambda template, rois, error, w=worker: self.on_template_aligned(w, template, rois, error, manual))
+        self.template_worker = worker
+        worker.start()
+
+    def on_template_aligned(self, worker, template, rois, error, manual):
+        if worker is not self.template_worker: return  # 정렬하는 동안 다른 파일을 연 경우
+        self.template_worker = None
+        if error or not rois:
+            self.template_label.setText("템플릿: 맞는 양식 없음")
+            if error: trace_log.warning(error)
+            if manual: QMessageBox.information(self, "알림", error or "이 문서에 맞는 영역 템플릿을 찾지 못했습니다.")
+            return
+        for field, (x, y, w, h) in rois.items():
+            if field not in self.fields_to_extract: continue
+            self.fields_to_extract[field]['roi'] = QRect(x, y, w, h)
+            btn = self.fields_to_extract[field]['button']; btn.setText("템플릿"); btn.setStyleSheet("background-color: #2ECC71;")
+        self.template_label.setText(f"템플릿: {template['name']}")
+        if self.reader: self.run_roi_ocr()
+        else: self.pending_template_ocr = True
+
     def run_roi_ocr(self):
         if not self.original_pixmap: QMessageBox.warning(self, "오류", "먼저 분석할 이미지를 열어주세요."); return
         fields_to_process = {k: v for k, v in self.fields_to_extract.items() if v.get('roi')}
@@ -420,11 +549,33 @@ class CreditRatingTab(QWidget):
         cleaned_text = text
         if field_name == '사업자등록번호': cleaned_text = ocr_utils.clean_biz_number(text)
         self.fields_to_extract[field_name]['entry'].setText(cleaned_text)
+    def run_expiry_report(self):
+        if not any(self.excel_paths.values()): QMessageBox.warning(self, "경로 오류", "DB 경로가 설정되지 않았습니다."); return
+        self.expiry_report_button.setEnabled(False); self.expiry_report_button.setText("조회 중...")
+        self.expiry_worker = CreditExpiryReportWorker(dict(self.excel_paths), self.expiry_days_spin.value())
+        self.expiry_worker.finished.connect(self.on_expiry_report_finished); self.expiry_worker.start()
+    def on_expiry_report_finished(self, report, errors):
+        self.expiry_report_button.setEnabled(True); self.expiry_report_button.setText("📅 신용평가 만료 현황 (전체 DB)")
+        days = self.expiry_days_spin.value()
+        summary = (f"만료: {len(report['expired'])}개\n{days}일 이내 만료 예정: {len(report['expiring'])}개\n"
+                   f"유효: {len(report['valid'])}개\n기간 확인 불가: {len(report['unknown'])}개")
+        for db_type, error in errors.items(): summary += f"\n[{db_type}] {error}"
+        details = []
+        for title, key in (("만료 예정", 'expiring'), ("만료", 'expired')):
+            details.append(f"--- {title} ---")
+            for item in report[key]:
+                details.append(f"[{item['db_type']}] {item['name']} ({item['biz_no']}) {item['rating']} ~{item['end']} ({item['days_left']}일)")
+        box = QMessageBox(QMessageBox.Icon.Warning if errors else QMessageBox.Icon.Information, "신용평가 만료 현황", summary, parent=self)
+        box.setDetailedText("\n".join(details)); box.exec()
+        self.log_display.append(summary)
+    def open_bulk_lookup(self):
+        if not any(self.excel_paths.values()): QMessageBox.warning(self, "경로 오류", "DB 경로가 설정되지 않았습니다."); return
+        BulkLookupDialog(self.excel_paths, self).exec()
     def load_excel_paths(self):
         try:
             if os.path.exists("ocr_config.json"):
                 with open("ocr_config.json", 'r', encoding='utf-8') as f: self.excel_paths = json.load(f)
-        except Exception as e: print(f"설정 파일 로드 오류: {e}")
+        except Exception as e: trace_log.warning(f"설정 파일 로드 오류: {e}")
     def auto_set_end_date(self):
         start_date = self.start_date_edit.date(); end_date = start_date.addYears(1).addDays(-1)
         self.end_date_edit.blockSignals(True); self.end_date_edit.setDate(end_date); self.end_date_edit.blockSignals(False)
@@ -436,16 +587,24 @@ class CreditRatingTab(QWidget):
     def run_company_lookup(self):
         biz_no = self.fields_to_extract['사업자등록번호']['entry'].text().strip()
         if not biz_no: QMessageBox.warning(self, "정보 부족", "사업자등록번호를 먼저 입력(또는 분석)해야 합니다."); return
+        if self.lookup_worker and self.lookup_worker.isRunning(): return
         self.lookup_button.setText("조회 중...");
-        QApplication.processEvents()
+        self.lookup_button.setEnabled(False)
 
-        company_data = None
-        for db_path in self.excel_paths.values():
-            if db_path and os.path.exists(db_path):
-                data, _ = ocr_logic.find_company_data(db_path, biz_no)
-                if data: company_data = data; break
+        # 전기/통신/소방 DB를 백그라운드에서 동시에 조회 (조회만 하므로 스트리밍 조회 사용)
+        self.lookup_worker = CompanyLookupWorker(self.excel_paths, biz_no, streaming=True, use_mirror=True)
+        self.lookup_worker.finished.connect(self.on_company_lookup_finished)
+        self.lookup_worker.start()
 
+    def on_company_lookup_finished(self, company_data, message, elapsed):
         self.lookup_button.setText("2. 사업자번호로 업체 조회")
+        self.lookup_button.setEnabled(True)
+        if message == LOOKUP_CANCELLED:
+            self.log_display.append("업체 조회가 취소되었습니다."); return  # 찾지 못한 것이 아니므로 신규 업체로 보지 않음
+        found_in = f"'{message}' DB에서 발견" if company_data else "찾지 못함"
+        self.log_display.append(f"업체 조회 완료 ({elapsed:.1f}초, {found_in}) - 다음 작업을 진행할 수 있습니다.")
+        if not company_data and message:
+            self.log_display.append(f"  -> 조회 오류: {message}")
 
         if company_data:
             self.found_company_data = company_data
@@ -464,6 +623,7 @@ class CreditRatingTab(QWidget):
             self.set_data_input_enabled(False)
             self.original_name_display.clear()
             self.original_rating_display.clear()
+            if message: QMessageBox.critical(self, "엑셀 파일 오류", f"DB 파일을 조회하지 못했습니다.\n{message}"); return
             QMessageBox.warning(self, "조회 실패", "DB에서 해당 업체를 찾을 수 없습니다.\n신규 업체인 경우, '업데이트 및 파일 보관' 버튼을 눌러주세요.")
 
     # [credit_rating_tab.py 파일에서 이 함수를 찾아 통째로 교체]
@@ -515,22 +675,7 @@ class CreditRatingTab(QWidget):
             QMessageBox.warning(self, "정보 부족", "신용평가등급과 유효기간을 모두 입력해야 합니다.");
             return
 
-        self.update_button.setText("실행 중...");
-        self.log_display.clear();
-        QApplication.processEvents()
-
-        total_updates = 0
-        if update_excel:
-            for db_type, excel_path in self.excel_paths.items():
-                if excel_path and os.path.exists(excel_path):
-                    self.log_display.append(f"'{db_type}' DB 업데이트 시도...");
-                    QApplication.processEvents()
-                    result_msg, error = ocr_logic.update_credit_rating_only(excel_path, biz_no, credit_rating)
-                    if error:
-                        self.log_display.append(f"  -> 오류: {error}")
-                    else:
-                        self.log_display.append(f"  -> {result_msg}"); total_updates += 1 if "완료" in result_msg else 0
-
+        archive = None
         if archive_file:
             try:
                 source_file_path = self.file_path_entry.text().strip()
@@ -539,16 +684,28 @@ class CreditRatingTab(QWidget):
                 company_name_normalized = company_name.replace('㈜', '(주)')
                 sanitized_company_name = re.sub(r'[<>:"/\\|?*]', '', company_name_normalized).strip()
                 new_filename = f"{sanitized_company_name}_신용평가{os.path.splitext(source_file_path)[1]}"
-                destination_path = os.path.join(destination_folder, new_filename)
-                self.log_display.append("\n파일 보관 작업 중...")
-                os.makedirs(destination_folder, exist_ok=True);
-                shutil.move(source_file_path, destination_path)
-                self.log_display.append(f"  -> '{new_filename}' 이름으로 변경하여\n  -> '{destination_folder}' 경로에 저장 완료!")
+                archive = (source_file_path, destination_folder, new_filename)
             except Exception as e:
                 QMessageBox.critical(self, "파일 이동 오류", f"파일 이동 중 오류 발생:\n{e}")
 
+        self.update_button.setText("실행 중...");
+        self.update_button.setEnabled(False)
+        self.log_display.clear();
+
+        # DB 파일별 저장과 파일 보관을 백그라운드에서 동시에 실행하고, 진행 상황은 로그로 받음
+        self.final_update_excel, self.final_archive_file = update_excel, archive_file
+        self.update_worker = CreditUpdateWorker(self.excel_paths, biz_no, credit_rating if update_excel else None,
+                                                archive)
+        self.update_worker.log.connect(self.log_display.append)
+        self.update_worker.finished.connect(self.on_final_update_finished)
+        self.update_worker.start()
+
+    def on_final_update_finished(self, total_updates, archive_error):
+        if archive_error:
+            QMessageBox.critical(self, "파일 이동 오류", f"파일 이동 중 오류 발생:\n{archive_error}")
+
         final_msg = "작업을 완료했습니다."
-        if update_excel and not archive_file: final_msg = "엑셀 업데이트를 완료했습니다."
+        if self.final_update_excel and not self.final_archive_file: final_msg = "엑셀 업데이트를 완료했습니다."
         QMessageBox.information(self, "작업 완료", f"{final_msg} 로그를 확인하세요.")
         self.reset_ui()
 
@@ -0,0 +1,239 @@
+# [db_mirror.py] 엑셀 DB(전기/통신/소방)를 로컬 SQLite로 복제해 두고 사업자번호 조회를 처리하는 모듈
+#
+# - 업체 1곳 = companies 테이블의 1행. RELATIVE_OFFSETS 항목은 자료형이 있는 열로,
+#   셀 배경색은 항목별 색상(JSON)을 status 열에 저장합니다.
+# - 엑셀 파일의 mtime/size가 바뀐 DB만 다시 읽고(읽기 전용 스트리밍), 내용이 바뀐 업체 행만 갱신합니다.
+# - 이 프로그램이 엑셀을 저장하면(ocr_logic 저장 알림) 메모리의 Workbook에서 바로 갱신하므로 다시 읽지 않습니다.
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date
+
+from openpyxl import load_workbook
+
+import ocr_logic
+import trace_log
+from config import RELATIVE_OFFSETS, COLUMN_MAP
+from ocr_logic import (normalize_biz_no, cell_color_hex, parse_credit_rating, file_signature,
+                       iter_company_blocks)
+
+MIRROR_DB_PATH = "ocr_mirror.db"
+
+# 엑셀 라벨 -> (SQLite 열 이름, 자료형)
+MIRROR_COLUMNS = {
+    '상호': ('name', 'TEXT'),
+    '대표자': ('ceo', 'TEXT'),
+    '사업자번호': ('biz_no_text', 'TEXT'),
+    '지역': ('region', 'TEXT'),
+    '시공능력': ('capacity', 'NUMERIC'),
+    '3년간 실적액': ('perf_3y', 'NUMERIC'),
+    '5년간 실적액': ('perf_5y', 'NUMERIC'),
+    '부채비율': ('debt_ratio', 'NUMERIC'),
+    '유동비율': ('current_ratio', 'NUMERIC'),
+    '영업기간': ('business_period', 'TEXT'),
+    '신용평가': ('credit_rating', 'TEXT'),
+    '여성기업': ('women_owned', 'TEXT'),
+    '건설고용자수': ('employees', 'NUMERIC'),
+    '일자리창출실적': ('job_creation', 'TEXT'),
+    '시공품질평가': ('quality_eval', 'TEXT'),
+    '비고': ('note', 'TEXT'),
+}
+FIELD_COLUMNS = [column for label, (column, _) in MIRROR_COLUMNS.items() if label in RELATIVE_OFFSETS]
+RECORD_COLUMNS = (['db_type', 'biz_no', 'sheet', 'row', 'col'] + FIELD_COLUMNS
+                  + ['credit_end', 'status', 'row_hash'])
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sources (
+    db_type TEXT PRIMARY KEY, path TEXT NOT NULL, mtime_ns INTEGER, size INTEGER, synced_at TEXT
+);
+CREATE TABLE IF NOT EXISTS companies (
+    db_type TEXT NOT NULL, biz_no TEXT NOT NULL, sheet TEXT, row INTEGER, col INTEGER,
+    {', '.join(f'{column} {kind}' for label, (column, kind) in MIRROR_COLUMNS.items() if label in RELATIVE_OFFSETS)},
+    credit_end TEXT, status TEXT, row_hash TEXT,
+    PRIMARY KEY (db_type, biz_no)
+);
+CREATE INDEX IF NOT EXISTS idx_companies_biz_no ON companies(biz_no);
+"""
+
+
+def _plain_value(value):
+    """SQLite/JSON에 넣을 수 있는 값으로 바꿉니다. (날짜는 ISO 문자열)"""
+    if isinstance(value, (datetime, date)): return value.isoformat()
+    if value is None or isinstance(value, (int, float, str)): return value
+    return str(value)
+
+
+def _company_record(db_type, sheet_name, row, col, cell_at):
+    """
+    사업자번호 셀(row, col)을 기준으로 업체 1곳의 행 데이터를 만듭니다.
+    cell_at(row)는 col 열의 해당 행 셀(없으면 None)을 돌려주는 함수입니다.
+    """
+    record = {'db_type': db_type, 'biz_no': normalize_biz_no(cell_at(row).value),
+              'sheet': sheet_name, 'row': row, 'col': col}
+    status = {}
+    for label, offset in RELATIVE_OFFSETS.items():
+        if label not in MIRROR_COLUMNS: continue
+        cell = cell_at(row + offset) if row + offset >= 1 else None
+        record[MIRROR_COLUMNS[label][0]] = _plain_value(getattr(cell, 'value', None))
+        status[label] = cell_color_hex(cell)
+    _, _, end = parse_credit_rating(record.get('credit_rating'))
+    record['credit_end'] = end.isoformat() if end else None
+    record['status'] = json.dumps(status, ensure_ascii=False, sort_keys=True)
+    hashed = json.dumps([record[column] for column in RECORD_COLUMNS[:-1]], ensure_ascii=False, default=str)
+    record['row_hash'] = hashlib.sha1(hashed.encode('utf-8')).hexdigest()
+    return record
+
+
+def _read_companies(db_type, excel_path, cancel_event=None):
+    """읽기 전용 스트리밍으로 엑셀 DB의 모든 업체를 읽습니다. (ocr_logic.iter_company_blocks)"""
+    workbook = load_workbook(filename=excel_path, read_only=True, data_only=False)
+    records = {}
+    try:
+        for sheet in workbook.worksheets:
+            for row, col, cell_at in iter_company_blocks(sheet, cancel_event):
+                record = _company_record(db_type, sheet.title, row, col, cell_at)
+                records.setdefault(record['biz_no'], record)
+    finally:
+        workbook.close()
+    return records
+
+
+class ExcelMirror:
+    """엑셀 DB의 SQLite 복제본입니다. 메서드마다 연결을 새로 열므로 여러 작업 스레드에서 함께 쓸 수 있습니다."""
+
+    def __init__(self, db_path=MIRROR_DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        ocr_logic.add_save_listener(self._on_workbook_saved)
+
+    @contextmanager
+    def _connect(self):
+        """트랜잭션 하나를 열고, 블록이 끝나면 커밋(오류 시 롤백)한 뒤 연결을 닫습니다."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- 동기화 ---
+    def sync(self, excel_paths, force=False, cancel_event=None):
+        """
+        바뀐 엑셀 파일만 다시 읽어 복제본을 갱신합니다.
+        반환값: {DB 종류: (갱신/삭제된 업체 수, 오류 메시지)}
+        """
+        results = {}
+        for db_type, excel_path in excel_paths.items():
+            if not excel_path or not os.path.exists(excel_path): continue
+            try:
+                results[db_type] = (self._sync_source(db_type, excel_path, force, cancel_event), None)
+            except ocr_logic.LookupCancelled:
+                raise
+            except Exception as e:
+                results[db_type] = (None, f"엑셀 파일 동기화 오류: {e}")
+        return results
+
+    def _sync_source(self, db_type, excel_path, force, cancel_event):
+        signature = file_signature(excel_path)
+        with self._connect() as conn:
+            source = conn.execute("SELECT path, mtime_ns, size FROM sources WHERE db_type = ?", (db_type,)).fetchone()
+        if not force and source and tuple(source) == (excel_path, signature['mtime_ns'], signature['size']):
+            return 0
+
+        with trace_log.phase('mirror_sync', path=excel_path) as trace:
+            records = _read_companies(db_type, excel_path, cancel_event)
+            with self._connect() as conn:
+                existing = dict(conn.execute("SELECT biz_no, row_hash FROM companies WHERE db_type = ?", (db_type,)))
+                changed = [record for key, record in records.items() if existing.get(key) != record['row_hash']]
+                removed = [(db_type, key) for key in existing.keys() - records.keys()]
+                self._upsert(conn, changed)
+                conn.executemany("DELETE FROM companies WHERE db_type = ? AND biz_no = ?", removed)
+                self._stamp(conn, db_type, excel_path, signature)
+            trace.update(companies=len(records), changed=len(changed), removed=len(removed))
+        return len(changed) + len(removed)
+
+    @staticmethod
+    def _upsert(conn, records):
+        placeholders = ', '.join('?' for _ in RECORD_COLUMNS)
+        conn.executemany(f"INSERT OR REPLACE INTO companies ({', '.join(RECORD_COLUMNS)}) VALUES ({placeholders})",
+                         [[record[column] for column in RECORD_COLUMNS] for record in records])
+
+    @staticmethod
+    def _stamp(conn, db_type, excel_path, signature):
+        conn.execute("INSERT OR REPLACE INTO sources (db_type, path, mtime_ns, size, synced_at) VALUES (?, ?, ?, ?, ?)",
+                     (db_type, excel_path, signature['mtime_ns'], signature['size'], datetime.now().isoformat()))
+
+    def _on_workbook_saved(self, excel_path, workbook, previous_signature, touched):
+        """
+        ocr_logic이 엑셀을 저장한 직후: 파일을 다시 읽지 않고, 바뀐 셀(touched)이 속한 업체 행만 메모리의 Workbook에서 갱신합니다.
+        저장 직전 파일(previous_signature)과 복제본이 이미 달랐거나 바뀐 셀을 모르면, 서명을 그대로 두어
+        다음 sync()에서 파일 전체를 다시 읽게 합니다. (다른 사용자가 추가한 업체도 반영되도록)
+        """
+        if touched is None: return
+        key = os.path.normcase(os.path.abspath(excel_path))
+        first_offset, last_offset = min(RELATIVE_OFFSETS.values()), max(RELATIVE_OFFSETS.values())
+        with self._connect() as conn:
+            db_types = [row['db_type'] for row in conn.execute("SELECT db_type, path, mtime_ns, size FROM sources")
+                        if os.path.normcase(os.path.abspath(row['path'])) == key
+                        and {'mtime_ns': row['mtime_ns'], 'size': row['size']} == previous_signature]
+            for db_type in db_types:
+                companies = {}
+                for sheet_name, row, col in touched:
+                    for company in conn.execute("SELECT sheet, row, col, row_hash FROM companies WHERE db_type = ? AND sheet = ? "
+                                                "AND col = ? AND row BETWEEN ? AND ?",
+                                                (db_type, sheet_name, col, row - last_offset, row - first_offset)):
+                        companies[(company['sheet'], company['row'], company['col'])] = company['row_hash']
+                changed = []
+                for (sheet_name, row, col), row_hash in companies.items():
+                    if sheet_name not in workbook.sheetnames: continue
+                    sheet = workbook[sheet_name]
+                    record = _company_record(db_type, sheet_name, row, col, lambda r, c=col: sheet.cell(row=r, column=c))
+                    if record['row_hash'] != row_hash: changed.append(record)
+                self._upsert(conn, changed)
+                self._stamp(conn, db_type, excel_path, file_signature(excel_path))
+
+    # --- 조회 ---
+    def find_company(self, excel_paths, biz_no, cancel_event=None):
+        """
+        ocr_logic.find_company_data와 같은 형식({항목: {'value', 'color'}})으로 업체를 찾습니다.
+        동기화에 실패한 DB는 복제본이 파일과 다를 수 있으므로 조회하지 않고 오류로 돌려줍니다.
+        반환값: (업체 데이터 또는 None, 찾은 DB 종류 또는 None, {동기화에 실패한 DB 종류: 오류 메시지})
+        """
+        sync_errors = {db_type: error for db_type, (_, error) in self.sync(excel_paths, cancel_event=cancel_event).items()
+                       if error}
+        db_types = [db_type for db_type, path in excel_paths.items() if path and db_type not in sync_errors]
+        if not db_types: return None, None, sync_errors
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM companies WHERE biz_no = ? AND db_type IN ({', '.join('?' for _ in db_types)})",
+                                [normalize_biz_no(biz_no)] + db_types).fetchall()
+        if not rows: return None, None, sync_errors
+        row = min(rows, key=lambda r: db_types.index(r['db_type']))
+        return self._to_company_data(row), row['db_type'], sync_errors
+
+    @staticmethod
+    def _to_company_data(row):
+        status = json.loads(row['status'] or '{}')
+        found_data = {}
+        for key, excel_label in COLUMN_MAP.items():
+            if excel_label in MIRROR_COLUMNS and excel_label in RELATIVE_OFFSETS:
+                found_data[key] = {'value': row[MIRROR_COLUMNS[excel_label][0]],
+                                   'color': status.get(excel_label, '#FFFFFF')}
+        return found_data
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror(db_path=MIRROR_DB_PATH):
+    """프로그램 전체에서 함께 쓰는 복제본을 반환합니다."""
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None: _mirror = ExcelMirror(db_path)
+        return _mirror
@@ -1,8 +1,7 @@
-import sys
 from PySide6.QtWidgets import QMainWindow, QTabWidget, QMessageBox
-import easyocr
 from business_status_tab import BusinessStatusTab
 from credit_rating_tab import CreditRatingTab
+from workers import ReaderLoadWorker
 
 
 
@@ -13,18 +12,15 @@ class MainWindow(QMainWindow):
         self.setGeometry(100, 100, 1220, 820)
 
         # EasyOCR 리더는 프로그램 시작 시 한 번만 생성하여 모든 탭에서 공유
-        try:
-            self.reader = easyocr.Reader(['ko', 'en'], gpu=False)
-        except Exception as e:
-            QMessageBox.critical(self, "EasyOCR 로드 오류", f"EasyOCR 초기화 중 치명적 오류 발생: {e}")
-            sys.exit()
+        # 모델 불러오기(torch 포함)는 오래 걸리므로 백그라운드에서 하고, 다 될 때까지 탭의 OCR 버튼만 막아 둠
+        self.reader = None
 
         # 탭 위젯 생성
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
 
         # 1. 경영상태 분석 탭 추가 (기존 OcrUpdaterWindow를 사용)
-        self.business_tab = BusinessStatusTab(self.reader) # reader를 전달
+        self.business_tab = BusinessStatusTab(self.reader) # reader를 전달 (불러오기 완료 후 set_reader로 다시 전달)
         self.tabs.addTab(self.business_tab, "📄 경영상태 분석")
 
         # 2. 신용평가 업데이트 탭 추가
@@ -36,4 +32,23 @@ class MainWindow(QMainWindow):
         from PySide6.QtWidgets import QWidget
         font = QFont("Pretendard")
         for widget in self.findChildren(QWidget):
-            widget.setFont(font)
\ No newline at end of file
+            widget.setFont(font)
+
+        self.reader_worker = ReaderLoadWorker()
+        self.reader_worker.finished.connect(self.on_reader_loaded)
+        self.reader_worker.start()
+
+    def on_reader_loaded(self, reader, error):
+        self.reader = reader
+        self.business_tab.set_reader(reader, error)
+        self.credit_tab.set_reader(reader, error)
+        if error:
+            QMessageBox.critical(self, "EasyOCR 로드 오류", f"EasyOCR 초기화 중 오류 발생: {error}\n\nOCR 분석 외의 기능은 그대로 사용할 수 있습니다.")
+
+    def closeEvent(self, event):
+        # 모델을 불러오는 중에 닫으면 스레드가 끝날 때까지 기다림 (실행 중인 QThread를 지우면 비정상 종료됨)
+        if self.reader_worker.isRunning(): self.reader_worker.wait()
+        # 백그라운드 저장 중이면 끝날 때까지 기다림 (못다 한 작업은 저널에 남아 다음 실행 때 이어서 저장)
+        save_worker = self.business_tab.save_worker
+        if save_worker and save_worker.isRunning(): save_worker.wait()
+        super().closeEvent(event)
@@ -0,0 +1,131 @@
+# [ocr_cache.py] 지정 영역 OCR 결과 캐시 (내용 주소 방식)
+#
+# 키는 (잘라낸 영역 픽셀의 해시, 전처리 설정, 인식기 설정)이므로, 같은 문서를 다시 열거나
+# 영역 하나만 고쳐 다시 분석해도 바뀌지 않은 영역은 OCR 없이 이전 결과를 그대로 씁니다.
+# 설정이 바뀌면 키도 바뀌므로 오래된 결과를 지울 필요가 없습니다.
+#   - 메모리: 최근에 쓴 OCR_CACHE_MEMORY_ITEMS개 (LRU)
+#   - 디스크: 환경 변수 OCR_CACHE_DIR로 폴더를 지정한 경우에만 사용 (기본값: 사용 안 함), 키마다 파일 1개,
+#             전체 크기가 OCR_CACHE_DISK_MB(기본값 20MB)를 넘으면 가장 오래 쓰지 않은 파일부터 지움
+#             (인식한 사업자번호/업체명 등이 평문으로 남으므로, 다른 사용자가 읽을 수 없는 폴더를 지정할 것)
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import trace_log
+
+OCR_CACHE_MEMORY_ITEMS = 512
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR', '').strip()
+OCR_CACHE_DISK_BYTES = int(float(os.environ.get('OCR_CACHE_DISK_MB', '20')) * 1024 * 1024)
+
+
+def make_key(pil_img, preprocess_config, recognizer_config):
+    """잘라낸 영역 이미지(Pillow)와 전처리/인식기 설정으로 캐시 키(sha1 16진수 문자열)를 만듭니다."""
+    digest = hashlib.sha1()
+    digest.update(json.dumps({'mode': pil_img.mode, 'size': pil_img.size, 'preprocess': preprocess_config,
+                              'recognizer': recognizer_config}, sort_keys=True).encode('utf-8'))
+    digest.update(pil_img.tobytes())
+    return digest.hexdigest()
+
+
+class OcrCache:
+    """
+    OCR 결과(텍스트) 캐시. disk_dir가 None이면 메모리에만 보관합니다.
+    여러 작업 스레드에서 함께 쓰므로 모든 메서드는 잠금 안에서 동작합니다.
+    디스크 오류는 경고만 남기고 캐시 없이 계속합니다. (캐시는 속도를 위한 보조 기능)
+    """
+
+    def __init__(self, max_items=OCR_CACHE_MEMORY_ITEMS, disk_dir=OCR_CACHE_DIR or None, disk_max_bytes=OCR_CACHE_DISK_BYTES):
+        self.max_items, self.disk_dir, self.disk_max_bytes = max_items, disk_dir, disk_max_bytes
+        self._memory = OrderedDict()
+        self._disk_bytes = None  # 처음 디스크에 쓸 때 폴더를 훑어 계산
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".txt")
+
+    def _remember(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """저장된 텍스트를 반환합니다. 없으면 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if not self.disk_dir: return None
+            path = self._disk_path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                os.utime(path)  # 디스크 정리는 수정 시각 순서이므로, 읽은 파일은 최근에 쓴 것으로 표시
+            except FileNotFoundError:
+                return None
+            except OSError as e:
+                trace_log.warning(f"OCR 캐시 읽기 오류: {e}", path=path)
+                return None
+            self._remember(key, text)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._remember(key, text)
+            if not self.disk_dir: return
+            path = self._disk_path(key)
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                if self._disk_bytes is None: self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+                data = text.encode('utf-8')
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                temp_path = path + ".tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                self._disk_bytes += len(data) - previous
+                if self._disk_bytes > self.disk_max_bytes: self._prune_disk()
+            except OSError as e:
+                trace_log.warning(f"OCR 캐시 쓰기 오류: {e}", path=path)
+
+    def _disk_entries(self):
+        """디스크 캐시 파일 목록 [(수정 시각, 경로, 크기), ...]"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, entry.path, stat.st_size))
+        return entries
+
+    def _prune_disk(self):
+        """가장 오래 쓰지 않은 파일부터 지워 디스크 캐시를 상한의 80%까지 줄입니다."""
+        target = self.disk_max_bytes * 0.8
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= target: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._disk_bytes = total
+
+    def clear(self):
+        """메모리와 디스크의 캐시를 모두 지웁니다."""
+        with self._lock:
+            self._memory.clear()
+            if not self.disk_dir or not os.path.isdir(self.disk_dir): return
+            for _, path, _ in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self._disk_bytes = 0
+
+
+# 프로그램 전체에서 함께 쓰는 캐시 (분석 작업은 실행마다 새로 만들어지므로 여기에 보관)
+shared = OcrCache()
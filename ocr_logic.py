@@ -1,92 +1,807 @@
 from openpyxl import load_workbook
 from config import RELATIVE_OFFSETS, COLUMN_MAP, RATIO_THRESHOLDS
 from openpyxl.styles import PatternFill, Color, Font
+from openpyxl.styles.cell_style import StyleArray
 from datetime import datetime
+from copy import copy
+import os
+import io
+import csv
+import hashlib
+import json
 import re
+import threading
+import functools
+import xlsx_patch
+import trace_log
+import change_journal
 
 
-def find_company_data(excel_path, biz_no_to_find):
+# --- 사업자번호 인덱스 (사이드카 파일) ---
+# 엑셀 DB 옆에 '<DB파일>.bizindex.json' 파일을 두고,
+# 정규화된 사업자번호 -> [시트명, 행, 열] 위치를 저장합니다.
+# 엑셀 파일의 수정 시각(mtime)과 크기가 바뀌면 인덱스는 무효로 보고 다시 만듭니다.
+BIZ_INDEX_SUFFIX = ".bizindex.json"
+BIZ_NO_PATTERN = re.compile(r'\d{10}')
+
+
+def normalize_biz_no(value):
+    """사업자번호를 비교용 문자열(하이픈/앞뒤 공백 제거)로 바꿉니다."""
+    return str(value).strip().replace('-', '')
+
+
+def file_signature(excel_path):
+    """파일이 바뀌었는지 확인하는 서명 {'mtime_ns', 'size'} (캐시/보조 인덱스/SQLite 복제본이 함께 사용)"""
+    stat = os.stat(excel_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _load_biz_index(excel_path):
+    """사이드카 인덱스를 읽어, 엑셀 파일과 서명(mtime/size)이 일치할 때만 반환합니다."""
+    try:
+        with open(excel_path + BIZ_INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('signature') == file_signature(excel_path):
+            return index
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _save_biz_index(excel_path, entries):
+    try:
+        index = {'signature': file_signature(excel_path), 'entries': entries}
+        with open(excel_path + BIZ_INDEX_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+    except (OSError, ValueError) as e:
+        # 인덱스는 성능용 보조 파일이므로, 저장에 실패해도 작업은 계속합니다.
+        trace_log.warning(f"사업자번호 인덱스 저장 오류: {e}", path=excel_path)
+
+
+def _refresh_biz_index_signature(excel_path, previous_signature):
     """
-    엑셀 파일에서 업체를 찾아, 값과 함께 셀 배경색 정보도 반환합니다.
+    이 프로그램이 엑셀을 저장한 직후 호출합니다. (previous_signature: 저장 직전 파일의 서명)
+    업체 위치(행/열)는 바뀌지 않으므로, 저장 직전 파일로 만든 인덱스라면 서명만 새 파일 기준으로 갱신합니다.
+    그 전에 다른 프로그램이 파일을 바꿔 이미 오래된 인덱스였다면, 다음 조회 때 새로 만들도록 지웁니다.
     """
+    index_path = excel_path + BIZ_INDEX_SUFFIX
     try:
-        workbook = load_workbook(filename=excel_path, data_only=False)
-    except Exception as e:
-        return None, f"엑셀 파일 열기 오류: {e}"
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError):
+        index = {}
+    if index.get('signature') == previous_signature:
+        _save_biz_index(excel_path, index.get('entries', {}))
+        return
+    try:
+        os.remove(index_path)
+    except OSError as e:
+        trace_log.warning(f"오래된 사업자번호 인덱스 삭제 오류: {e}", path=excel_path)
+
+
+# --- DB 레이아웃 (A열 라벨) ---
+# DB는 업체가 열 방향으로 나열되고 A열에 항목 라벨이 있는 구조(config.RELATIVE_OFFSETS)입니다.
+# 사업자번호는 A열 라벨이 '사업자번호'인 행에만 있으므로, 시트마다 A열을 한 번 읽어
+# 그 행 번호들을 캐시해 두고 검색은 해당 행만 확인합니다.
+BIZ_NO_LABEL = '사업자번호'
+_layout_cache = {}
+
+
+def _is_biz_no_label(value):
+    return value is not None and BIZ_NO_LABEL in str(value)
+
+
+def _discover_label_rows(sheet):
+    """시트의 A열만 읽어 '사업자번호' 라벨이 있는 행 번호 목록을 반환합니다."""
+    return [row_idx for row_idx, (label,) in
+            enumerate(sheet.iter_rows(min_row=1, max_col=1, values_only=True), start=1)
+            if _is_biz_no_label(label)]
 
-    print(f"\n--- [진단 시작] 엑셀에서 데이터 조회 ---")
-    print(f"  - 엑셀 파일 경로: {excel_path}")
-    print(f"  - 찾으려는 사업자번호: '{biz_no_to_find}'")
 
-    target_row, target_col, target_sheet_name = -1, -1, None;
-    found = False
+def _get_label_rows(workbook, excel_path, sheet_name):
+    """
+    캐시된 '사업자번호' 행 목록을 반환합니다.
+    파일이 바뀐 경우에도 전체를 다시 만들지 않고, 요청된 시트의 A열만 다시 읽습니다.
+    """
+    key = _cache_key(excel_path)
+    signature = file_signature(excel_path)
+    with _workbook_cache_lock:
+        layout = _layout_cache.get(key)
+        if layout is None or layout['signature'] != signature:
+            # 파일이 바뀌면 시트별 결과만 비워 두고, A열 재검색은 시트 단위로 필요할 때 수행
+            layout = {'signature': signature, 'sheets': {}}
+            _layout_cache[key] = layout
+        rows = layout['sheets'].get(sheet_name)
+    if rows is None:
+        rows = _discover_label_rows(workbook[sheet_name])
+        with _workbook_cache_lock:
+            layout['sheets'][sheet_name] = rows
+    return rows
+
+
+def _refresh_layout_signature(excel_path, previous_signature):
+    """
+    이 프로그램의 저장은 A열 라벨을 바꾸지 않으므로, 저장 직전 파일(previous_signature)의 레이아웃이면 서명만 갱신합니다.
+    그 전에 다른 프로그램이 파일을 바꿔 이미 오래된 레이아웃이었다면 버립니다.
+    """
+    key = _cache_key(excel_path)
+    with _workbook_cache_lock:
+        layout = _layout_cache.get(key)
+        if layout is None: return
+        if layout['signature'] == previous_signature:
+            layout['signature'] = file_signature(excel_path)
+        else:
+            del _layout_cache[key]
+
+
+def _iter_sheet_values(sheet, min_row=1, min_col=1):
+    for row_idx, values in enumerate(sheet.iter_rows(min_row=min_row, min_col=min_col, values_only=True),
+                                     start=min_row):
+        yield row_idx, values
+
+
+class LookupCancelled(Exception):
+    """다른 DB에서 먼저 업체를 찾는 등의 이유로 조회가 취소되었을 때 사용합니다."""
+
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise LookupCancelled()
+
+
+def _iter_candidate_cells(workbook, excel_path, cancel_event=None):
+    """
+    사업자번호가 있을 수 있는 셀만 (시트명, 행, 열, 값) 형태로 돌려줍니다.
+    - 읽기 전용(스트리밍) Workbook: 한 번의 패스에서 A열 라벨을 보고 '사업자번호' 행만 비교
+    - 일반 Workbook: 캐시된 '사업자번호' 행만 직접 읽음
+    - '사업자번호' 라벨이 없는 시트는 기존처럼 모든 셀을 확인
+    cancel_event(threading.Event)가 설정되면 LookupCancelled 예외로 검색을 중단합니다.
+    """
+    read_only = getattr(workbook, 'read_only', False)
     for sheet_name in workbook.sheetnames:
+        _check_cancelled(cancel_event)
         sheet = workbook[sheet_name]
-        print(f"\n- 시트 '{sheet_name}' 검색 중...")
-        for row in sheet.iter_rows():
-            for cell in row:
-                if cell.value is None: continue
-                if str(cell.value).strip().replace('-', '') == biz_no_to_find.strip().replace('-', ''):
-                    target_row, target_col, target_sheet_name = cell.row, cell.column, sheet_name
-                    found = True;
-                    break
-            if found: break
-        if found: break
-
-    if not found:
-        print("  - [진단 결과] 엑셀의 모든 시트에서 해당 사업자번호를 찾지 못했습니다.")
-        print("--- [진단 종료] ---\n")
-        return None, None
+        label_rows = []
+        if read_only:
+            for row_idx, values in _iter_sheet_values(sheet):
+                _check_cancelled(cancel_event)
+                if values and _is_biz_no_label(values[0]):
+                    label_rows.append(row_idx)
+                    for col_idx, value in enumerate(values[1:], start=2):
+                        if value is not None: yield sheet_name, row_idx, col_idx, value
+        else:
+            label_rows = _get_label_rows(workbook, excel_path, sheet_name)
+            for row_idx in label_rows:
+                for cell in sheet[row_idx][1:]:
+                    if cell.value is not None: yield sheet_name, row_idx, cell.column, cell.value
 
-    print(f"  - [진단] 업체 위치 찾기 성공!: '{target_sheet_name}' 시트, {target_row}행, {target_col}열")
-    print(f"  - [진단] 이제 해당 위치를 기준으로 상대 오프셋 데이터를 읽습니다...")
+        if not label_rows:
+            for row_idx, values in _iter_sheet_values(sheet):
+                _check_cancelled(cancel_event)
+                for col_idx, value in enumerate(values, start=1):
+                    if value is not None: yield sheet_name, row_idx, col_idx, value
 
-    sheet = workbook[target_sheet_name]
+
+def _scan_all_biz_numbers(workbook, excel_path, cancel_event=None):
+    """'사업자번호' 행들을 훑어, 사업자번호 형태(숫자 10자리)의 값 위치를 모읍니다."""
+    entries = {}
+    for sheet_name, row_idx, col_idx, value in _iter_candidate_cells(workbook, excel_path, cancel_event):
+        key = normalize_biz_no(value)
+        # 같은 번호가 여러 번 나오면 기존 검색 순서대로 첫 번째 위치를 사용
+        if BIZ_NO_PATTERN.fullmatch(key) and key not in entries:
+            entries[key] = [sheet_name, row_idx, col_idx]
+    return entries
+
+
+def _scan_for_biz_no(workbook, excel_path, key, cancel_event=None):
+    """인덱스를 쓸 수 없는 경우(사업자번호 형식이 아닌 입력 등)를 위한 직접 검색입니다."""
+    for sheet_name, row_idx, col_idx, value in _iter_candidate_cells(workbook, excel_path, cancel_event):
+        if normalize_biz_no(value) == key:
+            return sheet_name, row_idx, col_idx
+    return None, None, None
+
+
+def _locate_company(workbook, excel_path, biz_no_to_find, verify=True, rebuild=False, cancel_event=None):
+    """
+    사업자번호로 업체 위치를 찾아 (시트명, 행, 열)을 반환합니다. 찾지 못하면 (None, None, None).
+    - 유효한 인덱스가 있으면 O(1)로 위치를 찾고, 실제 셀 값으로 한 번 더 확인합니다.
+      (verify=False 이면 확인을 호출한 쪽에 맡깁니다. 읽기 전용 조회에서 사용)
+    - 인덱스가 없거나 오래된 경우(또는 rebuild=True) 전체 검색을 하면서 인덱스를 새로 만듭니다.
+    """
+    with trace_log.phase('locate', path=excel_path) as trace:
+        key = normalize_biz_no(biz_no_to_find)
+        if not BIZ_NO_PATTERN.fullmatch(key):
+            # 사업자번호 형식이 아니면 인덱스 대상이 아니므로 기존 방식으로 검색
+            trace['method'] = 'scan'
+            return _scan_for_biz_no(workbook, excel_path, key, cancel_event)
+
+        index = None if rebuild else _load_biz_index(excel_path)
+        if index is not None:
+            trace['method'] = 'index'
+            location = index['entries'].get(key)
+            if location is None:
+                return None, None, None
+            sheet_name, row, col = location
+            if not verify:
+                return sheet_name, row, col
+            if sheet_name in workbook.sheetnames:
+                value = workbook[sheet_name].cell(row=row, column=col).value
+                if value is not None and normalize_biz_no(value) == key:
+                    return sheet_name, row, col
+            # 인덱스가 실제 파일과 맞지 않으면 아래에서 다시 만듦
+
+        trace['method'] = 'rebuild'
+        entries = _scan_all_biz_numbers(workbook, excel_path, cancel_event)
+        _save_biz_index(excel_path, entries)
+        location = entries.get(key)
+        return tuple(location) if location else (None, None, None)
+
+
+# --- 워크북 캐시 ---
+# 같은 DB 파일을 비교/저장/신용평가 작업마다 다시 여는 비용을 없애기 위해,
+# 파싱된 Workbook을 경로별로 보관하고 디스크의 파일이 바뀌었을 때만 다시 읽습니다.
+# 캐시에는 읽을 때의 서명(mtime/size)과 내용 해시도 함께 두어, 저장 직전에
+# 다른 사용자(공유 폴더의 다른 PC)가 그사이 파일을 저장했는지 확인합니다. (낙관적 동시성 제어)
+_workbook_cache = {}
+_workbook_cache_lock = threading.Lock()
+_path_locks = {}
+_save_listeners = []
+
+
+def _cache_key(excel_path):
+    return os.path.normcase(os.path.abspath(excel_path))
+
+
+def _locked_by_path(func):
+    """같은 엑셀 파일에 대한 작업(캐시된 Workbook 사용)이 동시에 실행되지 않도록 막습니다."""
+    @functools.wraps(func)
+    def wrapper(excel_path, *args, **kwargs):
+        with _workbook_cache_lock:
+            lock = _path_locks.setdefault(_cache_key(excel_path), threading.RLock())
+        with lock:
+            return func(excel_path, *args, **kwargs)
+    return wrapper
+
+
+class SaveConflict(Exception):
+    """불러온 뒤 다른 사용자가 같은 셀을 수정해, 이 작업의 변경을 자동으로 합칠 수 없을 때 사용합니다."""
+
+
+def _file_digest(excel_path):
+    digest = hashlib.sha1()
+    with open(excel_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_workbook_cached(excel_path):
+    """캐시된 Workbook을 반환하고, 파일의 mtime/size가 바뀌었으면 새로 읽습니다."""
+    key = _cache_key(excel_path)
+    signature = file_signature(excel_path)
+    with _workbook_cache_lock:
+        entry = _workbook_cache.get(key)
+    if entry and entry['signature'] == signature:
+        trace_log.event('cache_hit', path=excel_path)
+        return entry['workbook']
+    with trace_log.phase('load', path=excel_path, mode='full'):
+        # 파일을 한 번만 읽어 해시와 Workbook을 함께 만듦
+        with open(excel_path, 'rb') as f:
+            data = f.read()
+        workbook = load_workbook(filename=io.BytesIO(data), data_only=False)
+    with _workbook_cache_lock:
+        _workbook_cache[key] = {'signature': signature, 'digest': hashlib.sha1(data).hexdigest(), 'workbook': workbook}
+    return workbook
+
+
+def _changed_since_load(workbook, excel_path):
+    """
+    workbook을 읽은 뒤 다른 곳에서 파일이 저장되었는지 확인합니다.
+    mtime/size가 그대로면 바뀌지 않은 것으로 보고, 바뀌었으면 내용 해시로 한 번 더 확인합니다.
+    (파일을 복사해 되돌리는 등 내용은 같고 mtime만 바뀐 경우는 충돌로 보지 않음)
+    """
+    with _workbook_cache_lock:
+        entry = _workbook_cache.get(_cache_key(excel_path))
+    if entry is None or entry['workbook'] is not workbook: return False
+    if file_signature(excel_path) == entry['signature']: return False
+    return _file_digest(excel_path) != entry['digest']
+
+
+def _save_workbook_cached(workbook, excel_path, touched=None, undoes=None):
+    """
+    Workbook을 저장하고, 캐시와 사업자번호 인덱스의 서명을 새 파일 기준으로 갱신합니다.
+    touched(_CellChanges)가 주어지면 바뀐 셀을 변경 저널에 기록합니다. (undoes: _save_touched_cells 참고)
+    저장에 실패하면 메모리의 Workbook이 디스크와 달라지므로 캐시에서 제거한 뒤 예외를 다시 던집니다.
+    불러온 뒤 다른 사용자가 파일을 저장했으면, 최신 파일에 touched의 셀 변경만 다시 적용해 저장합니다.
+    (touched가 없으면 어떤 셀을 바꿨는지 모르므로 합칠 수 없어 SaveConflict)
+    반환값: 실제로 저장한 Workbook (병합했으면 최신 파일의 Workbook)
+    """
+    if _changed_since_load(workbook, excel_path):
+        if touched is None:
+            invalidate_workbook_cache(excel_path)
+            raise SaveConflict("불러온 뒤 다른 사용자가 엑셀 파일을 저장했습니다. 다시 실행해주세요.")
+        trace_log.warning("불러온 뒤 다른 곳에서 엑셀 파일이 저장되어, 변경한 셀만 최신 파일에 다시 적용합니다.",
+                          path=excel_path)
+        workbook = _merge_into_fresh_workbook(workbook, excel_path, touched)
+    previous_signature = file_signature(excel_path)
+    try:
+        with trace_log.phase('save', path=excel_path, mode='full'):
+            workbook.save(excel_path)
+    except Exception:
+        invalidate_workbook_cache(excel_path)
+        raise
+    _remember_saved_workbook(workbook, excel_path, previous_signature, touched)
+    if touched: _journal_changes(workbook, excel_path, touched, undoes)
+    return workbook
+
+
+def _remember_saved_workbook(workbook, excel_path, previous_signature, touched=None):
+    """
+    저장 직후의 파일 서명으로 캐시/레이아웃/인덱스를 갱신해, 다음 조회 때 다시 읽지 않도록 합니다.
+    previous_signature: 저장 직전 파일의 서명 (보조 인덱스가 저장 전 파일과 맞았는지 확인용)
+    touched: 이번 저장에서 바뀐 셀 {(시트명, 행, 열): ...} (모르면 None)
+    """
+    with _workbook_cache_lock:
+        _workbook_cache[_cache_key(excel_path)] = {'signature': file_signature(excel_path),
+                                                   'digest': _file_digest(excel_path), 'workbook': workbook}
+    _refresh_layout_signature(excel_path, previous_signature)
+    _refresh_biz_index_signature(excel_path, previous_signature)
+    _refresh_credit_index(workbook, excel_path, previous_signature, touched)
+    for listener in list(_save_listeners):
+        try:
+            listener(excel_path, workbook, previous_signature, touched)
+        except Exception as e:
+            trace_log.warning(f"저장 후 처리 오류: {e}", path=excel_path)
+
+
+def add_save_listener(listener):
+    """
+    이 프로그램이 엑셀 파일을 저장할 때마다 listener(excel_path, workbook, previous_signature, touched)를 호출합니다.
+    previous_signature는 저장 직전 파일의 서명, touched는 바뀐 셀 {(시트명, 행, 열): ...}(모르면 None)입니다.
+    (저장한 파일의 경로 잠금 안에서 호출되므로, listener는 같은 파일을 다시 저장하면 안 됩니다)
+    """
+    if listener not in _save_listeners: _save_listeners.append(listener)
+
+
+class _CellChanges(dict):
+    """
+    한 작업에서 수정한 셀 {(시트명, 행, 열): 수정 전 상태(xlsx_patch.cell_change)}입니다.
+    셀을 고치기 전에 record()를 호출하며, 수정 전 상태는 저장 시 충돌 병합의 기준값이 됩니다.
+    """
+
+    def record(self, sheet_name, cell):
+        self.setdefault((sheet_name, cell.row, cell.column), xlsx_patch.cell_change(cell))
+
+
+def _apply_cell_state(cell, state):
+    """xlsx_patch.cell_change 형식의 상태(값/배경/글꼴/표시 형식)를 셀에 적용합니다."""
+    cell.value = state['value']
+    cell.fill, cell.font = copy(state['fill']), copy(state['font'])
+    cell.number_format = state['number_format']
+
+
+def _journal_changes(workbook, excel_path, touched, undoes=None):
+    """저장한 셀들의 수정 전/후 상태를 변경 저널에 덧붙입니다. (실제로 바뀐 셀만)"""
+    cells = []
+    for (sheet_name, row, col), before in touched.items():
+        after = xlsx_patch.cell_change(workbook[sheet_name].cell(row=row, column=col))
+        if after != before: cells.append((sheet_name, row, col, before, after))
+    change_journal.append(excel_path, cells, undoes=undoes)
+
+
+def _merge_into_fresh_workbook(workbook, excel_path, touched):
+    """
+    다른 사용자가 저장한 최신 파일을 다시 읽고, 이 작업에서 바꾼 셀만 그 위에 다시 적용합니다. (3-way 병합)
+    - 최신 파일의 셀이 수정 전 상태 그대로면 이 작업의 값/서식을 적용
+    - 이미 같은 값/서식이면 그대로 둠
+    - 둘 다 다르게 바꿨으면 SaveConflict (어느 쪽도 덮어쓰지 않음)
+    반환값: 병합된 최신 Workbook
+    """
+    invalidate_workbook_cache(excel_path)
+    fresh = _load_workbook_cached(excel_path)
+    conflicts = []
+    with trace_log.phase('merge', path=excel_path, cells=len(touched)) as trace:
+        for (sheet_name, row, col), base in touched.items():
+            if sheet_name not in fresh.sheetnames:
+                conflicts.append(f"'{sheet_name}' 시트 없음"); continue
+            ours = workbook[sheet_name].cell(row=row, column=col)
+            theirs = fresh[sheet_name].cell(row=row, column=col)
+            theirs_state = xlsx_patch.cell_change(theirs)
+            if theirs_state == xlsx_patch.cell_change(ours): continue
+            if theirs_state != base:
+                conflicts.append(f"{sheet_name}!{theirs.coordinate}"); continue
+            _apply_cell_state(theirs, xlsx_patch.cell_change(ours))
+        trace['conflicts'] = len(conflicts)
+    if conflicts:
+        invalidate_workbook_cache(excel_path)
+        shown = ", ".join(conflicts[:10]) + (f" 외 {len(conflicts) - 10}개" if len(conflicts) > 10 else "")
+        raise SaveConflict(f"다른 사용자가 같은 셀을 먼저 수정했습니다: {shown}. 다시 조회한 뒤 실행해주세요.")
+    return fresh
+
+
+def _save_touched_cells(workbook, excel_path, touched, undoes=None):
+    """
+    수정한 셀(touched: _CellChanges)만 파일에 고쳐 쓰고, 바뀐 셀을 변경 저널에 기록합니다.
+    (undoes: 되돌리기 저장이면 되돌린 저널 기록의 id)
+    불러온 뒤 다른 사용자가 파일을 저장했으면, 최신 파일에 이 작업의 셀 변경만 다시 적용해 저장합니다.
+    셀 단위 저장이 불가능한 파일이면 기존처럼 Workbook 전체를 저장합니다.
+    """
+    if _changed_since_load(workbook, excel_path):
+        trace_log.warning("불러온 뒤 다른 곳에서 엑셀 파일이 저장되어, 변경한 셀만 최신 파일에 다시 적용합니다.",
+                          path=excel_path)
+        workbook = _merge_into_fresh_workbook(workbook, excel_path, touched)
+    changes = {}
+    for sheet_name, row, col in touched:
+        cell = workbook[sheet_name].cell(row=row, column=col)
+        changes.setdefault(sheet_name, {})[(row, col)] = xlsx_patch.cell_change(cell)
+    previous_signature = file_signature(excel_path)
+    try:
+        with trace_log.phase('save', path=excel_path, mode='patch', cells=len(touched)):
+            xlsx_patch.patch_cells(excel_path, changes)
+    except Exception as e:
+        trace_log.warning(f"셀 단위 저장 불가, 전체 저장으로 대체합니다: {e}", path=excel_path)
+        _save_workbook_cached(workbook, excel_path, touched, undoes)
+        return
+    _remember_saved_workbook(workbook, excel_path, previous_signature, touched)
+    _journal_changes(workbook, excel_path, touched, undoes)
+
+
+def invalidate_workbook_cache(excel_path=None):
+    """특정 파일(또는 전체)의 캐시된 Workbook을 버립니다."""
+    with _workbook_cache_lock:
+        if excel_path is None:
+            _workbook_cache.clear()
+        else:
+            _workbook_cache.pop(_cache_key(excel_path), None)
+
+
+
+def cell_color_hex(cell):
+    """셀 배경색을 미리보기용 '#RRGGBB' 문자열로 변환합니다. (색 없음은 흰색)"""
+    color_hex = "#FFFFFF"
+    fill = getattr(cell, 'fill', None)
+    if fill and fill.fgColor:
+        color_info = fill.fgColor
+        if color_info.type == 'theme':
+            if color_info.theme == 6:
+                color_hex = "#E2EFDA"
+            elif color_info.theme == 3:
+                color_hex = "#DDEBF7"
+        elif color_info.type == 'rgb' and isinstance(color_info.rgb, str):
+            hex_val = color_info.rgb
+            color_hex = f"#{hex_val[2:]}" if len(hex_val) == 8 and hex_val.startswith(
+                "FF") else f"#{hex_val}"
+
+    # [핵심 수정] '투명한 검은색'으로 인식되는 경우를 일반 '흰색'으로 처리
+    if color_hex == '#00000000':
+        color_hex = '#FFFFFF'
+    return color_hex
+
+
+def _collect_company_data(cell_at, target_row, target_col, max_row, max_col):
+    """
+    기준(사업자번호) 셀 위치로부터 RELATIVE_OFFSETS에 정의된 셀들의 값과 색상을 읽습니다.
+    cell_at(row)는 target_col 열의 해당 행 셀을 돌려주는 함수입니다.
+    """
     found_data = {}
     for key, excel_label in COLUMN_MAP.items():
         if excel_label in RELATIVE_OFFSETS:
             row_offset = RELATIVE_OFFSETS[excel_label]
             read_row = target_row + row_offset
-            if 1 <= read_row <= sheet.max_row and 1 <= target_col <= sheet.max_column:
-                cell = sheet.cell(row=read_row, column=target_col)
-                value = cell.value
-
-                color_hex = "#FFFFFF"
-                if cell.fill and cell.fill.fgColor:
-                    color_info = cell.fill.fgColor
-                    if color_info.type == 'theme':
-                        if color_info.theme == 6:
-                            color_hex = "#E2EFDA"
-                        elif color_info.theme == 3:
-                            color_hex = "#DDEBF7"
-                    elif color_info.type == 'rgb' and isinstance(color_info.rgb, str):
-                        hex_val = color_info.rgb
-                        color_hex = f"#{hex_val[2:]}" if len(hex_val) == 8 and hex_val.startswith(
-                            "FF") else f"#{hex_val}"
-
-                # [핵심 수정] '투명한 검은색'으로 인식되는 경우를 일반 '흰색'으로 처리
-                if color_hex == '#00000000':
-                    color_hex = '#FFFFFF'
-
+            if 1 <= read_row <= max_row and 1 <= target_col <= max_col:
+                cell = cell_at(read_row)
+                value = getattr(cell, 'value', None)
+                color_hex = cell_color_hex(cell)
                 found_data[key] = {'value': value, 'color': color_hex}
-                print(f"    - '{excel_label}' (행:{read_row}, 열:{target_col}) -> 값: {value} | 색상: {color_hex}")
+                if trace_log.enabled(trace_log.DEBUG):
+                    trace_log.debug(f"    - '{excel_label}' (행:{read_row}, 열:{target_col}) -> 값: {value} | 색상: {color_hex}")
             else:
                 found_data[key] = {'value': 'N/A', 'color': '#FFFFFF'}
+    return found_data
+
 
-    print(f"\n  - [진단 결과] 최종적으로 반환하는 데이터: {found_data}")
-    print("--- [진단 종료] ---\n")
+@_locked_by_path
+def find_company_data(excel_path, biz_no_to_find, streaming=False, cancel_event=None):
+    """
+    엑셀 파일에서 업체를 찾아, 값과 함께 셀 배경색 정보도 반환합니다.
+    streaming=True 이면 서식 전체를 읽지 않는 2단계(읽기 전용) 조회를 사용합니다.
+    cancel_event(threading.Event)가 설정되면 검색을 멈추고 (None, "조회가 취소되었습니다.")를 반환합니다.
+    """
+    try:
+        if streaming:
+            return _find_company_data_streaming(excel_path, biz_no_to_find, cancel_event)
+        return _find_company_data_cached(excel_path, biz_no_to_find, cancel_event)
+    except LookupCancelled:
+        return None, "조회가 취소되었습니다."
+
+
+def _find_company_data_cached(excel_path, biz_no_to_find, cancel_event=None):
+    try:
+        workbook = _load_workbook_cached(excel_path)
+    except Exception as e:
+        return None, f"엑셀 파일 열기 오류: {e}"
+    _check_cancelled(cancel_event)
+
+    trace_log.debug(f"--- [진단] 엑셀에서 데이터 조회: {excel_path} / '{biz_no_to_find}' ---")
+
+    target_sheet_name, target_row, target_col = _locate_company(workbook, excel_path, biz_no_to_find,
+                                                                cancel_event=cancel_event)
+
+    if target_sheet_name is None:
+        trace_log.debug("  - [진단 결과] 엑셀의 모든 시트에서 해당 사업자번호를 찾지 못했습니다.")
+        return None, None
+
+    trace_log.debug(f"  - [진단] 업체 위치 찾기 성공!: '{target_sheet_name}' 시트, {target_row}행, {target_col}열")
+
+    sheet = workbook[target_sheet_name]
+    with trace_log.phase('read', path=excel_path, mode='full'):
+        found_data = _collect_company_data(lambda row: sheet.cell(row=row, column=target_col),
+                                           target_row, target_col, sheet.max_row, sheet.max_column)
     return found_data, None
 
 
+def _fetch_column_cells(sheet, target_row, target_col):
+    """읽기 전용 시트에서 target_col 열의 RELATIVE_OFFSETS 범위 셀만 행 번호별로 가져옵니다."""
+    first_row = max(1, target_row + min(RELATIVE_OFFSETS.values()))
+    last_row = target_row + max(RELATIVE_OFFSETS.values())
+    cells = {}
+    rows = sheet.iter_rows(min_row=first_row, max_row=last_row, min_col=target_col, max_col=target_col)
+    for row_idx, row in enumerate(rows, start=first_row):
+        cells[row_idx] = row[0] if row else None
+    return cells
+
+
+def _find_company_data_streaming(excel_path, biz_no_to_find, cancel_event=None):
+    """
+    2단계 조회:
+    1) 읽기 전용 + 값만 읽는 스트리밍으로 사업자번호 셀 위치를 찾고 (인덱스가 유효하면 생략)
+    2) 그 열의 RELATIVE_OFFSETS 행들만 서식(배경색)과 함께 읽습니다.
+    서식이 적용된 Workbook 전체를 메모리에 올리지 않으므로 큰 DB에서도 가볍게 동작합니다.
+    """
+    try:
+        with trace_log.phase('load', path=excel_path, mode='read_only'):
+            workbook = load_workbook(filename=excel_path, read_only=True, data_only=False)
+    except Exception as e:
+        return None, f"엑셀 파일 열기 오류: {e}"
+
+    try:
+        _check_cancelled(cancel_event)
+        key = normalize_biz_no(biz_no_to_find)
+        target_sheet_name, target_row, target_col = _locate_company(workbook, excel_path, biz_no_to_find,
+                                                                    verify=False, cancel_event=cancel_event)
+        if target_sheet_name is None:
+            return None, None
+
+        sheet = workbook[target_sheet_name]
+        with trace_log.phase('read', path=excel_path, mode='read_only'):
+            cells = _fetch_column_cells(sheet, target_row, target_col)
+        anchor = cells.get(target_row)
+        if anchor is None or anchor.value is None or normalize_biz_no(anchor.value) != key:
+            # 인덱스가 파일과 맞지 않음 -> 스트리밍 전체 검색으로 다시 찾기
+            target_sheet_name, target_row, target_col = _locate_company(workbook, excel_path, biz_no_to_find,
+                                                                        rebuild=True, cancel_event=cancel_event)
+            if target_sheet_name is None:
+                return None, None
+            sheet = workbook[target_sheet_name]
+            cells = _fetch_column_cells(sheet, target_row, target_col)
+
+        max_row = sheet.max_row or (target_row + max(RELATIVE_OFFSETS.values()))
+        max_col = sheet.max_column or target_col
+        found_data = _collect_company_data(cells.get, target_row, target_col, max_row, max_col)
+        return found_data, None
+    finally:
+        workbook.close()
+
+
+def iter_company_blocks(sheet, cancel_event=None):
+    """
+    읽기 전용 시트를 한 번 순회하며 업체 블록마다 (사업자번호 행, 열, cell_at)을 돌려줍니다.
+    cell_at(row)는 그 열의 해당 행 셀(없으면 None)을 돌려주는 함수이며, yield 직후에만 유효합니다.
+    업체 블록(RELATIVE_OFFSETS 범위)에 필요한 만큼의 행만 메모리에 둡니다.
+    """
+    min_offset, max_offset = min(RELATIVE_OFFSETS.values()), max(RELATIVE_OFFSETS.values())
+    buffer, anchors = {}, []
+
+    def blocks(anchor_row):
+        row_cells = buffer.get(anchor_row, ())
+        for col, anchor in enumerate(row_cells[1:], start=2):
+            if anchor.value is None or not BIZ_NO_PATTERN.fullmatch(normalize_biz_no(anchor.value)): continue
+            yield anchor_row, col, lambda r, c=col: buffer[r][c - 1] if r in buffer and c <= len(buffer[r]) else None
+
+    for row_idx, row in enumerate(sheet.iter_rows(min_row=1), start=1):
+        if row_idx % 200 == 0: _check_cancelled(cancel_event)
+        buffer[row_idx] = row
+        if row and _is_biz_no_label(row[0].value): anchors.append(row_idx)
+        while anchors and anchors[0] + max_offset <= row_idx:
+            yield from blocks(anchors.pop(0))
+        # 아직 처리하지 않은 기준 행과 앞으로 나올 기준 행에 필요 없는 오래된 행은 버림
+        keep_from = min(anchors[0] if anchors else row_idx + 1, row_idx + 1) + min_offset
+        for old_row in [r for r in buffer if r < keep_from]:
+            del buffer[old_row]
+    for anchor_row in anchors:
+        yield from blocks(anchor_row)
+
+
+# --- 일괄 조회 ---
+BIZ_NO_INPUT_PATTERN = re.compile(r'(?<!\d)\d{3}-?\d{2}-?\d{5}(?!\d)')
+
+
+def parse_biz_no_list(text):
+    """붙여 넣은 텍스트에서 사업자번호(123-45-67890 또는 1234567890)를 입력 순서대로, 중복 없이 꺼냅니다."""
+    return list(dict.fromkeys(normalize_biz_no(match) for match in BIZ_NO_INPUT_PATTERN.findall(str(text or ''))))
+
+
+def read_biz_no_csv(csv_path):
+    """CSV 파일의 모든 칸에서 사업자번호를 꺼냅니다. 반환: (사업자번호 목록, 오류 메시지)"""
+    for encoding in ('utf-8-sig', 'cp949'):
+        try:
+            with open(csv_path, 'r', encoding=encoding, newline='') as f:
+                return parse_biz_no_list('\n'.join(','.join(row) for row in csv.reader(f))), None
+        except UnicodeDecodeError:
+            continue
+        except (OSError, csv.Error) as e:
+            return [], f"CSV 파일 읽기 오류: {e}"
+    return [], "CSV 파일 인코딩을 알 수 없습니다. (UTF-8 또는 CP949로 저장해 주세요)"
+
+
+@_locked_by_path
+def _find_companies_in_file(excel_path, keys, cancel_event=None):
+    """
+    DB 파일 하나를 읽기 전용으로 한 번만 순회하며 keys(정규화된 사업자번호 집합)에 해당하는 업체를 모두 읽습니다.
+    모두 찾으면 나머지 행은 읽지 않습니다. 반환: {사업자번호: 업체 데이터}
+    """
+    found, remaining = {}, set(keys)
+    with trace_log.phase('load', path=excel_path, mode='read_only'):
+        workbook = load_workbook(filename=excel_path, read_only=True, data_only=False)
+    try:
+        with trace_log.phase('read', path=excel_path, mode='bulk') as trace:
+            for sheet in workbook.worksheets:
+                max_row, max_col = sheet.max_row, sheet.max_column
+                for row, col, cell_at in iter_company_blocks(sheet, cancel_event):
+                    key = normalize_biz_no(cell_at(row).value)
+                    if key not in remaining: continue
+                    remaining.discard(key)
+                    found[key] = _collect_company_data(cell_at, row, col, max_row or (row + max(RELATIVE_OFFSETS.values())),
+                                                       max_col or col)
+                    if not remaining: break
+                if not remaining: break
+            trace['wanted'], trace['found'] = len(keys), len(found)
+    finally:
+        workbook.close()
+    return found
+
+
+def find_companies_bulk(excel_paths, biz_nos, cancel_event=None):
+    """
+    여러 사업자번호를 모든 DB에서 한 번에 조회합니다. (DB 파일마다 순회 1회)
+    excel_paths: {DB 종류: 파일 경로}, biz_nos: 사업자번호 목록
+    반환: (결과 목록 [{'biz_no', 'db_type', 'data'}], 찾지 못한 사업자번호 목록, {DB 종류: 오류 메시지})
+    결과는 입력 순서를 따르며, 여러 DB에 있는 업체는 DB마다 한 줄씩 들어갑니다.
+    """
+    keys = list(dict.fromkeys(normalize_biz_no(biz_no) for biz_no in biz_nos))
+    found_by_db, errors = {}, {}
+    for db_type, excel_path in excel_paths.items():
+        if not excel_path or not os.path.exists(excel_path): continue
+        try:
+            found_by_db[db_type] = _find_companies_in_file(excel_path, keys, cancel_event)
+        except LookupCancelled:
+            raise
+        except Exception as e:
+            errors[db_type] = f"조회 중 오류 발생: {e}"
+    results, not_found = [], []
+    for key in keys:
+        hits = [{'biz_no': key, 'db_type': db_type, 'data': found[key]}
+                for db_type, found in found_by_db.items() if key in found]
+        results.extend(hits)
+        if not hits: not_found.append(key)
+    return results, not_found, errors
+
+
+# --- DB 간 중복 업체 비교 ---
+# 전기/통신/소방 DB를 파일마다 한 번씩만 읽어 사업자번호 -> 주요 항목 사전을 만들고,
+# 사전끼리 사업자번호로 합쳐(해시 조인) 여러 DB에 있는 업체와 값이 서로 다른 항목을 찾습니다.
+CROSS_DB_FIELDS = ('상호', '대표자', '부채비율', '유동비율')
+CROSS_DB_NAME_NOISE = re.compile(r'\s+|\(주\)|㈜|주식회사')
+
+
+def _comparable_text(value):
+    """공백과 (주)/㈜/주식회사 표기 차이는 같은 값으로 봅니다."""
+    return CROSS_DB_NAME_NOISE.sub('', str(value)) if value is not None else ''
+
+
+def _comparable_ratio(value):
+    try:
+        return round(float(str(value).replace('%', '').replace(',', '')), 4)
+    except (TypeError, ValueError):
+        return _comparable_text(value)
+
+
+@_locked_by_path
+def _read_cross_db_fields(excel_path, cancel_event=None):
+    """DB 파일 하나를 읽기 전용으로 한 번 순회하며 {사업자번호: {'cell': [시트, 행, 열], 항목: 값}}을 만듭니다."""
+    with trace_log.phase('load', path=excel_path, mode='read_only'):
+        workbook = load_workbook(filename=excel_path, read_only=True, data_only=False)
+    companies = {}
+    try:
+        with trace_log.phase('read', path=excel_path, mode='cross_db') as trace:
+            for sheet in workbook.worksheets:
+                for row, col, cell_at in iter_company_blocks(sheet, cancel_event):
+                    key = normalize_biz_no(cell_at(row).value)
+                    if key in companies: continue
+                    entry = {'cell': [sheet.title, row, col]}
+                    for label in CROSS_DB_FIELDS:
+                        read_row = row + RELATIVE_OFFSETS[label]
+                        entry[label] = getattr(cell_at(read_row), 'value', None) if read_row >= 1 else None
+                    companies[key] = entry
+            trace['companies'] = len(companies)
+    finally:
+        workbook.close()
+    return companies
+
+
+def cross_db_report(excel_paths, cancel_event=None):
+    """
+    여러 DB에 함께 있는 업체를 찾아 상호/대표자/부채비율/유동비율이 다른 항목을 보고합니다.
+    반환값: (항목 목록, {DB 종류: 오류 메시지})
+    각 항목: {'biz_no', 'entries': {DB 종류: {'cell', '상호', ...}}, 'mismatches': [다른 항목 라벨]}
+    (값이 다른 업체가 먼저, 그다음 사업자번호 순)
+    """
+    companies_by_db, errors = {}, {}
+    for db_type, excel_path in excel_paths.items():
+        if not excel_path or not os.path.exists(excel_path): continue
+        try:
+            companies_by_db[db_type] = _read_cross_db_fields(excel_path, cancel_event)
+        except LookupCancelled:
+            raise
+        except Exception as e:
+            errors[db_type] = f"엑셀 파일 읽기 오류: {e}"
+
+    joined = {}
+    for db_type, companies in companies_by_db.items():
+        for key, entry in companies.items():
+            joined.setdefault(key, {})[db_type] = entry
+
+    report = []
+    for key, entries in joined.items():
+        if len(entries) < 2: continue
+        mismatches = []
+        for label in CROSS_DB_FIELDS:
+            comparable = _comparable_ratio if '비율' in label else _comparable_text
+            if len({comparable(entry[label]) for entry in entries.values()}) > 1: mismatches.append(label)
+        report.append({'biz_no': key, 'entries': entries, 'mismatches': mismatches})
+    report.sort(key=lambda item: (not item['mismatches'], item['biz_no']))
+    return report, errors
+
+
+@_locked_by_path
 def update_company_data(excel_path, biz_no_to_find, update_data, db_type):
     """
     엑셀에서 업체를 찾아 데이터를 업데이트하고, 조건에 따라 서식을 변경합니다.
     """
     try:
-        workbook = load_workbook(filename=excel_path)
+        workbook = _load_workbook_cached(excel_path)
     except Exception as e:
         return None, f"엑셀 파일 열기 오류: {e}"
 
+    touched = _CellChanges()
+    updated_log, error = _apply_company_update(workbook, excel_path, biz_no_to_find, update_data, db_type, touched)
+    if error: return None, error
+
+    try:
+        _save_touched_cells(workbook, excel_path, touched)
+        return updated_log, None
+    except Exception as e:
+        return None, f"엑셀 파일 저장 오류: {e}"
+
+
+def _apply_company_update(workbook, excel_path, biz_no_to_find, update_data, db_type, touched=None):
+    """
+    메모리의 Workbook에서 업체 한 곳의 데이터를 수정합니다. (저장은 호출한 쪽에서 수행)
+    touched(_CellChanges)가 주어지면 수정한 셀과 수정 전 상태를 기록합니다.
+    반환값: (업데이트된 항목 라벨 목록, 오류 메시지)
+    """
     # --- 서식 정의 ---
     THEME_GREEN_COLOR = Color(type='theme', theme=6, tint=0.7999816888943144)
     GREEN_FILL = PatternFill(fgColor=THEME_GREEN_COLOR, fill_type="solid")
@@ -95,67 +810,320 @@ def update_company_data(excel_path, biz_no_to_find, update_data, db_type):
     DEFAULT_FONT = Font(color="000000", bold=False, size=9)
     HIGHLIGHT_FONT = Font(color="FF0000", bold=True, size=9)
 
-    # --- 업체 위치 찾기 (기존과 동일) ---
-    target_row, target_col, target_sheet_name = -1, -1, None;
-    found = False
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        for row in sheet.iter_rows():
-            for cell in row:
-                if cell.value is None: continue
-                if str(cell.value).strip().replace('-', '') == biz_no_to_find.strip().replace('-', ''):
-                    target_row, target_col, target_sheet_name = cell.row, cell.column, sheet_name
-                    found = True;
-                    break
-            if found: break
-        if found: break
-    if not found: return None, f"엑셀 파일에서 사업자번호 '{biz_no_to_find}'를 찾을 수 없습니다."
+    # --- 업체 위치 찾기 (사업자번호 인덱스 사용) ---
+    target_sheet_name, target_row, target_col = _locate_company(workbook, excel_path, biz_no_to_find)
+    if target_sheet_name is None: return None, f"엑셀 파일에서 사업자번호 '{biz_no_to_find}'를 찾을 수 없습니다."
 
     # --- 데이터 업데이트 및 서식 적용 ---
     sheet = workbook[target_sheet_name]
     updated_log = []
+    with trace_log.phase('write', path=excel_path, biz_no=biz_no_to_find) as trace:
+        for key, excel_label in COLUMN_MAP.items():
+            if excel_label in RELATIVE_OFFSETS:
+                row_offset = RELATIVE_OFFSETS[excel_label]
+                update_row = target_row + row_offset
+                if 1 <= update_row <= sheet.max_row and 1 <= target_col <= sheet.max_column:
+                    cell = sheet.cell(row=update_row, column=target_col)
+                    if touched is not None: touched.record(target_sheet_name, cell)
+                    if key not in ['상호', '신용평가']: cell.fill = GREEN_FILL
+
+                    if key in update_data and update_data[key]:
+                        cell.font = DEFAULT_FONT  # 우선 기본 폰트로 초기화
+                        value_str = str(update_data[key]).replace(",", "").replace("%", "")
+
+                        try:
+                            numeric_value = 0
+                            if '비율' in key:
+                                numeric_value = float(value_str)
+                                cell.value = numeric_value / 100.0
+                                cell.number_format = '0.00%'
+                            elif key in ['시평액', '3년실적', '5년실적']:
+                                cell.value = int(float(value_str)) * 1000
+                            else:
+                                cell.value = update_data[key]
+                            updated_log.append(excel_label)
+
+                            if db_type and key in ['부채비율', '유동비율']:
+                                thresholds = RATIO_THRESHOLDS.get(db_type, {}).get(key, {})
+                                if 'max' in thresholds and numeric_value > thresholds['max']:
+                                    cell.font = HIGHLIGHT_FONT
+                                elif 'min' in thresholds and numeric_value < thresholds['min']:
+                                    cell.font = HIGHLIGHT_FONT
+
+                        except (ValueError, TypeError):
+                            pass
+        trace['cells'] = len(updated_log)
+
+    return updated_log, None
 
-    for key, excel_label in COLUMN_MAP.items():
-        if excel_label in RELATIVE_OFFSETS:
-            row_offset = RELATIVE_OFFSETS[excel_label]
-            update_row = target_row + row_offset
-            if 1 <= update_row <= sheet.max_row and 1 <= target_col <= sheet.max_column:
-                cell = sheet.cell(row=update_row, column=target_col)
-                if key not in ['상호', '신용평가']: cell.fill = GREEN_FILL
-
-                if key in update_data and update_data[key]:
-                    cell.font = DEFAULT_FONT  # 우선 기본 폰트로 초기화
-                    value_str = str(update_data[key]).replace(",", "").replace("%", "")
-
-                    try:
-                        numeric_value = 0
-                        if '비율' in key:
-                            numeric_value = float(value_str)
-                            cell.value = numeric_value / 100.0
-                            cell.number_format = '0.00%'
-                        elif key in ['시평액', '3년실적', '5년실적']:
-                            cell.value = int(float(value_str)) * 1000
-                        else:
-                            cell.value = update_data[key]
-                        updated_log.append(excel_label)
 
-                        if db_type and key in ['부채비율', '유동비율']:
-                            thresholds = RATIO_THRESHOLDS.get(db_type, {}).get(key, {})
-                            if 'max' in thresholds and numeric_value > thresholds['max']:
-                                cell.font = HIGHLIGHT_FONT
-                            elif 'min' in thresholds and numeric_value < thresholds['min']:
-                                cell.font = HIGHLIGHT_FONT
+def batch_update_company_data(entries, excel_paths):
+    """
+    여러 업체의 업데이트를 한 번에 처리합니다.
+    - entries: [(사업자번호, update_data, db_type), ...]
+    - excel_paths: {'전기': 경로, '통신': 경로, '소방': 경로}
+    DB 파일별로 묶어 파일마다 한 번만 열고, 메모리에서 모두 수정한 뒤 한 번만 저장합니다.
+    반환값: 입력 순서대로 [{'biz_no', 'db_type', 'updated', 'error'}, ...]
+    """
+    results = [{'biz_no': biz_no, 'db_type': db_type, 'updated': None, 'error': None}
+               for biz_no, _, db_type in entries]
+
+    entries_by_path = {}
+    for position, (biz_no, update_data, db_type) in enumerate(entries):
+        excel_path = excel_paths.get(db_type) if db_type else None
+        if not excel_path:
+            results[position]['error'] = f"'{db_type}' DB 경로가 설정되지 않았습니다."
+            continue
+        entries_by_path.setdefault(excel_path, []).append((position, biz_no, update_data, db_type))
 
-                    except (ValueError, TypeError):
-                        pass
+    with change_journal.batch('batch_update_company_data'):
+        for excel_path, file_entries in entries_by_path.items():
+            _update_companies_in_file(excel_path, file_entries, results)
+    return results
 
+
+@_locked_by_path
+def _update_companies_in_file(excel_path, file_entries, results):
     try:
-        workbook.save(excel_path)
-        return updated_log, None
+        workbook = _load_workbook_cached(excel_path)
+    except Exception as e:
+        for position, *_ in file_entries:
+            results[position]['error'] = f"엑셀 파일 열기 오류: {e}"
+        return
+
+    applied, touched = [], _CellChanges()
+    for position, biz_no, update_data, db_type in file_entries:
+        updated_log, error = _apply_company_update(workbook, excel_path, biz_no, update_data, db_type, touched)
+        if error:
+            results[position]['error'] = error
+        else:
+            results[position]['updated'] = updated_log
+            applied.append(position)
+
+    if not applied: return
+    try:
+        _save_touched_cells(workbook, excel_path, touched)
+    except Exception as e:
+        for position in applied:
+            results[position]['updated'] = None
+            results[position]['error'] = f"엑셀 파일 저장 오류: {e}"
+
+
+# --- 연말 색상 규칙 (셀 단위) ---
+# 두 일괄 색상 갱신(연말 상태 색상 / 신용평가 유효기간)과 연말 통합 정리가 같은 규칙을 공유합니다.
+STATUS_GREEN_COLOR = Color(type='theme', theme=6, tint=0.7999816888943144)
+STATUS_BLUE_COLOR = Color(type='theme', theme=3, tint=0.7999816888943144)
+STATUS_GREEN_FILL = PatternFill(fgColor=STATUS_GREEN_COLOR, fill_type="solid")
+STATUS_BLUE_FILL = PatternFill(fgColor=STATUS_BLUE_COLOR, fill_type="solid")
+NO_FILL = PatternFill(fill_type=None)  # 색 없음
+RECOLOR_FILLS = {'green': STATUS_GREEN_FILL, 'blue': STATUS_BLUE_FILL, 'none': NO_FILL}
+CREDIT_END_DATE_PATTERN = re.compile(r'~(\d{2,4}\.\d{2}\.\d{2})')
+CREDIT_START_DATE_PATTERN = re.compile(r'(\d{2,4}\.\d{2}\.\d{2})~')
+
+
+def _is_credit_row(row):
+    """행의 첫 번째 셀(A열) 라벨이 '신용평가'인지 확인합니다."""
+    label_cell = row[0]
+    return bool(label_cell.value and '신용평가' in str(label_cell.value))
+
+
+def _classify_fill(fill):
+    """배경을 (색 분류 'green'/'blue'/None, 배경 없음 여부, 이미 같은 결과인 규칙 배경 또는 None)으로 분류합니다."""
+    if fill is None: return _FillStyleIds.EMPTY
+    color = None
+    if fill.fgColor == STATUS_GREEN_COLOR: color = 'green'
+    elif fill.fgColor == STATUS_BLUE_COLOR: color = 'blue'
+    empty = fill.fill_type is None
+    if empty: match = 'none'
+    elif fill.fill_type == 'solid' and color: match = color
+    else: match = None
+    return color, empty, match
+
+
+class _FillStyleIds:
+    """
+    Workbook 스타일시트의 배경(fill) 목록을 한 번만 분류해 두고,
+    셀은 fillId 번호만으로 판별하고 미리 등록한 번호로 바꿉니다.
+    (셀마다 Color 객체를 비교하거나 PatternFill을 새로 등록/중복 검사하지 않음)
+    """
+    EMPTY = (None, True, 'none')  # 읽기 전용 모드의 빈 셀(EmptyCell): 배경 없음
+
+    def __init__(self, workbook):
+        fills = workbook._fills
+        # 규칙의 결과로 쓸 배경은 미리 등록해 번호를 받아 둠 (읽기 전용 Workbook은 쓰지 않으므로 생략)
+        self.target_ids = {} if workbook.read_only else {key: fills.add(fill) for key, fill in RECOLOR_FILLS.items()}
+        # fillId -> (색 분류 'green'/'blue'/None, 배경 없음 여부, 이미 같은 결과인 규칙 배경 또는 None)
+        self.classes = [_classify_fill(fill) for fill in fills]
+
+    def classify(self, cell):
+        if hasattr(cell, '_style_id'):  # 읽기 전용 셀
+            return self.classes[cell.style_array.fillId]
+        if not hasattr(cell, 'parent'):  # 읽기 전용 모드의 빈 셀
+            return self.EMPTY
+        return self.classes[cell._style.fillId if cell._style else 0]
+
+    def assign(self, cell, target):
+        if cell._style is None: cell._style = StyleArray()
+        cell._style.fillId = self.target_ids[target]
+
+
+def _rollover_target(cell, fill_class):
+    """
+    연말 상태 색상 규칙: 바꿔야 할 새 배경('green'/'blue'/'none')을 반환하고, 그대로 두면 None.
+    - 데이터가 있는 셀: 초록 -> 파랑, 파랑 -> 흰색
+    - 데이터가 없는 셀: 색이 있으면 흰색(색 없음)으로 정리
+    """
+    color, empty, _ = fill_class
+    if cell.value is None or str(cell.value).strip() == "":
+        return None if empty else 'none'
+    if color == 'green':
+        return 'blue'
+    if color == 'blue':
+        return 'none'
+    return None
+
+
+def _parse_credit_date(text):
+    try:
+        return datetime.strptime(text, '%y.%m.%d').date()
+    except ValueError:
+        return None
+
+
+def parse_credit_rating(value):
+    """
+    신용평가 셀 값('A+\n(24.01.01~25.12.31)')을 (등급, 시작일, 만료일)로 나눕니다.
+    날짜를 읽을 수 없으면 해당 항목은 None입니다.
+    """
+    text = str(value).strip() if value is not None else ""
+    rating = text.split('(')[0].strip()
+    start_match = CREDIT_START_DATE_PATTERN.search(text)
+    end_match = CREDIT_END_DATE_PATTERN.search(text)
+    start = _parse_credit_date(start_match.group(1)) if start_match else None
+    end = _parse_credit_date(end_match.group(1)) if end_match else None
+    return rating, start, end
+
+
+def _credit_expiry_target(value, today):
+    """
+    신용평가 유효기간 규칙: 새 배경('green'/'blue'/'none')을 반환하고, 판단할 수 없으면 None.
+    - 빈 셀은 '색 없음', 만료일이 지났으면 파랑, 아니면 초록
+    """
+    if value is None or str(value).strip() == "":
+        return 'none'
+    _, _, expiry_date = parse_credit_rating(value)
+    if expiry_date is None:
+        return None
+    return 'blue' if expiry_date < today else 'green'
+
+
+def _iter_recolor_targets(workbook, fill_ids, rollover=False, credit=False, today=None):
+    """
+    모든 시트를 한 번만 순회하며 (시트, 셀, 규칙, 새 배경, 현재 배경 분류)를 돌려줍니다.
+    (A열 라벨과 1행 헤더는 제외. 일반 Workbook과 읽기 전용 Workbook 모두에서 동작)
+    """
+    today = today or datetime.now().date()
+    classify = fill_ids.classify
+    for sheet in workbook.worksheets:
+        for row in sheet.iter_rows(min_row=2):
+            if not row: continue
+            if _is_credit_row(row):
+                if not credit: continue
+                for cell in row[1:]:
+                    target = _credit_expiry_target(cell.value, today)
+                    if target is not None: yield sheet, cell, 'credit', target, classify(cell)
+            elif rollover:
+                for cell in row[1:]:
+                    fill_class = classify(cell)
+                    target = _rollover_target(cell, fill_class)
+                    if target is not None: yield sheet, cell, 'rollover', target, fill_class
+
+
+def _recolor_workbook(workbook, rollover=False, credit=False, today=None, touched=None):
+    """
+    지정한 규칙을 Workbook에 바로 적용합니다. touched(_CellChanges)가 주어지면 수정 전 상태를 기록합니다.
+    반환값: {'rollover': 바뀐 셀 수, 'credit': 바뀐 셀 수}
+    """
+    fill_ids = _FillStyleIds(workbook)
+    counts = {'rollover': 0, 'credit': 0}
+    for sheet, cell, rule, target, _ in _iter_recolor_targets(workbook, fill_ids, rollover, credit, today):
+        if touched is not None: touched.record(sheet.title, cell)
+        fill_ids.assign(cell, target)
+        counts[rule] += 1
+    return counts
+
+
+# --- 색상 갱신 미리보기 (변경 목록) ---
+# 읽기 전용 스트리밍으로 '바뀔 셀'만 모은 변경 목록을 만들고, 확인 후 그 목록을 그대로 적용합니다.
+# 변경 목록: {'path', 'signature', 'changes': [(시트명, 행, 열, 기존 색, 새 배경, 규칙)],
+#            'by_sheet': {시트명: 수}, 'by_rule': {규칙: 수}}
+
+def plan_recolor(excel_path, rollover=False, credit=False, today=None):
+    """
+    파일을 수정하지 않고, 색상 규칙을 적용하면 실제로 바뀔 셀 목록을 만듭니다.
+    이미 규칙의 결과와 같은 색인 셀은 목록에 넣지 않습니다.
+    반환값: (변경 목록, 오류 메시지)
+    """
+    try:
+        signature = file_signature(excel_path)
+        with trace_log.phase('load', path=excel_path, mode='read_only'):
+            workbook = load_workbook(filename=excel_path, read_only=True, data_only=False)
+    except Exception as e:
+        return None, f"엑셀 파일 열기 오류: {e}"
+
+    changes, by_sheet, by_rule = [], {}, {'rollover': 0, 'credit': 0}
+    try:
+        with trace_log.phase('plan', path=excel_path) as trace:
+            fill_ids = _FillStyleIds(workbook)
+            for sheet, cell, rule, target, fill_class in _iter_recolor_targets(workbook, fill_ids, rollover, credit, today):
+                if fill_class[2] == target: continue  # 이미 규칙의 결과와 같은 배경
+                changes.append((sheet.title, cell.row, cell.column, cell_color_hex(cell), target, rule))
+                by_sheet[sheet.title] = by_sheet.get(sheet.title, 0) + 1
+                by_rule[rule] += 1
+            trace['cells'] = len(changes)
+    except Exception as e:
+        return None, f"엑셀 파일 분석 오류: {e}"
+    finally:
+        workbook.close()
+    return {'path': excel_path, 'signature': signature, 'changes': changes,
+            'by_sheet': by_sheet, 'by_rule': by_rule}, None
+
+
+def apply_recolor_plan(plan):
+    """
+    plan_recolor로 만든 변경 목록을 다시 계산하지 않고 그대로 적용합니다.
+    - 바뀔 셀이 없으면 파일을 열지 않습니다.
+    - 미리보기 이후 파일이 바뀌었으면 적용하지 않습니다. (다시 미리보기 필요)
+    반환값: (적용한 셀 수, 오류 메시지)
+    """
+    if not plan['changes']: return 0, None
+    return _apply_recolor_plan(plan['path'], plan)
+
+
+@_locked_by_path
+def _apply_recolor_plan(excel_path, plan):
+    try:
+        if file_signature(excel_path) != plan['signature']:
+            return None, "미리보기 이후 엑셀 파일이 변경되었습니다. 다시 미리보기를 실행해주세요."
+        workbook = _load_workbook_cached(excel_path)
+    except Exception as e:
+        return None, f"엑셀 파일 열기 오류: {e}"
+
+    touched, fill_ids = _CellChanges(), _FillStyleIds(workbook)
+    with trace_log.phase('write', path=excel_path, task='apply_recolor_plan') as trace:
+        for sheet_name, row, col, _, target, _ in plan['changes']:
+            cell = workbook[sheet_name].cell(row=row, column=col)
+            touched.record(sheet_name, cell)
+            fill_ids.assign(cell, target)
+        trace['cells'] = len(touched)
+    try:
+        _save_touched_cells(workbook, excel_path, touched)
+        return len(touched), None
     except Exception as e:
         return None, f"엑셀 파일 저장 오류: {e}"
 
 
+@_locked_by_path
 def batch_update_colors(excel_path):
     """
     엑셀 파일의 모든 데이터 셀을 순회하며, 상태 색상을 갱신합니다.
@@ -164,53 +1132,29 @@ def batch_update_colors(excel_path):
     - 데이터가 없는 셀: 모두 흰색(색 없음)으로 정리
     """
     try:
-        workbook = load_workbook(filename=excel_path)
+        workbook = _load_workbook_cached(excel_path)
     except Exception as e:
         return f"엑셀 파일 열기 오류: {e}"
 
-    GREEN_COLOR = Color(type='theme', theme=6, tint=0.7999816888943144)
-    BLUE_COLOR = Color(type='theme', theme=3, tint=0.7999816888943144)
-    NEW_BLUE_FILL = PatternFill(fgColor=BLUE_COLOR, fill_type="solid")
-    NO_FILL = PatternFill(fill_type=None)
-
-    update_count = 0
-    for sheet in workbook.worksheets:
-        # 데이터가 있는 모든 행을 순회 (min_row=2는 헤더 제외)
-        for row in sheet.iter_rows(min_row=2):
-            # [핵심] 행의 첫 번째 셀(A열)의 값을 확인하여 '신용평가'인지 검사
-            label_cell = row[0]
-            if label_cell.value and '신용평가' in str(label_cell.value):
-                continue  # '신용평가'가 포함된 행은 건너뜀
-
-            # '신용평가' 행이 아닐 경우에만, 기존 색상 변경 로직 실행
-            # (A열을 제외한 B열부터 순회)
-            for cell in row[1:]:
-                current_color = cell.fill.fgColor if cell.fill else None
-
-                if cell.value is None or str(cell.value).strip() == "":
-                    if cell.fill and cell.fill.fill_type is not None:
-                        cell.fill = NO_FILL
-                        update_count += 1
-                else:
-                    if current_color == GREEN_COLOR:
-                        cell.fill = NEW_BLUE_FILL
-                        update_count += 1
-                    elif current_color == BLUE_COLOR:
-                        cell.fill = NO_FILL
-                        update_count += 1
-    try:
-        workbook.save(excel_path)
+    touched = _CellChanges()
+    with trace_log.phase('write', path=excel_path, task='batch_update_colors') as trace:
+        update_count = _recolor_workbook(workbook, rollover=True, touched=touched)['rollover']
+        trace['cells'] = update_count
+    try:
+        with change_journal.batch('batch_update_colors'):
+            _save_workbook_cached(workbook, excel_path, touched)
         return f"총 {update_count}개 셀의 서식을 성공적으로 업데이트했습니다."
     except Exception as e:
         return f"엑셀 파일 저장 오류: {e}"
 
+@_locked_by_path
 def update_credit_rating_only(excel_path, biz_no_to_find, new_credit_rating):
     """
     엑셀 파일에서 사업자번호로 업체를 찾아 '신용평가' 항목만 업데이트하고,
     해당 셀을 초록색으로 칠합니다.
     """
     try:
-        workbook = load_workbook(filename=excel_path)
+        workbook = _load_workbook_cached(excel_path)
     except Exception as e:
         return None, f"엑셀 파일 열기 오류: {e}"
 
@@ -218,21 +1162,10 @@ def update_credit_rating_only(excel_path, biz_no_to_find, new_credit_rating):
     THEME_GREEN_COLOR = Color(type='theme', theme=6, tint=0.7999816888943144)
     GREEN_FILL = PatternFill(fgColor=THEME_GREEN_COLOR, fill_type="solid")
 
-    # --- 업체 위치 찾기 ---
-    target_row, target_col, target_sheet_name = -1, -1, None
-    found = False
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        for row in sheet.iter_rows():
-            for cell in row:
-                if cell.value is None: continue
-                if str(cell.value).strip().replace('-', '') == biz_no_to_find.strip().replace('-', ''):
-                    target_row, target_col, target_sheet_name = cell.row, cell.column, sheet_name
-                    found = True; break
-            if found: break
-        if found: break
-    
-    if not found:
+    # --- 업체 위치 찾기 (사업자번호 인덱스 사용) ---
+    target_sheet_name, target_row, target_col = _locate_company(workbook, excel_path, biz_no_to_find)
+
+    if target_sheet_name is None:
         return f"해당 업체를 찾을 수 없습니다.", None
 
     # --- '신용평가' 셀 찾아서 업데이트 ---
@@ -248,63 +1181,274 @@ def update_credit_rating_only(excel_path, biz_no_to_find, new_credit_rating):
         return None, f"'신용평가' 셀의 위치({update_row}행)가 유효하지 않습니다."
         
     cell_to_update = sheet.cell(row=update_row, column=target_col)
+    touched = _CellChanges()
+    touched.record(target_sheet_name, cell_to_update)
     cell_to_update.value = new_credit_rating
     
     # [수정] 셀 채우기를 초록색으로 적용
     cell_to_update.fill = GREEN_FILL
 
     try:
-        workbook.save(excel_path)
+        _save_touched_cells(workbook, excel_path, touched)
         return "업데이트 완료!", None
     except Exception as e:
         return None, f"엑셀 파일 저장 오류: {e}"
 
 
-# [ocr_logic.py 파일에서 batch_update_credit_rating_colors 함수를 이걸로 교체]
-
+@_locked_by_path
 def batch_update_credit_rating_colors(excel_path):
     """
     (수정) '신용평가' 행을 찾아 유효기간에 따라 색상을 갱신합니다.
     - 빈 셀은 '색 없음'으로 처리합니다.
     """
     try:
-        workbook = load_workbook(filename=excel_path)
+        workbook = _load_workbook_cached(excel_path)
     except Exception as e:
         return f"엑셀 파일 열기 오류: {e}"
 
-    GREEN_FILL = PatternFill(fgColor=Color(type='theme', theme=6, tint=0.7999816888943144), fill_type="solid")
-    BLUE_FILL = PatternFill(fgColor=Color(type='theme', theme=3, tint=0.7999816888943144), fill_type="solid")
-    NO_FILL = PatternFill(fill_type=None)  # 색 없음을 위한 스타일
-    today = datetime.now().date()
-    update_count = 0
-
-    for sheet in workbook.worksheets:
-        for row in sheet.iter_rows(min_row=2):
-            label_cell = row[0]
-            if label_cell.value and '신용평가' in str(label_cell.value):
-                for cell in row[1:]:
-                    # [핵심 수정] 셀이 비어있는 경우, 색을 없애고 다음 셀로 넘어감
-                    if cell.value is None or str(cell.value).strip() == "":
-                        cell.fill = NO_FILL
-                        update_count += 1
-                        continue
-
-                    match = re.search(r'~(\d{2,4}\.\d{2}\.\d{2})', str(cell.value))
-                    if not match:
-                        continue
-
-                    end_date_str = match.group(1)
-                    try:
-                        expiry_date = datetime.strptime(end_date_str, '%y.%m.%d').date()
-                        if expiry_date < today:
-                            cell.fill = BLUE_FILL
-                        else:
-                            cell.fill = GREEN_FILL
-                        update_count += 1
-                    except ValueError:
-                        continue
+    touched = _CellChanges()
+    with trace_log.phase('write', path=excel_path, task='batch_update_credit_rating_colors') as trace:
+        update_count = _recolor_workbook(workbook, credit=True, touched=touched)['credit']
+        trace['cells'] = update_count
     try:
-        workbook.save(excel_path)
+        with change_journal.batch('batch_update_credit_rating_colors'):
+            _save_workbook_cached(workbook, excel_path, touched)
         return f"총 {update_count}개의 신용평가 셀 색상을 갱신했습니다."
     except Exception as e:
-        return f"엑셀 파일 저장 오류: {e}"
\ No newline at end of file
+        return f"엑셀 파일 저장 오류: {e}"
+
+
+@_locked_by_path
+def year_end_maintenance(excel_path):
+    """
+    연말 상태 색상 갱신과 신용평가 유효기간 갱신을 한 번의 불러오기/순회/저장으로 처리합니다.
+    반환값: ({'rollover': 상태 색상 변경 수, 'credit': 신용평가 색상 변경 수}, 오류 메시지)
+    """
+    try:
+        workbook = _load_workbook_cached(excel_path)
+    except Exception as e:
+        return None, f"엑셀 파일 열기 오류: {e}"
+
+    touched = _CellChanges()
+    with trace_log.phase('write', path=excel_path, task='year_end_maintenance') as trace:
+        counts = _recolor_workbook(workbook, rollover=True, credit=True, touched=touched)
+        trace.update(counts)
+    try:
+        with change_journal.batch('year_end_maintenance'):
+            _save_workbook_cached(workbook, excel_path, touched)
+        return counts, None
+    except Exception as e:
+        return None, f"엑셀 파일 저장 오류: {e}"
+
+
+# --- 변경 되돌리기 (change_journal) ---
+def undo_last_change(excel_path=None):
+    """
+    가장 최근에 저장한 변경(저장 1회 분량)을 되돌립니다. excel_path를 주면 그 파일의 변경만 봅니다.
+    반환값: (되돌린 저널 기록, 오류 메시지)
+    """
+    records = [record for record in change_journal.undoable_records()
+               if excel_path is None or _cache_key(record['path']) == _cache_key(excel_path)]
+    if not records: return None, "되돌릴 변경 내역이 없습니다."
+    return _revert_record(records[0]['path'], records[0])
+
+
+def rollback_batch(batch_id):
+    """
+    일괄 작업 하나(change_journal.batch)로 저장한 변경을 최신 것부터 모두 되돌립니다.
+    반환값: (되돌린 저장 횟수, 오류 메시지 - 일부만 되돌렸으면 실패한 파일별 메시지)
+    """
+    records = [record for record in change_journal.undoable_records() if record['batch'] == batch_id]
+    if not records: return 0, "되돌릴 변경 내역이 없습니다."
+    reverted, errors = 0, []
+    with change_journal.batch('rollback'):
+        for record in records:
+            _, error = _revert_record(record['path'], record)
+            if error:
+                errors.append(f"{os.path.basename(record['path'])}: {error}")
+            else:
+                reverted += 1
+    return reverted, "\n".join(errors) or None
+
+
+@_locked_by_path
+def _revert_record(excel_path, record):
+    """
+    저널 기록의 셀들을 수정 전 상태로 되돌립니다.
+    기록 이후 다시 바뀐 셀이 하나라도 있으면, 그 변경을 덮어쓰지 않도록 아무 셀도 되돌리지 않습니다.
+    """
+    try:
+        workbook = _load_workbook_cached(excel_path)
+    except Exception as e:
+        return None, f"엑셀 파일 열기 오류: {e}"
+
+    cells, changed_since = [], []
+    for sheet_name, row, col, before, after in change_journal.iter_cells(record):
+        if sheet_name not in workbook.sheetnames:
+            changed_since.append(f"'{sheet_name}' 시트 없음"); continue
+        cell = workbook[sheet_name].cell(row=row, column=col)
+        if change_journal.encode_state(xlsx_patch.cell_change(cell)) != after:
+            changed_since.append(f"{sheet_name}!{cell.coordinate}"); continue
+        cells.append((sheet_name, cell, before))
+    if changed_since:
+        shown = ", ".join(changed_since[:10]) + (f" 외 {len(changed_since) - 10}개" if len(changed_since) > 10 else "")
+        return None, f"이후에 다시 수정된 셀이 있어 되돌릴 수 없습니다: {shown}"
+
+    touched = _CellChanges()
+    with trace_log.phase('write', path=excel_path, task='undo', cells=len(cells)):
+        for sheet_name, cell, before in cells:
+            touched.record(sheet_name, cell)
+            _apply_cell_state(cell, change_journal.decode_state(before))
+    try:
+        _save_touched_cells(workbook, excel_path, touched, undoes=record['id'])
+        return record, None
+    except Exception as e:
+        invalidate_workbook_cache(excel_path)
+        return None, f"엑셀 파일 저장 오류: {e}"
+
+
+# --- 신용평가 만료 인덱스 (사이드카 파일) ---
+# 엑셀 DB 옆에 '<DB파일>.creditindex.json' 파일을 두고, 정규화된 사업자번호마다
+# 상호/신용평가 값(등급, 시작일, 만료일)/셀 위치를 저장합니다.
+# 만료 현황 조회는 이 인덱스만 보므로 엑셀 파일을 열지 않습니다.
+# 이 프로그램이 저장할 때마다 메모리의 Workbook에서 값을 다시 읽어 갱신하고,
+# 다른 프로그램이 파일을 바꾼 경우(서명 불일치)에는 읽기 전용 스트리밍으로 한 번 다시 만듭니다.
+CREDIT_INDEX_SUFFIX = ".creditindex.json"
+
+
+def _credit_entry(name, value, cell_position):
+    rating, start, end = parse_credit_rating(value)
+    return {'name': name, 'value': None if value is None else str(value), 'rating': rating,
+            'start': start.isoformat() if start else None, 'end': end.isoformat() if end else None,
+            'cell': list(cell_position)}
+
+
+def _read_credit_index(excel_path):
+    try:
+        with open(excel_path + CREDIT_INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_credit_index(excel_path, entries):
+    try:
+        index = {'signature': file_signature(excel_path), 'entries': entries}
+        with open(excel_path + CREDIT_INDEX_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        return index
+    except (OSError, ValueError) as e:
+        trace_log.warning(f"신용평가 인덱스 저장 오류: {e}", path=excel_path)
+        return None
+
+
+def _refresh_credit_index(workbook, excel_path, previous_signature, touched):
+    """
+    저장 직후 호출합니다. 저장 직전 파일(previous_signature)로 만든 인덱스이면, 이번 저장에서 바뀐 셀(touched)이
+    속한 업체의 상호와 신용평가 값만 메모리의 Workbook에서 다시 읽습니다.
+    인덱스가 이미 오래되었거나 바뀐 셀을 모르면(touched=None) 다음 조회 때 새로 만들도록 지웁니다.
+    """
+    index = _read_credit_index(excel_path)
+    if index is None: return
+    if touched is None or index.get('signature') != previous_signature:
+        try:
+            os.remove(excel_path + CREDIT_INDEX_SUFFIX)
+        except OSError as e:
+            trace_log.warning(f"오래된 신용평가 인덱스 삭제 오류: {e}", path=excel_path)
+        return
+    name_offset = RELATIVE_OFFSETS['상호'] - RELATIVE_OFFSETS['신용평가']
+    entries = index.get('entries', {})
+    for key, entry in entries.items():
+        sheet_name, row, col = entry['cell']
+        if (sheet_name, row, col) not in touched and (sheet_name, row + name_offset, col) not in touched: continue
+        sheet = workbook[sheet_name]
+        name = sheet.cell(row=row + name_offset, column=col).value if row + name_offset >= 1 else None
+        entries[key] = _credit_entry(name, sheet.cell(row=row, column=col).value, entry['cell'])
+    _save_credit_index(excel_path, entries)
+
+
+@_locked_by_path
+def _build_credit_index(excel_path):
+    """읽기 전용 스트리밍으로 모든 업체의 상호/신용평가 셀을 읽어 인덱스를 새로 만듭니다."""
+    signature = file_signature(excel_path)
+    with trace_log.phase('load', path=excel_path, mode='read_only'):
+        workbook = load_workbook(filename=excel_path, read_only=True, data_only=False)
+    try:
+        with trace_log.phase('credit_index', path=excel_path) as trace:
+            biz_index = _load_biz_index(excel_path)
+            if biz_index is not None:
+                positions = biz_index['entries']
+            else:
+                positions = _scan_all_biz_numbers(workbook, excel_path)
+                _save_biz_index(excel_path, positions)
+
+            # 시트별로 필요한 행만 표시해 두고, 시트마다 한 번씩만 순회
+            credit_offset, name_offset = RELATIVE_OFFSETS['신용평가'], RELATIVE_OFFSETS['상호']
+            wanted = {}
+            for key, (sheet_name, row, col) in positions.items():
+                rows = wanted.setdefault(sheet_name, {})
+                rows.setdefault(row + credit_offset, []).append((key, col, 'credit'))
+                if row + name_offset >= 1: rows.setdefault(row + name_offset, []).append((key, col, 'name'))
+
+            names, credit_cells = {}, {}
+            for sheet_name, rows in wanted.items():
+                if sheet_name not in workbook.sheetnames: continue
+                sheet = workbook[sheet_name]
+                for row_idx, row in enumerate(sheet.iter_rows(min_row=1, max_row=max(rows)), start=1):
+                    for key, col, kind in rows.get(row_idx, ()):
+                        cell = row[col - 1] if col <= len(row) else None
+                        if kind == 'name':
+                            names[key] = getattr(cell, 'value', None)
+                        else:
+                            credit_cells[key] = (cell, (sheet_name, row_idx, col))
+
+            entries = {}
+            for key, (cell, position) in credit_cells.items():
+                entries[key] = _credit_entry(names.get(key), getattr(cell, 'value', None), position)
+            trace['companies'] = len(entries)
+    finally:
+        workbook.close()
+    return _save_credit_index(excel_path, entries) or {'signature': signature, 'entries': entries}
+
+
+def _get_credit_index(excel_path):
+    """엑셀 파일과 서명이 일치하는 신용평가 인덱스를 반환합니다. (없거나 오래되었으면 새로 만듦)"""
+    index = _read_credit_index(excel_path)
+    if index is not None and index.get('signature') == file_signature(excel_path):
+        return index
+    return _build_credit_index(excel_path)
+
+
+def _credit_status(end, today, within_days):
+    if end is None: return 'unknown'
+    days_left = (end - today).days
+    if days_left < 0: return 'expired'
+    if days_left <= within_days: return 'expiring'
+    return 'valid'
+
+
+def credit_expiry_report(excel_paths, within_days=30, today=None):
+    """
+    모든 DB의 신용평가 만료 현황을 인덱스로 조회합니다.
+    - excel_paths: {'전기': 경로, '통신': 경로, '소방': 경로}
+    반환값: ({'expired': [...], 'expiring': [...], 'valid': [...], 'unknown': [...]}, {DB 종류: 오류 메시지})
+    각 항목: {'db_type', 'biz_no', 'name', 'rating', 'start', 'end', 'days_left'} (만료일이 빠른 순)
+    """
+    today = today or datetime.now().date()
+    report = {'expired': [], 'expiring': [], 'valid': [], 'unknown': []}
+    errors = {}
+    for db_type, excel_path in excel_paths.items():
+        if not excel_path or not os.path.exists(excel_path): continue
+        try:
+            index = _get_credit_index(excel_path)
+        except Exception as e:
+            errors[db_type] = f"신용평가 인덱스 생성 오류: {e}"
+            continue
+        for biz_no, entry in index['entries'].items():
+            end = datetime.strptime(entry['end'], '%Y-%m-%d').date() if entry['end'] else None
+            report[_credit_status(end, today, within_days)].append({
+                'db_type': db_type, 'biz_no': biz_no, 'name': entry['name'], 'rating': entry['rating'],
+                'start': entry['start'], 'end': entry['end'], 'days_left': (end - today).days if end else None})
+    for items in report.values():
+        items.sort(key=lambda item: (item['end'] or '9999-12-31', item['db_type'], item['biz_no']))
+    return report, errors
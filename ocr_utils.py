@@ -21,6 +21,9 @@ def clean_biz_number(text):
     return match.group(1) if match else ''
 
 # 🔹 OCR 전 이미지 전처리 (흑백+이진화)
+# 값을 바꾸면 OCR 캐시(ocr_cache) 키도 바뀌므로 이전 결과가 잘못 재사용되지 않습니다.
+PREPROCESS_CONFIG = {'blur': 3, 'block_size': 11, 'c': 2}
+
 def preprocess_image_for_ocr(pil_img):
     """
     Pillow 이미지를 받아, OCR에 최적화된 OpenCV 이미지(Numpy 배열)로 변환합니다.
@@ -36,13 +39,184 @@ def preprocess_image_for_ocr(pil_img):
         img_gray = img_np
 
     # 3. 이미지 노이즈를 줄이기 위해 약간의 블러 처리
-    img_blurred = cv2.GaussianBlur(img_gray, (3, 3), 0)
+    blur = PREPROCESS_CONFIG['blur']
+    img_blurred = cv2.GaussianBlur(img_gray, (blur, blur), 0)
 
     # 4. adaptiveThreshold를 사용하여, 조명이 균일하지 않은 문서에서도 글자와 배경을 명확하게 분리
     img_thresh = cv2.adaptiveThreshold(
         img_blurred, 255,
         cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
         cv2.THRESH_BINARY,
-        11, 2
+        PREPROCESS_CONFIG['block_size'], PREPROCESS_CONFIG['c']
     )
-    return img_thresh
\ No newline at end of file
+    return img_thresh
+
+# 🔹 OCR 리더 생성 (백그라운드 스레드에서 호출)
+OCR_LANGUAGES = ['ko', 'en']
+
+def create_reader():
+    """
+    EasyOCR 리더를 만든 뒤 작은 예열 이미지로 검출/인식을 한 번씩 실행합니다.
+    (torch 불러오기와 첫 추론의 초기화 비용을 첫 실제 분석 전에 미리 치름)
+    """
+    import easyocr  # torch까지 불러오므로 화면 스레드가 아닌 곳에서만 불러옴
+    reader = easyocr.Reader(OCR_LANGUAGES, gpu=False)
+    warm_up = np.full((48, 240), 255, dtype=np.uint8)
+    cv2.putText(warm_up, "123-45-67890", (8, 34), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+    reader.readtext(warm_up, detail=0, batch_size=OCR_RECOGNIZE_BATCH_SIZE)
+    return reader
+
+# 🔹 인식 전용 모드 (글자 검출 생략)
+# 지정 영역은 사용자가 글자에 맞춰 그린 상자이므로, CRAFT 글자 검출(readtext) 없이 영역 자체 또는
+# 가로 투영(행별 검은 화소 수)으로 나눈 줄 상자를 그대로 인식기(reader.recognize)에 넘깁니다.
+# CPU에서는 검출이 인식보다 오래 걸리므로, 검출은 아무 글자도 인식되지 않은 영역에만 대체 수단으로 실행합니다.
+OCR_LINE_MIN_HEIGHT = 6       # 이보다 낮은 줄(표 테두리, 잡티)은 버림
+OCR_LINE_MAX_GAP = 2          # 이 이하의 빈 행은 같은 줄 안의 틈으로 봄
+OCR_LINE_PAD = 3              # 줄 상자 둘레 여백
+OCR_RECOGNIZE_BATCH_SIZE = 16 # 인식기에 한 번에 넣는 상자 수
+OCR_RECOGNIZE_MIN_CONFIDENCE = 0.1  # 이보다 신뢰도가 낮은 인식 결과는 "인식 안 됨"으로 봄
+
+def recognizer_config(recognize_only, batched=False):
+    """인식 결과에 영향을 주는 설정 (OCR 캐시 키에 포함)"""
+    # 한 번에 인식(batched)하면 상자 묶음/패딩이 달라져 결과가 조금 다를 수 있으므로 방식마다 따로 저장
+    config = {'languages': OCR_LANGUAGES, 'recognize_only': recognize_only, 'batched': batched}
+    if recognize_only:
+        config.update(line_min_height=OCR_LINE_MIN_HEIGHT, line_max_gap=OCR_LINE_MAX_GAP, line_pad=OCR_LINE_PAD,
+                      min_confidence=OCR_RECOGNIZE_MIN_CONFIDENCE)
+    return config
+
+def split_text_lines(img, min_height=OCR_LINE_MIN_HEIGHT, max_gap=OCR_LINE_MAX_GAP, pad=OCR_LINE_PAD):
+    """
+    이진화된 영역 이미지를 가로 투영으로 줄 단위로 나눕니다.
+    반환값: recognize의 horizontal_list 형식 상자 목록 [[x_min, x_max, y_min, y_max], ...] (글자가 없으면 빈 목록)
+    """
+    dark = img < 128
+    height, width = dark.shape
+    text_rows = np.flatnonzero(dark.sum(axis=1) >= max(2, width * 0.02))  # 세로 테두리 1~2px은 글자 행으로 보지 않음
+    runs = []
+    for y in text_rows:
+        if runs and y - runs[-1][1] <= max_gap + 1: runs[-1][1] = y
+        else: runs.append([y, y])
+    boxes = []
+    for top, bottom in runs:
+        if bottom - top + 1 < min_height: continue
+        xs = np.flatnonzero(dark[top:bottom + 1].any(axis=0))
+        boxes.append([max(0, int(xs[0]) - pad), min(width, int(xs[-1]) + 1 + pad),
+                      max(0, int(top) - pad), min(height, int(bottom) + 1 + pad)])
+    return boxes
+
+def _recognized(boxes):
+    """recognize(detail=1) 결과에서 글자가 있고 신뢰도가 충분한 상자만 남깁니다."""
+    return [box for box in boxes if box[1].strip() and box[2] >= OCR_RECOGNIZE_MIN_CONFIDENCE]
+
+def recognize_roi_text(reader, img):
+    """전처리된 영역 이미지 1개를 검출 없이 줄 상자만으로 인식합니다. (인식된 글자가 없으면 빈 문자열)"""
+    line_boxes = split_text_lines(img) or [[0, img.shape[1], 0, img.shape[0]]]
+    result = reader.recognize(img, horizontal_list=line_boxes, free_list=[], detail=1, paragraph=False,
+                              batch_size=OCR_RECOGNIZE_BATCH_SIZE)
+    return join_reading_order(_recognized(result))
+
+# 🔹 지정 영역 글자 인식 (영역 1개)
+def read_roi_text(reader, img, recognize_only=False):
+    """
+    전처리된 영역 이미지 1개를 인식해 문단 텍스트로 반환합니다. (검출 + 인식)
+    recognize_only=True 이면 먼저 검출 없이 인식하고, 인식된 글자가 없을 때만 검출 + 인식을 실행합니다.
+    """
+    if recognize_only:
+        text = recognize_roi_text(reader, img)
+        if text: return text
+    result = reader.readtext(img, detail=0, paragraph=True)
+    return " ".join(result).strip() if result else ""
+
+# 🔹 여러 지정 영역을 한 번에 인식 (배치)
+# 영역 이미지들을 빈 줄(OCR_BATCH_GAP)을 사이에 두고 세로로 이어 붙인 캔버스 1장으로 만들어
+# readtext를 한 번만 호출합니다. (검출 1회 + 인식은 EasyOCR 내부에서 batch_size 단위로 한꺼번에)
+# 찾은 글자 상자는 세로 위치로 원래 영역에 되돌려 보냅니다.
+# 캔버스가 EasyOCR 검출 크기(OCR_BATCH_MAX_HEIGHT)를 넘으면 축소되어 정확도가 떨어지므로 여러 장으로 나눕니다.
+OCR_BATCH_GAP = 40
+OCR_BATCH_MAX_HEIGHT = 2560
+
+def stack_crops(images, gap=OCR_BATCH_GAP, max_height=OCR_BATCH_MAX_HEIGHT):
+    """
+    흑백 영역 이미지들을 세로로 이어 붙인 캔버스 목록을 만듭니다.
+    반환값: [(캔버스, [(영역 번호, 위쪽 y, 아래쪽 y), ...]), ...]
+    """
+    groups, current, height = [], [], gap
+    for index, img in enumerate(images):
+        if current and height + img.shape[0] + gap > max_height:
+            groups.append(current); current, height = [], gap
+        current.append(index); height += img.shape[0] + gap
+    if current: groups.append(current)
+
+    canvases = []
+    for group in groups:
+        width = max(images[index].shape[1] for index in group) + gap * 2
+        total_height = gap + sum(images[index].shape[0] + gap for index in group)
+        canvas = np.full((total_height, width), 255, dtype=np.uint8)  # 이진화 이미지의 배경(흰색)
+        spans, top = [], gap
+        for index in group:
+            img = images[index]
+            canvas[top:top + img.shape[0], gap:gap + img.shape[1]] = img
+            spans.append((index, top, top + img.shape[0]))
+            top += img.shape[0] + gap
+        canvases.append((canvas, spans))
+    return canvases
+
+def join_reading_order(boxes):
+    """
+    readtext(detail=1) 결과 [(꼭짓점 4개, 텍스트, 신뢰도), ...]를 줄 단위(위->아래), 줄 안에서는 왼쪽->오른쪽으로 이어 붙입니다.
+    (paragraph=True 결과와 같은 순서)
+    """
+    items = []
+    for points, text, _ in boxes:
+        ys = [point[1] for point in points]
+        items.append(((min(ys) + max(ys)) / 2, max(ys) - min(ys), min(point[0] for point in points), text))
+    items.sort()
+    lines = []
+    for center_y, box_height, left, text in items:
+        # 세로 중심이 이전 줄 높이의 절반 안이면 같은 줄
+        if lines and abs(center_y - lines[-1][0]) <= max(box_height, lines[-1][1]) / 2:
+            lines[-1][2].append((left, text))
+        else:
+            lines.append([center_y, box_height, [(left, text)]])
+    return " ".join(text for _, _, line in lines for _, text in sorted(line)).strip()
+
+def _route_to_spans(boxes, spans):
+    """캔버스에서 찾은 상자들을 세로 중심 위치로 원래 영역에 나눠 담습니다. 반환값: {영역 번호: [상자, ...]}"""
+    routed = {index: [] for index, _, _ in spans}
+    for box in boxes:
+        ys = [point[1] for point in box[0]]
+        center_y = (min(ys) + max(ys)) / 2
+        for index, top, bottom in spans:
+            if top - OCR_BATCH_GAP / 2 <= center_y < bottom + OCR_BATCH_GAP / 2:
+                routed[index].append(box); break
+    return routed
+
+def read_roi_texts_batched(reader, images, recognize_only=False):
+    """
+    전처리된 영역 이미지 여러 개를 캔버스 단위로 한 번에 인식합니다.
+    recognize_only=True 이면 영역마다 줄 상자를 캔버스 좌표로 옮겨 recognize 한 번으로 인식하고,
+    인식된 글자가 없는 영역만 모아 검출 + 인식으로 다시 읽습니다.
+    반환값: 입력 순서대로의 텍스트 목록
+    """
+    texts = [""] * len(images)
+    for canvas, spans in stack_crops(images):
+        if recognize_only:
+            line_boxes = []
+            for index, top, bottom in spans:
+                img = images[index]
+                for x_min, x_max, y_min, y_max in split_text_lines(img) or [[0, img.shape[1], 0, img.shape[0]]]:
+                    line_boxes.append([x_min + OCR_BATCH_GAP, x_max + OCR_BATCH_GAP, y_min + top, y_max + top])
+            result = _recognized(reader.recognize(canvas, horizontal_list=line_boxes, free_list=[], detail=1,
+                                                  paragraph=False, batch_size=OCR_RECOGNIZE_BATCH_SIZE))
+        else:
+            result = reader.readtext(canvas, detail=1, paragraph=False, batch_size=OCR_RECOGNIZE_BATCH_SIZE)
+        for index, index_boxes in _route_to_spans(result, spans).items():
+            texts[index] = join_reading_order(index_boxes)
+
+    if recognize_only:
+        missing = [index for index, text in enumerate(texts) if not text]
+        if missing:
+            for index, text in zip(missing, read_roi_texts_batched(reader, [images[index] for index in missing])):
+                texts[index] = text
+    return texts
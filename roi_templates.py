@@ -0,0 +1,203 @@
+# [roi_templates.py] 자료 종류별 지정 영역(ROI) 템플릿 저장소와 새 문서 자동 정렬
+#
+# 같은 발급처의 증명서는 양식이 같으므로, 한 번 지정한 영역을 이름을 붙여 자료 종류(file_type_combo 항목)별로 저장해 두고
+# 새 문서를 열면 자동으로 다시 씁니다.
+#   - 저장: ROI_TEMPLATE_DIR/templates.json (템플릿 목록) + 템플릿마다 축소한 흑백 기준 페이지 PNG 1개
+#   - 정렬: 기준 페이지와 새 페이지를 ALIGN_MAX_SIDE 크기로 줄여 ORB 특징점을 맞춘 뒤
+#           cv2.estimateAffinePartial2D(RANSAC)로 배율/이동/회전을 구하고, 영역 좌표를 새 페이지 좌표로 옮깁니다.
+#   - 맞는 특징점(inlier)이 ALIGN_MIN_INLIERS개 미만이면 다른 양식으로 보고 적용하지 않습니다.
+
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+
+import numpy as np
+import cv2
+from PIL import Image
+
+import trace_log
+
+ROI_TEMPLATE_DIR = "roi_templates"
+ROI_TEMPLATE_INDEX = "templates.json"
+ALIGN_MAX_SIDE = 1000      # 특징점 찾기용 축소 크기 (긴 변 기준 픽셀)
+ALIGN_FEATURES = 2000      # 페이지당 ORB 특징점 수
+ALIGN_RATIO = 0.75         # 가장 가까운 두 후보의 거리 비율 검사 (Lowe ratio test)
+ALIGN_MIN_INLIERS = 30
+ALIGN_SCALE_RANGE = (0.5, 2.0)  # 이 범위를 벗어나는 배율은 잘못 맞춘 것으로 봄
+
+_lock = threading.Lock()
+_reference_features = {}  # 기준 PNG 경로 -> (키포인트 좌표 배열, 기술자) (정렬할 때마다 다시 계산하지 않도록 보관)
+
+
+# --- 템플릿 목록 ---
+def _index_path():
+    return os.path.join(ROI_TEMPLATE_DIR, ROI_TEMPLATE_INDEX)
+
+
+def _read_index():
+    try:
+        with open(_index_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        trace_log.warning(f"영역 템플릿 목록 읽기 오류: {e}", path=_index_path())
+        return []
+
+
+def _write_index(templates):
+    os.makedirs(ROI_TEMPLATE_DIR, exist_ok=True)
+    temp_path = _index_path() + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(templates, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, _index_path())
+
+
+def list_templates(doc_type=None):
+    """
+    저장된 템플릿 목록을 반환합니다. doc_type을 주면 그 자료 종류의 템플릿만 반환합니다.
+    템플릿 형식: {'id', 'doc_type', 'name', 'size': [폭, 높이], 'rois': {항목: [x, y, 폭, 높이]}, 'reference', 'created_at'}
+    """
+    with _lock:
+        templates = _read_index()
+    return [template for template in templates if doc_type is None or template['doc_type'] == doc_type]
+
+
+def save_template(doc_type, name, pil_page, rois):
+    """
+    현재 페이지(Pillow 이미지)와 지정 영역으로 템플릿을 저장합니다. 같은 자료 종류에 같은 이름이 있으면 덮어씁니다.
+    rois: {항목: (x, y, 폭, 높이)} (원본 페이지 좌표)
+    반환값: (템플릿, 오류 메시지)
+    """
+    if not rois: return None, "저장할 지정 영역이 없습니다."
+    try:
+        with _lock:
+            templates = _read_index()
+            previous = next((t for t in templates if t['doc_type'] == doc_type and t['name'] == name), None)
+            template_id = previous['id'] if previous else uuid.uuid4().hex
+            reference = template_id + ".png"
+            os.makedirs(ROI_TEMPLATE_DIR, exist_ok=True)
+            reference_path = os.path.join(ROI_TEMPLATE_DIR, reference)
+            Image.fromarray(_downscale(_to_gray(pil_page))[0]).save(reference_path)
+            _reference_features.pop(reference_path, None)
+            template = {'id': template_id, 'doc_type': doc_type, 'name': name, 'size': list(pil_page.size),
+                        'rois': {field: [int(v) for v in rect] for field, rect in rois.items()},
+                        'reference': reference, 'created_at': datetime.now().isoformat(timespec='seconds')}
+            templates = [t for t in templates if t['id'] != template_id] + [template]
+            _write_index(templates)
+        return template, None
+    except Exception as e:
+        return None, f"영역 템플릿 저장 오류: {e}"
+
+
+def delete_template(template_id):
+    """반환값: (삭제 여부, 오류 메시지)"""
+    try:
+        with _lock:
+            templates = _read_index()
+            template = next((t for t in templates if t['id'] == template_id), None)
+            if not template: return False, None
+            _write_index([t for t in templates if t['id'] != template_id])
+            reference_path = os.path.join(ROI_TEMPLATE_DIR, template['reference'])
+            _reference_features.pop(reference_path, None)
+            if os.path.exists(reference_path): os.remove(reference_path)
+        return True, None
+    except Exception as e:
+        return False, f"영역 템플릿 삭제 오류: {e}"
+
+
+# --- 자동 정렬 ---
+def _to_gray(pil_page):
+    return np.array(pil_page.convert('L'))
+
+
+def _downscale(gray):
+    """긴 변이 ALIGN_MAX_SIDE가 되도록 줄입니다. 반환값: (축소 이미지, 축소 배율)"""
+    scale = min(1.0, ALIGN_MAX_SIDE / max(gray.shape))
+    if scale == 1.0: return gray, scale
+    size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), scale
+
+
+def _features(gray_small):
+    # ORB 객체는 스레드 간에 공유하지 않음 (두 탭의 정렬 작업이 동시에 돌 수 있음)
+    keypoints, descriptors = cv2.ORB_create(nfeatures=ALIGN_FEATURES).detectAndCompute(gray_small, None)
+    return np.float32([keypoint.pt for keypoint in keypoints]), descriptors
+
+
+def _reference(template):
+    """템플릿 기준 페이지의 (특징점 좌표, 기술자, 원본 대비 축소 배율)"""
+    reference_path = os.path.join(ROI_TEMPLATE_DIR, template['reference'])
+    if reference_path not in _reference_features:
+        gray_small = np.array(Image.open(reference_path).convert('L'))
+        _reference_features[reference_path] = _features(gray_small) + (gray_small.shape[1] / template['size'][0],)
+    return _reference_features[reference_path]
+
+
+def estimate_alignment(template, page_features, page_scale):
+    """
+    템플릿 기준 페이지 좌표 -> 새 페이지(원본 크기) 좌표 변환 행렬(2x3)을 구합니다.
+    반환값: (행렬, 맞는 특징점 수) (맞추지 못하면 (None, 0))
+    """
+    ref_points, ref_descriptors, ref_scale = _reference(template)
+    page_points, page_descriptors = page_features
+    if ref_descriptors is None or page_descriptors is None or len(ref_descriptors) < 2 or len(page_descriptors) < 2:
+        return None, 0
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    good = [pair[0] for pair in matcher.knnMatch(ref_descriptors, page_descriptors, k=2)
+            if len(pair) == 2 and pair[0].distance < ALIGN_RATIO * pair[1].distance]
+    if len(good) < ALIGN_MIN_INLIERS: return None, 0
+    src = np.float32([ref_points[match.queryIdx] for match in good])
+    dst = np.float32([page_points[match.trainIdx] for match in good])
+    matrix, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+    if matrix is None: return None, 0
+    # 축소 좌표끼리의 변환을 원본 좌표끼리의 변환으로 바꿈: 새 원본 = (1/page_scale) * M * (ref_scale * 기준 원본)
+    matrix = matrix.copy()
+    matrix[:, :2] *= ref_scale / page_scale
+    matrix[:, 2] /= page_scale
+    scale = float(np.hypot(matrix[0, 0], matrix[1, 0]))
+    if not ALIGN_SCALE_RANGE[0] <= scale <= ALIGN_SCALE_RANGE[1]: return None, 0
+    return matrix, int(inliers.sum())
+
+
+def transform_rois(template, matrix, page_size):
+    """템플릿 영역을 변환 행렬로 옮긴 뒤 새 페이지 안으로 자릅니다. 반환값: {항목: (x, y, 폭, 높이)}"""
+    width, height = page_size
+    rois = {}
+    for field, (x, y, w, h) in template['rois'].items():
+        corners = np.float32([[x, y], [x + w, y], [x, y + h], [x + w, y + h]])
+        moved = corners @ matrix[:, :2].T + matrix[:, 2]
+        left, top = max(0, int(moved[:, 0].min())), max(0, int(moved[:, 1].min()))
+        right, bottom = min(width, int(np.ceil(moved[:, 0].max()))), min(height, int(np.ceil(moved[:, 1].max())))
+        if right > left and bottom > top: rois[field] = (left, top, right - left, bottom - top)
+    return rois
+
+
+def match_page(pil_page, doc_types=None):
+    """
+    새 페이지에 가장 잘 맞는 템플릿을 찾아 영역을 옮깁니다. doc_types를 주면 그 자료 종류의 템플릿만 비교합니다.
+    반환값: (템플릿, {항목: (x, y, 폭, 높이)}, 오류 메시지) (맞는 템플릿이 없으면 (None, None, None))
+    """
+    templates = [t for t in list_templates() if doc_types is None or t['doc_type'] in doc_types]
+    if not templates: return None, None, None
+    try:
+        with trace_log.phase('roi_template_align', templates=len(templates)):
+            gray_small, page_scale = _downscale(_to_gray(pil_page))
+            page_features = _features(gray_small)
+            best = (None, None, 0)
+            for template in templates:
+                try:
+                    matrix, inliers = estimate_alignment(template, page_features, page_scale)
+                except (OSError, cv2.error) as e:
+                    trace_log.warning(f"영역 템플릿 정렬 오류: {e}", template=template['name'])
+                    continue
+                if matrix is not None and inliers >= ALIGN_MIN_INLIERS and inliers > best[2]:
+                    best = (template, matrix, inliers)
+        template, matrix, inliers = best
+        if template is None: return None, None, None
+        trace_log.debug(f"영역 템플릿 '{template['name']}' 적용 (맞는 특징점 {inliers}개)")
+        return template, transform_rois(template, matrix, pil_page.size), None
+    except Exception as e:
+        return None, None, f"영역 템플릿 정렬 오류: {e}"
@@ -0,0 +1,152 @@
+# [save_queue.py] 확정한 업데이트를 백그라운드에서 저장하는 쓰기 지연(write-behind) 대기열
+#
+# - 작업(업체 업데이트 + 자료 파일 보관)은 먼저 디스크의 저널 파일(SAVE_QUEUE_PATH)에 기록한 뒤 대기열에 넣으므로,
+#   프로그램이 비정상 종료되어도 다음 실행 때 남은 작업을 다시 저장할 수 있습니다.
+# - flush_once()는 대기 중인 작업을 모두 꺼내 DB 파일별로 묶어 저장합니다. (파일마다 열기/저장 1회,
+#   ocr_logic.batch_update_company_data) 저장하는 동안 들어온 작업은 다음 flush_once()에서 함께 처리됩니다.
+# - 실패한 작업은 오류 메시지와 함께 저널에 남겨 두고, retry_failed()로 다시 대기열에 넣습니다.
+
+import os
+import json
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+import ocr_logic
+import trace_log
+
+SAVE_QUEUE_PATH = "ocr_save_queue.json"
+
+
+def move_to_archive(source_file_path, destination_folder, new_filename):
+    """
+    자료 파일을 보관 폴더로 옮깁니다.
+    저장 직후 비정상 종료되어 같은 작업을 다시 실행하는 경우, 이미 옮겨진 파일은 그대로 성공으로 봅니다.
+    """
+    destination_path = os.path.join(destination_folder, new_filename)
+    if not os.path.exists(source_file_path) and os.path.exists(destination_path):
+        return destination_path
+    os.makedirs(destination_folder, exist_ok=True)
+    shutil.move(source_file_path, destination_path)
+    return destination_path
+
+
+class WriteBehindQueue:
+    """
+    작업 형식: {'id', 'label', 'biz_no', 'update_data', 'db_type', 'excel_path', 'archive', 'status', 'error', 'created_at'}
+    - db_type/excel_path가 None이면 엑셀 업데이트 없이 자료 파일 보관만 합니다. (신규 업체)
+    - archive가 None이면 자료 파일 보관 없이 데이터만 저장합니다.
+    - status: 'pending' (저장 대기) / 'failed' (실패, 오류 메시지는 error)
+    여러 스레드(화면 / 저장 작업)에서 함께 쓰므로 모든 메서드는 잠금 안에서 동작합니다.
+    """
+
+    def __init__(self, journal_path=SAVE_QUEUE_PATH):
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self._jobs = self._read_journal()
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            trace_log.warning(f"저장 대기열 저널 읽기 오류: {e}", path=self.journal_path)
+            return []
+
+    def _write_journal(self):
+        """임시 파일에 쓴 뒤 교체하므로, 쓰는 도중 종료되어도 이전 저널은 그대로 남습니다."""
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._jobs, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def enqueue(self, label, biz_no, update_data, db_type, excel_path, archive=None):
+        """작업을 저널에 기록하고 대기열에 넣습니다. (저널 기록에 실패하면 OSError)"""
+        job = {'id': uuid.uuid4().hex, 'label': label, 'biz_no': biz_no, 'update_data': update_data,
+               'db_type': db_type, 'excel_path': excel_path, 'archive': list(archive) if archive else None,
+               'status': 'pending', 'error': None, 'created_at': datetime.now().isoformat(timespec='seconds')}
+        with self._lock:
+            self._jobs.append(job)
+            try:
+                self._write_journal()
+            except OSError:
+                self._jobs.remove(job)
+                raise
+        return job
+
+    def counts(self):
+        """반환값: (저장 대기 수, 실패 수)"""
+        with self._lock:
+            pending = sum(1 for job in self._jobs if job['status'] == 'pending')
+            return pending, len(self._jobs) - pending
+
+    def failed_jobs(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs if job['status'] == 'failed']
+
+    def retry_failed(self):
+        """실패한 작업을 모두 다시 대기 상태로 돌립니다. 반환값: 다시 넣은 작업 수"""
+        with self._lock:
+            failed = [job for job in self._jobs if job['status'] == 'failed']
+            for job in failed:
+                job['status'], job['error'] = 'pending', None
+            if failed: self._write_journal()
+            return len(failed)
+
+    def _finish(self, outcomes):
+        """성공한 작업은 저널에서 지우고, 실패한 작업은 오류 메시지와 함께 남깁니다."""
+        with self._lock:
+            errors = {job['id']: error for job, error in outcomes}
+            remaining = []
+            for job in self._jobs:
+                if job['id'] not in errors:
+                    remaining.append(job)
+                elif errors[job['id']]:
+                    job['status'], job['error'] = 'failed', errors[job['id']]
+                    remaining.append(job)
+            self._jobs = remaining
+            try:
+                self._write_journal()
+            except OSError as e:
+                trace_log.warning(f"저장 대기열 저널 쓰기 오류: {e}", path=self.journal_path)
+
+    def flush_once(self):
+        """
+        지금 대기 중인 작업을 모두 저장합니다. 같은 DB 파일의 작업은 한 번에 열고 한 번만 저장합니다.
+        반환값: [(작업, 오류 메시지 또는 None), ...] (대기 중인 작업이 없으면 빈 목록)
+        """
+        with self._lock:
+            batch = [dict(job) for job in self._jobs if job['status'] == 'pending']
+        if not batch: return []
+
+        errors = {}
+        jobs_by_path = {}
+        for job in batch:
+            if job['db_type']: jobs_by_path.setdefault(job['excel_path'], []).append(job)
+        with trace_log.phase('write_behind', jobs=len(batch), files=len(jobs_by_path)):
+            for excel_path, file_jobs in jobs_by_path.items():
+                entries = [(job['biz_no'], job['update_data'], job['db_type']) for job in file_jobs]
+                try:
+                    results = ocr_logic.batch_update_company_data(
+                        entries, {job['db_type']: excel_path for job in file_jobs})
+                except Exception as e:
+                    results = [{'error': f"엑셀 파일 저장 오류: {e}"} for _ in file_jobs]
+                for job, result in zip(file_jobs, results):
+                    if result['error']: errors[job['id']] = result['error']
+
+            outcomes = []
+            for job in batch:
+                error = errors.get(job['id'])
+                if not error and job['archive']:
+                    try:
+                        move_to_archive(*job['archive'])
+                    except Exception as e:
+                        error = f"엑셀 저장 완료, 파일 보관 오류: {e}"
+                outcomes.append((job, error))
+        self._finish(outcomes)
+        return outcomes
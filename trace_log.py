@@ -0,0 +1,104 @@
+# [trace_log.py] 단계별 소요 시간과 진단 메시지를 기록하는 추적 모듈
+#
+# 추적 수준은 환경 변수 OCR_TRACE_LEVEL 로 정합니다.
+#   off     : 아무것도 기록하지 않음
+#   summary : (기본값) 불러오기/위치 찾기/읽기/쓰기/저장 단계별 소요 시간과 경고만 기록
+#   debug   : summary + 셀 단위 진단 메시지 (콘솔에도 출력)
+# 기록은 한 줄에 JSON 하나(JSON Lines) 형식으로 OCR_TRACE_FILE(기본값 'ocr_trace.jsonl')에 덧붙이므로,
+# 나중에 phase 별로 모아 느린 단계를 찾을 수 있습니다.
+# 파일이 OCR_TRACE_MAX_MB(기본값 5MB)를 넘으면 '<파일>.1'로 이름을 바꾸고 새 파일에 이어 씁니다. (이전 기록은 1개만 보관)
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+OFF, SUMMARY, DEBUG = 0, 1, 2
+LEVEL_NAMES = {'off': OFF, 'summary': SUMMARY, 'debug': DEBUG}
+
+_level = LEVEL_NAMES.get(os.environ.get('OCR_TRACE_LEVEL', 'summary').strip().lower(), SUMMARY)
+_trace_path = os.environ.get('OCR_TRACE_FILE', 'ocr_trace.jsonl')
+_trace_max_bytes = int(float(os.environ.get('OCR_TRACE_MAX_MB', '5')) * 1024 * 1024)
+_trace_file = None
+_write_lock = threading.Lock()
+
+
+def set_level(level):
+    """추적 수준을 바꿉니다. ('off' / 'summary' / 'debug' 또는 OFF / SUMMARY / DEBUG)"""
+    global _level
+    _level = LEVEL_NAMES[level] if isinstance(level, str) else level
+
+
+def enabled(level=SUMMARY):
+    """해당 수준의 기록이 켜져 있는지 확인합니다. 메시지를 만드는 비용이 클 때 먼저 확인하세요."""
+    return _level >= level
+
+
+def _write(record):
+    global _trace_file
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _write_lock:
+        try:
+            if _trace_file is None:
+                _trace_file = open(_trace_path, 'a', encoding='utf-8')
+            _trace_file.write(line + '\n')
+            _trace_file.flush()
+            if _trace_file.tell() > _trace_max_bytes: _rotate()
+        except OSError:
+            # 추적 기록은 보조 기능이므로, 파일을 쓸 수 없어도 작업은 계속합니다.
+            pass
+
+
+def _rotate():
+    """현재 기록 파일을 '<파일>.1'로 옮깁니다. (다음 기록 때 새 파일을 엶)"""
+    global _trace_file
+    _trace_file.close()
+    _trace_file = None
+    os.replace(_trace_path, _trace_path + '.1')
+
+
+def event(name, level=SUMMARY, **fields):
+    """구조화된 기록 한 줄을 남깁니다."""
+    if _level < level: return
+    record = {'ts': round(time.time(), 3), 'level': 'debug' if level >= DEBUG else 'summary',
+              'event': name, 'thread': threading.current_thread().name}
+    record.update(fields)
+    _write(record)
+
+
+def debug(message, **fields):
+    """셀 단위 진단 메시지입니다. debug 수준에서만 기록하고 콘솔에도 출력합니다."""
+    if _level < DEBUG: return
+    print(message)
+    event('debug', DEBUG, message=message, **fields)
+
+
+def warning(message, **fields):
+    """작업은 계속되지만 알아야 할 문제입니다. (off가 아니면 콘솔 출력 + 기록)"""
+    if _level < SUMMARY: return
+    print(message)
+    event('warning', SUMMARY, message=message, **fields)
+
+
+@contextmanager
+def phase(name, **fields):
+    """
+    with 블록의 소요 시간을 'phase' 기록으로 남깁니다.
+    블록 안에서 yield된 dict에 값을 넣으면 기록에 함께 남습니다. (예: 캐시 적중 여부)
+    """
+    if _level < SUMMARY:
+        yield {}
+        return
+    extra = {}
+    started = time.perf_counter()
+    error = None
+    try:
+        yield extra
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = dict(fields, **extra)
+        if error: record['error'] = error
+        event('phase', SUMMARY, phase=name, ms=round((time.perf_counter() - started) * 1000, 2), **record)
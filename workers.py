@@ -1,33 +1,338 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PySide6.QtCore import QThread, Signal
 from PySide6.QtGui import QImage
 from PIL import Image
 import numpy as np
 import ocr_logic
 import ocr_utils
+import ocr_cache
+import roi_templates
+import trace_log
+import db_mirror
+import change_journal
+import save_queue
+
+# 취소된 조회의 메시지 (찾지 못한 것과 구분: 화면은 이 결과를 무시함)
+LOOKUP_CANCELLED = "조회가 취소되었습니다."
+
+class ReaderLoadWorker(QThread):
+    """EasyOCR 모델을 백그라운드에서 불러오고 예열합니다. finished(리더 또는 None, 오류 메시지)"""
+    finished = Signal(object, str)
+    def run(self):
+        try:
+            with trace_log.phase('ocr_reader_load'):
+                reader = ocr_utils.create_reader()
+            self.finished.emit(reader, "")
+        except Exception as e:
+            self.finished.emit(None, str(e))
+
+class TemplateAlignWorker(QThread):
+    """
+    새 페이지에 맞는 영역 템플릿을 찾아 영역을 새 페이지 좌표로 옮깁니다. (roi_templates.match_page)
+    finished(템플릿 또는 None, {항목: (x, y, 폭, 높이)} 또는 None, 오류 메시지)
+    """
+    finished = Signal(object, object, str)
+    def __init__(self, image_qimage, doc_types=None):
+        super().__init__(); self.image_qimage, self.doc_types = image_qimage, doc_types
+    def run(self):
+        try:
+            template, rois, error = roi_templates.match_page(Image.fromqpixmap(self.image_qimage), self.doc_types)
+        except Exception as e:
+            template, rois, error = None, None, f"영역 템플릿 정렬 오류: {e}"
+        self.finished.emit(template, rois, error or "")
 
 class RoiOcrWorker(QThread):
+    """
+    지정 영역들을 OCR합니다. batched=True 이면 모든 영역을 먼저 전처리한 뒤 한 번에 인식하고
+    (ocr_utils.read_roi_texts_batched), 결과는 영역마다 progress(항목, 텍스트)로 보냅니다.
+    recognize_only=True 이면 글자 검출 없이 영역(줄 상자)을 바로 인식하고, 인식되지 않은 영역만 검출합니다.
+    잘라낸 영역과 설정이 같으면 캐시(ocr_cache)의 이전 결과를 쓰고, 바뀐 영역만 OCR합니다. (cache=None이면 사용 안 함)
+    """
     progress = Signal(str, str); finished = Signal(str)
-    def __init__(self, reader, image_qimage, fields_to_process):
+    def __init__(self, reader, image_qimage, fields_to_process, batched=True, recognize_only=True, cache=ocr_cache.shared):
         super().__init__(); self.reader, self.image_qimage, self.fields_to_process = reader, image_qimage, fields_to_process
+        self.batched, self.recognize_only, self.cache = batched, recognize_only, cache
     def run(self):
         try:
             pil_image = Image.fromqpixmap(self.image_qimage)
-            for field, data in self.fields_to_process.items():
-                rect = data.get('roi')
-                if not rect: self.progress.emit(field, "[지정 안됨]"); continue
-                cropped_pil = pil_image.crop((rect.x(), rect.y(), rect.x() + rect.width(), rect.y() + rect.height()))
-                preprocessed_img = ocr_utils.preprocess_image_for_ocr(cropped_pil)
-                result = self.reader.readtext(preprocessed_img, detail=0, paragraph=True)
-                text = " ".join(result) if result else ""
-                self.progress.emit(field, text.strip())
+            recognizer_config = ocr_utils.recognizer_config(self.recognize_only, self.batched)
+            fields, keys, images = [], [], []
+            with trace_log.phase('ocr_preprocess', fields=len(self.fields_to_process)):
+                for field, data in self.fields_to_process.items():
+                    rect = data.get('roi')
+                    if not rect: self.progress.emit(field, "[지정 안됨]"); continue
+                    cropped_pil = pil_image.crop((rect.x(), rect.y(), rect.x() + rect.width(), rect.y() + rect.height()))
+                    key = ocr_cache.make_key(cropped_pil, ocr_utils.PREPROCESS_CONFIG, recognizer_config) if self.cache else None
+                    cached = self.cache.get(key) if self.cache else None
+                    if cached is not None: self.progress.emit(field, cached); continue
+                    fields.append(field); keys.append(key); images.append(ocr_utils.preprocess_image_for_ocr(cropped_pil))
+            with trace_log.phase('ocr_recognize', fields=len(images), cached=len(self.fields_to_process) - len(images),
+                                 batched=self.batched, recognize_only=self.recognize_only):
+                if self.batched and len(images) > 1:
+                    texts = ocr_utils.read_roi_texts_batched(self.reader, images, self.recognize_only)
+                else:
+                    texts = (ocr_utils.read_roi_text(self.reader, img, self.recognize_only) for img in images)
+                for field, key, text in zip(fields, keys, texts):
+                    if self.cache: self.cache.put(key, text)
+                    self.progress.emit(field, text)
             self.finished.emit("모든 영역 분석 완료!")
         except Exception as e:
             self.finished.emit(f"분석 중 오류 발생: {e}")
 
-class ColorUpdateWorker(QThread):
+class RecolorPlanWorker(QThread):
+    """
+    색상 갱신 미리보기: 파일을 수정하지 않고 바뀔 셀 목록(변경 목록)만 만듭니다.
+    finished(변경 목록 또는 None, 오류 메시지)
+    """
+    finished = Signal(object, str)
+    def __init__(self, excel_path, rollover=False, credit=False):
+        super().__init__(); self.excel_path, self.rollover, self.credit = excel_path, rollover, credit
+    def run(self):
+        plan, error = ocr_logic.plan_recolor(self.excel_path, rollover=self.rollover, credit=self.credit)
+        self.finished.emit(plan, error or "")
+
+class RecolorApplyWorker(QThread):
+    """미리보기에서 만든 변경 목록을 다시 계산하지 않고 그대로 적용합니다. finished(결과 메시지)"""
     finished = Signal(str)
-    def __init__(self, excel_path):
-        super().__init__(); self.excel_path = excel_path
+    def __init__(self, plan):
+        super().__init__(); self.plan = plan
+    def run(self):
+        applied, error = ocr_logic.apply_recolor_plan(self.plan)
+        self.finished.emit(f"엑셀 파일 색상 갱신 오류: {error}" if error else f"총 {applied}개 셀의 색상을 갱신했습니다.")
+
+class YearEndMaintenanceWorker(QThread):
+    """
+    연말 상태 색상 갱신과 신용평가 유효기간 갱신을 모든 DB 파일에 한 번에 적용합니다.
+    (DB 파일마다 불러오기/순회/저장 1회, 파일끼리는 병렬)
+    finished({DB 종류: (규칙별 변경 수 또는 None, 오류 메시지 또는 None)})
+    """
+    finished = Signal(object)
+    def __init__(self, excel_paths):
+        super().__init__(); self.excel_paths = excel_paths
+    def run(self):
+        db_paths = {db_type: path for db_type, path in self.excel_paths.items() if path and os.path.exists(path)}
+        results = {}
+        batch_id = change_journal.new_batch_id()  # 모든 DB의 변경을 한 번에 되돌릴 수 있도록 같은 일괄 작업으로 기록
+        def run_one(path):
+            with change_journal.batch('year_end_maintenance', batch_id):
+                return ocr_logic.year_end_maintenance(path)
+        if db_paths:
+            with ThreadPoolExecutor(max_workers=len(db_paths)) as pool:
+                futures = {pool.submit(run_one, path): db_type for db_type, path in db_paths.items()}
+                for future in as_completed(futures):
+                    try:
+                        results[futures[future]] = future.result()
+                    except Exception as e:
+                        results[futures[future]] = (None, f"연말 정리 중 오류 발생: {e}")
+        self.finished.emit(results)
+
+
+class CreditExpiryReportWorker(QThread):
+    """
+    모든 DB의 신용평가 만료 현황을 조회합니다. (인덱스가 최신이면 엑셀 파일을 열지 않음)
+    finished(상태별 업체 목록, DB별 오류 메시지)
+    """
+    finished = Signal(object, object)
+    def __init__(self, excel_paths, within_days):
+        super().__init__(); self.excel_paths, self.within_days = excel_paths, within_days
+    def run(self):
+        report, errors = ocr_logic.credit_expiry_report(self.excel_paths, within_days=self.within_days)
+        self.finished.emit(report, errors)
+
+
+class SaveQueueWorker(QThread):
+    """
+    쓰기 지연 대기열(save_queue.WriteBehindQueue)을 비울 때까지 저장합니다.
+    저장하는 동안 새로 들어온 작업도 이어서 처리하므로, 실행 중이면 다시 시작할 필요가 없습니다.
+    progress(작업, 오류 메시지 또는 "") / finished()
+    """
+    progress = Signal(object, str); finished = Signal()
+    def __init__(self, queue):
+        super().__init__(); self.queue = queue
     def run(self):
-        result_message = ocr_logic.batch_update_colors(self.excel_path)
-        self.finished.emit(result_message)
\ No newline at end of file
+        while True:
+            outcomes = self.queue.flush_once()
+            if not outcomes: break
+            for job, error in outcomes:
+                self.progress.emit(job, error or "")
+        self.finished.emit()
+
+
+class ChangeRollbackWorker(QThread):
+    """
+    변경 저널로 엑셀 변경을 되돌립니다. batch_id가 있으면 그 일괄 작업 전체, 없으면 마지막 저장 1회분.
+    finished(결과 메시지, 오류 여부)
+    """
+    finished = Signal(str, bool)
+    def __init__(self, batch_id=None):
+        super().__init__(); self.batch_id = batch_id
+    def run(self):
+        if self.batch_id:
+            reverted, error = ocr_logic.rollback_batch(self.batch_id)
+            message = f"저장 {reverted}건을 되돌렸습니다." + (f"\n\n되돌리지 못한 항목:\n{error}" if error else "")
+            self.finished.emit(message, bool(error))
+        else:
+            record, error = ocr_logic.undo_last_change()
+            if error: self.finished.emit(error, True); return
+            self.finished.emit(f"{os.path.basename(record['path'])} ({record['ts']})의 셀 {len(record['cells'])}개를 되돌렸습니다.", False)
+
+
+class CrossDbReportWorker(QThread):
+    """
+    여러 DB에 함께 있는 업체와 DB마다 다른 항목을 찾습니다. (DB 파일마다 읽기 전용 순회 1회)
+    finished(중복 업체 목록, DB별 오류 메시지)
+    """
+    finished = Signal(object, object)
+    def __init__(self, excel_paths):
+        super().__init__(); self.excel_paths = excel_paths
+    def run(self):
+        report, errors = ocr_logic.cross_db_report(self.excel_paths)
+        self.finished.emit(report, errors)
+
+
+class BulkLookupWorker(QThread):
+    """
+    여러 사업자번호를 모든 DB에서 한 번에 조회합니다. (DB 파일마다 읽기 전용 순회 1회)
+    finished(결과 목록, 찾지 못한 사업자번호 목록, DB별 오류 메시지)
+    """
+    finished = Signal(object, object, object)
+    def __init__(self, excel_paths, biz_nos):
+        super().__init__(); self.excel_paths, self.biz_nos = excel_paths, biz_nos
+        self.cancel_event = threading.Event()
+    def cancel(self):
+        self.cancel_event.set()
+    def run(self):
+        try:
+            results, not_found, errors = ocr_logic.find_companies_bulk(self.excel_paths, self.biz_nos, self.cancel_event)
+        except ocr_logic.LookupCancelled:
+            results, not_found, errors = [], list(self.biz_nos), {"전체": "조회가 취소되었습니다."}
+        self.finished.emit(results, not_found, errors)
+
+
+class CompanyLookupWorker(QThread):
+    """
+    여러 DB 파일에서 사업자번호를 동시에 조회합니다.
+    여러 DB에 있는 업체는 설정된 DB 순서(전기 -> 통신 -> 소방)가 앞선 DB의 결과를 돌려주며,
+    앞선 DB들의 조회가 모두 끝나 결과가 정해지면 나머지 조회는 취소합니다.
+    finished(업체 데이터 또는 None, 찾은 DB 종류 또는 오류 메시지, 걸린 시간(초))
+    (업체 데이터가 None이고 메시지가 빈 문자열일 때만 "DB에 없는 업체"입니다. 경로가 설정된 DB 파일을
+     열 수 없으면(공유 폴더 연결 끊김 등) 오류 메시지를, cancel()로 취소되었으면 LOOKUP_CANCELLED를 보냅니다.)
+    """
+    finished = Signal(object, str, float)
+    def __init__(self, excel_paths, biz_no, streaming=True, use_mirror=False):
+        super().__init__(); self.excel_paths, self.biz_no, self.streaming = excel_paths, biz_no, streaming
+        self.use_mirror = use_mirror  # True 이면 SQLite 복제본(db_mirror)에서 먼저 조회
+        self.cancel_event = threading.Event()
+        self.cancelled = False  # cancel_event는 결과가 정해진 뒤 남은 조회를 멈출 때도 쓰므로 따로 기록
+    def cancel(self):
+        self.cancelled = True; self.cancel_event.set()
+    def run(self):
+        started = time.perf_counter()
+        db_paths = {db_type: path for db_type, path in self.excel_paths.items() if path and os.path.exists(path)}
+        db_count = len(db_paths)  # 복제본에서 찾으면 db_paths를 비우므로 기록용으로 따로 보관
+        found_data, found_db = None, ""
+        errors = [f"{db_type}: 엑셀 파일 열기 오류: 파일을 찾을 수 없습니다 ({path})"
+                  for db_type, path in self.excel_paths.items() if path and db_type not in db_paths]
+        if db_paths and self.use_mirror:
+            try:
+                found_data, found_db, sync_errors = db_mirror.get_mirror().find_company(db_paths, self.biz_no,
+                                                                                        self.cancel_event)
+                order = list(db_paths)
+                if sync_errors and not (found_data and all(order.index(found_db) < order.index(db_type)
+                                                           for db_type in sync_errors)):
+                    # 동기화하지 못한 DB가 결과를 바꿀 수 있으면 엑셀에서 직접 조회 (열 수 없는 파일은 그 오류를 보냄)
+                    trace_log.warning(f"SQLite 복제본 동기화 실패, 엑셀에서 직접 조회합니다: {sync_errors}")
+                    found_data, found_db = None, ""
+                else:
+                    db_paths = {}  # 복제본은 동기화 직후의 전체 DB이므로, 찾지 못했으면 엑셀을 다시 뒤지지 않음
+            except ocr_logic.LookupCancelled:
+                db_paths = {}
+            except Exception as e:
+                trace_log.warning(f"SQLite 복제본 조회 실패, 엑셀에서 직접 조회합니다: {e}")
+        if db_paths:
+            pool = ThreadPoolExecutor(max_workers=len(db_paths))
+            futures = {pool.submit(ocr_logic.find_company_data, path, self.biz_no,
+                                   streaming=self.streaming, cancel_event=self.cancel_event): db_type
+                       for db_type, path in db_paths.items()}
+            results = {}
+            try:
+                for future in as_completed(futures):
+                    try:
+                        results[futures[future]] = future.result()
+                    except Exception as e:
+                        results[futures[future]] = (None, f"조회 중 오류 발생: {e}")
+                    # 순서가 앞선 DB부터 끝난 결과를 확인: 찾은 DB가 나오면 확정, 아직 안 끝난 DB가 나오면 더 기다림
+                    for db_type in db_paths:
+                        if db_type not in results: break
+                        if results[db_type][0]:
+                            found_data, found_db = results[db_type][0], db_type
+                            break
+                    if found_data: break
+                if not found_data and not self.cancel_event.is_set():
+                    errors += [f"{db_type}: {results[db_type][1]}" for db_type in db_paths if results[db_type][1]]
+            finally:
+                # 결과가 정해지면 나머지 조회는 취소하고, 끝날 때까지 기다리지 않음
+                self.cancel_event.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+        found_db = found_db or ""
+        message = found_db if found_data else LOOKUP_CANCELLED if self.cancelled else "\n".join(errors)
+        elapsed = time.perf_counter() - started
+        trace_log.event('phase', phase='lookup', ms=round(elapsed * 1000, 2), dbs=db_count,
+                        found=found_db or None, cancelled=self.cancelled and not found_data)
+        self.finished.emit(found_data, message, elapsed)
+
+
+class CreditUpdateWorker(QThread):
+    """
+    신용평가 값을 모든 DB 파일에 병렬로 기록하고(DB 파일마다 작업자 하나),
+    자료 파일 보관(save_queue.move_to_archive)도 저장과 동시에 진행합니다.
+    log(진행 메시지), finished(업데이트된 DB 수, 파일 보관 오류 메시지)
+    """
+    log = Signal(str); finished = Signal(int, str)
+    def __init__(self, excel_paths, biz_no, credit_rating, archive=None):
+        super().__init__(); self.excel_paths, self.biz_no, self.credit_rating = excel_paths, biz_no, credit_rating
+        self.archive = archive  # (원본 파일 경로, 보관 폴더, 새 파일 이름) 또는 None
+    def run(self):
+        with trace_log.phase('credit_update') as trace:
+            total_updates, archive_error = self.update_all()
+            trace['updated'] = total_updates
+        self.finished.emit(total_updates, archive_error)
+    def update_all(self):
+        db_paths = {}
+        if self.credit_rating:
+            db_paths = {db_type: path for db_type, path in self.excel_paths.items() if path and os.path.exists(path)}
+        total_updates, archive_error = 0, ""
+        with ThreadPoolExecutor(max_workers=len(db_paths) + 1) as pool:
+            futures = {}
+            for db_type, excel_path in db_paths.items():
+                self.log.emit(f"'{db_type}' DB 업데이트 시도...")
+                futures[pool.submit(ocr_logic.update_credit_rating_only, excel_path, self.biz_no,
+                                    self.credit_rating)] = db_type
+            archive_future = None
+            if self.archive:
+                self.log.emit("파일 보관 작업 중...")
+                archive_future = pool.submit(save_queue.move_to_archive, *self.archive)
+
+            for future in as_completed(futures):
+                db_type = futures[future]
+                try:
+                    result_msg, error = future.result()
+                except Exception as e:
+                    result_msg, error = None, f"업데이트 중 오류 발생: {e}"
+                if error:
+                    self.log.emit(f"  -> '{db_type}' 오류: {error}")
+                else:
+                    self.log.emit(f"  -> '{db_type}' {result_msg}"); total_updates += 1 if "완료" in result_msg else 0
+
+            if archive_future:
+                try:
+                    archive_future.result()
+                    _, destination_folder, new_filename = self.archive
+                    self.log.emit(f"  -> '{new_filename}' 이름으로 변경하여\n  -> '{destination_folder}' 경로에 저장 완료!")
+                except Exception as e:
+                    archive_error = str(e)
+                    self.log.emit(f"  -> 파일 보관 오류: {e}")
+        return total_updates, archive_error
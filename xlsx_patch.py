@@ -0,0 +1,417 @@
+# [xlsx_patch.py] 바뀐 셀만 xlsx 파일에 직접 고쳐 쓰는 저장 모듈
+#
+# openpyxl의 workbook.save()는 셀 몇 개만 바꿔도 모든 시트/스타일/문자열을 다시 만들어 씁니다.
+# 이 모듈은 xlsx(zip) 안에서 바뀐 셀이 있는 시트 XML과, 필요한 경우 sharedStrings/styles만
+# 고쳐 쓰고 나머지 항목은 내용 그대로 복사합니다.
+# 처리할 수 없는 구조(수식 셀, 접두사가 붙은 네임스페이스 등)를 만나면 XlsxPatchError를 던지며,
+# 호출한 쪽은 기존 방식(workbook.save)으로 전체 저장하면 됩니다.
+
+import os
+import re
+import math
+import shutil
+import zipfile
+import tempfile
+import posixpath
+from bisect import bisect_right
+from copy import copy
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, unescape
+
+from openpyxl.styles.fills import Fill
+from openpyxl.styles.fonts import Font
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.xml.functions import tostring
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+SHARED_STRINGS_TYPE = REL_NS + '/sharedStrings'
+STYLES_TYPE = REL_NS + '/styles'
+
+# XML 1.0에서 쓸 수 없는 제어 문자
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_CELL_REF = re.compile(r'([A-Z]+)(\d+)$')
+
+
+class XlsxPatchError(Exception):
+    """셀 단위로 고쳐 쓸 수 없는 파일 구조입니다. 전체 저장으로 대체해야 합니다."""
+
+
+def cell_change(cell):
+    """openpyxl 셀의 현재 값과 서식(배경/글꼴/표시 형식)을 patch_cells에 넘길 형태로 만듭니다."""
+    return {
+        'value': cell.value,
+        'data_type': cell.data_type,
+        'fill': copy(cell.fill),
+        'font': copy(cell.font),
+        'number_format': cell.number_format,
+    }
+
+
+def patch_cells(excel_path, changes):
+    """
+    changes: {시트명: {(행, 열): cell_change(...)}}
+    바뀐 셀이 있는 시트 XML과 필요한 sharedStrings/styles만 다시 써서 파일을 교체합니다.
+    """
+    if not changes: return
+    with zipfile.ZipFile(excel_path) as zin:
+        names = set(zin.namelist())
+        sheet_parts, rel_targets = _workbook_parts(zin)
+        styles_part = rel_targets.get(STYLES_TYPE)
+        if not styles_part or styles_part not in names:
+            raise XlsxPatchError("styles.xml을 찾을 수 없습니다.")
+        styles = _StylePatcher(zin.read(styles_part).decode('utf-8'))
+
+        strings_part = rel_targets.get(SHARED_STRINGS_TYPE)
+        strings = None
+        if strings_part and strings_part in names:
+            strings = _SharedStrings(zin.read(strings_part).decode('utf-8'))
+
+        new_parts = {}
+        for sheet_name, sheet_changes in changes.items():
+            part = sheet_parts.get(sheet_name)
+            if not part or part not in names:
+                raise XlsxPatchError(f"'{sheet_name}' 시트를 찾을 수 없습니다.")
+            sheet = _SheetPatcher(zin.read(part).decode('utf-8'))
+            new_parts[part] = sheet.apply(sheet_changes, styles, strings).encode('utf-8')
+
+        styles_xml = styles.serialize()
+        if styles_xml is not None: new_parts[styles_part] = styles_xml.encode('utf-8')
+        if strings is not None:
+            strings_xml = strings.serialize()
+            if strings_xml is not None: new_parts[strings_part] = strings_xml.encode('utf-8')
+
+        # 같은 폴더의 임시 파일에 쓴 뒤 교체하므로, 중간에 실패해도 원본은 그대로 남습니다.
+        fd, temp_path = tempfile.mkstemp(suffix='.xlsx', dir=os.path.dirname(os.path.abspath(excel_path)))
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(temp_path, 'w') as zout:
+                for info in zin.infolist():
+                    data = new_parts.get(info.filename)
+                    zout.writestr(info, data if data is not None else zin.read(info.filename))
+        except Exception:
+            _discard(temp_path)
+            raise
+    try:
+        # mkstemp는 소유자 전용 권한(0600)으로 만들므로, 교체 전에 원본 파일의 권한을 그대로 옮김
+        shutil.copymode(excel_path, temp_path)
+        # Excel이 파일을 열고 있으면(Windows) 여기서 PermissionError가 나며, 공유 폴더에 임시 파일을 남기지 않음
+        os.replace(temp_path, excel_path)
+    except Exception:
+        _discard(temp_path)
+        raise
+
+
+def _discard(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+
+def _workbook_parts(zin):
+    """(시트명 -> 시트 XML 경로, 관계 종류 -> 대상 경로)를 반환합니다."""
+    try:
+        workbook = ET.fromstring(zin.read('xl/workbook.xml'))
+        rels = ET.fromstring(zin.read('xl/_rels/workbook.xml.rels'))
+    except (KeyError, ET.ParseError) as e:
+        raise XlsxPatchError(f"통합 문서 구조를 읽을 수 없습니다: {e}")
+
+    def resolve(target):
+        return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+
+    targets_by_id, targets_by_type = {}, {}
+    for rel in rels.iter(f'{{{PKG_REL_NS}}}Relationship'):
+        target = resolve(rel.get('Target', ''))
+        targets_by_id[rel.get('Id')] = target
+        targets_by_type.setdefault(rel.get('Type'), target)
+
+    sheet_parts = {}
+    for sheet in workbook.iter(f'{{{MAIN_NS}}}sheet'):
+        target = targets_by_id.get(sheet.get(f'{{{REL_NS}}}id'))
+        if target: sheet_parts[sheet.get('name')] = target
+    return sheet_parts, targets_by_type
+
+
+def _set_attr(start_tag, name, value):
+    """시작 태그 문자열에서 속성 값을 바꾸거나, 없으면 추가합니다."""
+    pattern = re.compile(rf'(\s{name}=")[^"]*(")')
+    if pattern.search(start_tag):
+        return pattern.sub(lambda m: f'{m.group(1)}{value}{m.group(2)}', start_tag, count=1)
+    end = len(start_tag) - (2 if start_tag.endswith('/>') else 1)
+    closing = ' />' if start_tag.endswith(' />') else start_tag[end:]
+    return f'{start_tag[:end].rstrip()} {name}="{value}"{closing}'
+
+
+def _get_attr(start_tag, name):
+    match = re.search(rf'\s{name}="([^"]*)"', start_tag)
+    return match.group(1) if match else None
+
+
+def _check_default_namespace(text, root_tag):
+    if not re.search(rf'<{root_tag}\b', text):
+        raise XlsxPatchError(f"<{root_tag}> 요소가 기본 네임스페이스가 아닙니다.")
+
+
+class _Section:
+    """styles.xml의 <fills>, <fonts> 같은 목록 요소에 새 항목을 덧붙이기 위한 도우미입니다."""
+
+    def __init__(self, tag):
+        self.tag, self.appended = tag, []
+
+    def insert_into(self, text, insert_before=None):
+        if not self.appended: return text
+        items = ''.join(self.appended)
+        match = re.search(rf'<{self.tag}\b[^>]*?(/?)>', text)
+        if match is None:
+            if insert_before is None:
+                raise XlsxPatchError(f"<{self.tag}> 요소를 찾을 수 없습니다.")
+            position = text.index(f'<{insert_before}')
+            return f'{text[:position]}<{self.tag} count="{len(self.appended)}">{items}</{self.tag}>{text[position:]}'
+
+        start_tag = match.group(0)
+        count = int(_get_attr(start_tag, 'count') or 0) + len(self.appended)
+        if match.group(1):  # <numFmts count="0"/> 처럼 비어 있는 요소
+            new_start = _set_attr(start_tag[:-2].rstrip() + '>', 'count', count)
+            return f'{text[:match.start()]}{new_start}{items}</{self.tag}>{text[match.end():]}'
+        close = text.index(f'</{self.tag}>', match.end())
+        new_start = _set_attr(start_tag, 'count', count)
+        return f'{text[:match.start()]}{new_start}{text[match.end():close]}{items}{text[close:]}'
+
+
+class _StylePatcher:
+    """styles.xml의 배경/글꼴/표시 형식/셀 서식(xf) 목록을 읽고, 필요한 항목만 덧붙입니다."""
+
+    def __init__(self, text):
+        _check_default_namespace(text, 'styleSheet')
+        self.text = text
+        ns = {'m': MAIN_NS}
+        root = ET.fromstring(text.encode('utf-8'))
+        self.fills = [Fill.from_tree(el) for el in root.findall('m:fills/m:fill', ns)]
+        self.fonts = [Font.from_tree(el) for el in root.findall('m:fonts/m:font', ns)]
+        self.num_fmts = {el.get('formatCode'): int(el.get('numFmtId')) for el in root.findall('m:numFmts/m:numFmt', ns)}
+
+        match = re.search(r'<cellXfs\b[^>]*>(.*?)</cellXfs>', text, re.DOTALL)
+        if match is None:
+            raise XlsxPatchError("<cellXfs> 요소를 찾을 수 없습니다.")
+        self.xfs = re.findall(r'<xf\b[^>]*/>|<xf\b[^>]*>.*?</xf>', match.group(1), re.DOTALL)
+        self.xf_lookup = {xf: i for i, xf in reversed(list(enumerate(self.xfs)))}
+
+        self.fill_section, self.font_section = _Section('fills'), _Section('fonts')
+        self.num_fmt_section, self.xf_section = _Section('numFmts'), _Section('cellXfs')
+
+    def fill_id(self, fill):
+        for i, existing in enumerate(self.fills):
+            if existing == fill: return i
+        self.fills.append(fill)
+        self.fill_section.appended.append(tostring(fill.to_tree()).decode('utf-8'))
+        return len(self.fills) - 1
+
+    def font_id(self, font):
+        for i, existing in enumerate(self.fonts):
+            if existing == font: return i
+        self.fonts.append(font)
+        self.font_section.appended.append(tostring(font.to_tree()).decode('utf-8'))
+        return len(self.fonts) - 1
+
+    def num_fmt_id(self, format_code):
+        if format_code in BUILTIN_FORMATS_REVERSE: return BUILTIN_FORMATS_REVERSE[format_code]
+        if format_code in self.num_fmts: return self.num_fmts[format_code]
+        new_id = max([163] + list(self.num_fmts.values())) + 1  # 사용자 정의 형식은 164번부터
+        self.num_fmts[format_code] = new_id
+        self.num_fmt_section.appended.append(
+            f'<numFmt numFmtId="{new_id}" formatCode="{escape(format_code, {chr(34): "&quot;"})}"/>')
+        return new_id
+
+    def xf_id(self, base_id, change):
+        """기존 셀 서식(base_id)에서 배경/글꼴/표시 형식만 바꾼 셀 서식 번호를 반환합니다."""
+        base = self.xfs[base_id] if 0 <= base_id < len(self.xfs) else self.xfs[0]
+        start_end = base.index('>') + 1
+        start_tag = base[:start_end]
+        new_tag = start_tag
+        for attr, apply_attr, value in (('fillId', 'applyFill', self.fill_id(change['fill'])),
+                                        ('fontId', 'applyFont', self.font_id(change['font'])),
+                                        ('numFmtId', 'applyNumberFormat', self.num_fmt_id(change['number_format']))):
+            if _get_attr(new_tag, attr) != str(value):
+                new_tag = _set_attr(_set_attr(new_tag, attr, value), apply_attr, 1)
+        if new_tag == start_tag: return base_id
+
+        new_xf = new_tag + base[start_end:]
+        if new_xf not in self.xf_lookup:
+            self.xfs.append(new_xf)
+            self.xf_lookup[new_xf] = len(self.xfs) - 1
+            self.xf_section.appended.append(new_xf)
+        return self.xf_lookup[new_xf]
+
+    def serialize(self):
+        sections = (self.num_fmt_section, self.font_section, self.fill_section, self.xf_section)
+        if not any(section.appended for section in sections): return None
+        text = self.num_fmt_section.insert_into(self.text, insert_before='fonts')
+        for section in sections[1:]:
+            text = section.insert_into(text)
+        return text
+
+
+class _SharedStrings:
+    """sharedStrings.xml에 없는 문자열만 덧붙이고, 있는 문자열은 기존 번호를 재사용합니다."""
+
+    def __init__(self, text):
+        _check_default_namespace(text, 'sst')
+        self.text = text
+        self.lookup = {}
+        self.appended = []
+        self.references = 0
+        entries = re.findall(r'<si\b[^>]*/>|<si\b[^>]*>(.*?)</si>', text, re.DOTALL)
+        for i, content in enumerate(entries):
+            plain = re.fullmatch(r'<t(?:\s+xml:space="preserve")?>([^<]*)</t>', content or '')
+            if plain:
+                self.lookup.setdefault(unescape(plain.group(1), {'&quot;': '"', '&apos;': "'"}), i)
+        self.count = len(entries)
+
+    def index_of(self, value):
+        self.references += 1
+        if value not in self.lookup:
+            self.lookup[value] = self.count + len(self.appended)
+            self.appended.append(f'<si><t xml:space="preserve">{escape(value)}</t></si>')
+        return self.lookup[value]
+
+    def serialize(self):
+        if not self.references: return None
+        match = re.search(r'<sst\b[^>]*?(/?)>', self.text)
+        start_tag = match.group(0)
+        new_start = start_tag
+        if _get_attr(start_tag, 'uniqueCount') is not None:
+            new_start = _set_attr(new_start, 'uniqueCount', self.count + len(self.appended))
+        if _get_attr(start_tag, 'count') is not None:
+            new_start = _set_attr(new_start, 'count', int(_get_attr(start_tag, 'count')) + self.references)
+        items = ''.join(self.appended)
+        if match.group(1):
+            new_start = new_start[:-2].rstrip() + '>'
+            return f'{self.text[:match.start()]}{new_start}{items}</sst>{self.text[match.end():]}'
+        close = self.text.rindex('</sst>')
+        return f'{self.text[:match.start()]}{new_start}{self.text[match.end():close]}{items}{self.text[close:]}'
+
+
+class _SheetPatcher:
+    """시트 XML의 <sheetData>에서 필요한 <row>/<c> 요소만 바꿔 씁니다."""
+
+    def __init__(self, text):
+        _check_default_namespace(text, 'worksheet')
+        self.text = re.sub(r'<sheetData\s*/>', '<sheetData></sheetData>', text, count=1)
+
+    def apply(self, sheet_changes, styles, strings):
+        text = self.text
+        data_start = re.search(r'<sheetData\b[^>]*>', text)
+        if data_start is None:
+            raise XlsxPatchError("<sheetData> 요소를 찾을 수 없습니다.")
+        data_end = text.index('</sheetData>', data_start.end())
+
+        # 모든 행의 위치를 한 번에 구함 (행 번호, 시작, 끝)
+        rows = list(self._iter_row_tags(text, data_start.end(), data_end))
+        row_numbers = [row[0] for row in rows]
+        if row_numbers != sorted(row_numbers):
+            raise XlsxPatchError("행 순서가 정렬되어 있지 않습니다.")
+        rows_by_number = {row[0]: row for row in rows}
+
+        changes_by_row = {}
+        for (row, col), change in sheet_changes.items():
+            changes_by_row.setdefault(row, {})[col] = change
+
+        edits = []
+        for row_number, row_changes in changes_by_row.items():
+            if row_number in rows_by_number:
+                _, start, end = rows_by_number[row_number]
+                edits.append((start, end, row_number, self._patch_row(text[start:end], row_number, row_changes,
+                                                                      styles, strings)))
+            else:
+                index = bisect_right(row_numbers, row_number)
+                position = rows[index][1] if index < len(rows) else data_end
+                cells = ''.join(self._cell_xml(row_number, col, 0, change, styles, strings)
+                                for col, change in sorted(row_changes.items()))
+                edits.append((position, position, row_number, f'<row r="{row_number}">{cells}</row>'))
+
+        # 뒤쪽부터 바꿔야 앞쪽 위치가 그대로 유지됨 (같은 위치에 끼워 넣는 행은 번호 역순으로)
+        for start, end, _, replacement in sorted(edits, key=lambda e: (e[0], e[2]), reverse=True):
+            text = text[:start] + replacement + text[end:]
+        return text
+
+    @staticmethod
+    def _iter_row_tags(text, start, end):
+        for match in re.finditer(r'<row\b[^>]*>', text[start:end]):
+            tag = match.group(0)
+            row_number = _get_attr(tag, 'r')
+            if row_number is None:
+                raise XlsxPatchError("행 번호(r)가 없는 행이 있습니다.")
+            row_start = start + match.start()
+            if tag.endswith('/>'):
+                row_end = start + match.end()
+            else:
+                row_end = text.index('</row>', start + match.end()) + len('</row>')
+            yield int(row_number), row_start, row_end
+
+    def _patch_row(self, row_xml, row_number, row_changes, styles, strings):
+        start_tag = re.match(r'<row\b[^>]*>', row_xml).group(0)
+        content = '' if start_tag.endswith('/>') else row_xml[len(start_tag):-len('</row>')]
+
+        cells = []  # (열 번호, 원래 XML)
+        for match in re.finditer(r'<c\b[^>]*?(/?)>', content):
+            cell_start = match.start()
+            cell_end = match.end() if match.group(1) else content.index('</c>', match.end()) + len('</c>')
+            ref = _get_attr(match.group(0), 'r')
+            parsed = _CELL_REF.match(ref or '')
+            if not parsed:
+                raise XlsxPatchError("셀 주소(r)가 없는 셀이 있습니다.")
+            cells.append((column_index_from_string(parsed.group(1)), cell_start, cell_end))
+
+        inserted = False
+        pieces, last = [], 0
+        pending = sorted(row_changes.items())
+        for col, start, end in cells:
+            while pending and pending[0][0] < col:
+                new_col, change = pending.pop(0)
+                pieces.append(content[last:start]); last = start
+                pieces.append(self._cell_xml(row_number, new_col, 0, change, styles, strings)); inserted = True
+            if pending and pending[0][0] == col:
+                _, change = pending.pop(0)
+                old_xml = content[start:end]
+                if '<f' in old_xml:
+                    raise XlsxPatchError(f"{get_column_letter(col)}{row_number} 셀에 수식이 있습니다.")
+                base_style = int(_get_attr(re.match(r'<c\b[^>]*>', old_xml).group(0), 's') or 0)
+                pieces.append(content[last:start])
+                pieces.append(self._cell_xml(row_number, col, base_style, change, styles, strings))
+                last = end
+        pieces.append(content[last:])
+        for new_col, change in pending:
+            pieces.append(self._cell_xml(row_number, new_col, 0, change, styles, strings)); inserted = True
+
+        new_start = start_tag[:-2].rstrip() + '>' if start_tag.endswith('/>') else start_tag
+        if inserted:
+            # spans는 선택 항목(읽기 최적화용)이므로, 셀을 추가한 행에서는 지워서 어긋나지 않게 함
+            new_start = re.sub(r'\sspans="[^"]*"', '', new_start)
+        return f"{new_start}{''.join(pieces)}</row>"
+
+    @staticmethod
+    def _cell_xml(row_number, col, base_style, change, styles, strings):
+        ref = f"{get_column_letter(col)}{row_number}"
+        style_id = styles.xf_id(base_style, change)
+        style_attr = f' s="{style_id}"' if style_id else ''
+        value = change['value']
+        if change.get('data_type') == 'f':
+            raise XlsxPatchError(f"{ref} 셀에 수식을 쓸 수 없습니다.")
+        if value is None:
+            return f'<c r="{ref}"{style_attr}/>'
+        if isinstance(value, bool):
+            return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            if isinstance(value, float) and not math.isfinite(value):
+                raise XlsxPatchError(f"{ref} 셀의 숫자 값이 올바르지 않습니다.")
+            return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+        if isinstance(value, str):
+            if _ILLEGAL_XML_CHARS.search(value):
+                raise XlsxPatchError(f"{ref} 셀에 XML로 쓸 수 없는 문자가 있습니다.")
+            if strings is None:
+                return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+            return f'<c r="{ref}"{style_attr} t="s"><v>{strings.index_of(value)}</v></c>'
+        raise XlsxPatchError(f"{ref} 셀의 값 형식({type(value).__name__})은 지원하지 않습니다.")